@@ -2,11 +2,14 @@ from flask import Flask
 from routes.user_routes import user_routes
 from routes.auth_routes import auth_routes
 from routes.journal_routes import bp as journal_routes
+from commands import register_commands
 from flask import request, jsonify
+from utils.json_provider import FastJSONProvider
 
 
 app = Flask(__name__)
-app.config['JSON_AS_ASCII'] = False  # Đảm bảo JSON trả về không bị mã hóa ASCII
+# JSON UTF-8 không mã hóa ASCII (Flask 3 bỏ JSON_AS_ASCII), orjson nếu có, xem utils/json_provider.py
+app.json = FastJSONProvider(app)
 
 
 
@@ -15,6 +18,9 @@ app.register_blueprint(journal_routes)
 app.register_blueprint(user_routes)
 app.register_blueprint(auth_routes)
 
+# CLI bảo trì (backfill, ...)
+register_commands(app)
+
 if __name__ == "__main__":
     app.run(debug=True)
 # Đảm bảo header có charset=utf-8
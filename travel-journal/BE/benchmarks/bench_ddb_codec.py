@@ -0,0 +1,111 @@
+# benchmarks/bench_ddb_codec.py
+"""
+CPU encode / decode item journal giữa dạng AttributeValue (wire) và dict Python.
+  resource : TypeDeserializer (Decimal) + _from_dynamo đệ quy / _to_dynamo + TypeSerializer (logic cũ)
+  codec    : utils.ddb_codec.decode_item / encode_item (client cấp thấp, số -> int/float trực tiếp)
+Đo trên item đầy đủ (GetItem / BatchGetItem / PutItem) và trang marker 200 item (Query GSI geo).
+Phần parse JSON của botocore giống nhau ở cả 2 đường nên không tính.
+
+Chạy: python benchmarks/bench_ddb_codec.py
+"""
+import os
+import random
+import sys
+import timeit
+from decimal import Decimal
+
+from boto3.dynamodb.types import TypeDeserializer, TypeSerializer
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from utils.ddb_codec import decode_item, encode_item  # noqa: E402
+from utils.geo import geohash_fields, marker_fields  # noqa: E402
+
+PAGE_SIZE = 200
+_ser, _deser = TypeSerializer(), TypeDeserializer()
+
+
+def make_item(i, rnd):
+    lat = round(rnd.uniform(20.90, 21.15), 6)
+    lng = round(rnd.uniform(105.65, 105.95), 6)
+    photos = [f"https://cdn.example.com/{i}/{k}.jpg" for k in range(rnd.randint(0, 6))]
+    item = {
+        "journalId": f"j-{i:06d}",
+        "userId": f"u-{i % 17}",
+        "title": f"Chuyến đi Hà Nội #{i}",
+        "content": "Đi dạo quanh hồ, ăn phở, uống cà phê trứng. " * rnd.randint(5, 40),
+        "location": {"lat": lat, "lng": lng, "name": "Hồ Hoàn Kiếm"},
+        "photos": photos,
+        "visibility": "public",
+        "started_at": "2024-05-01T08:00:00.000000Z",
+        "ended_at": "2024-05-03T18:00:00.000000Z",
+        "created_at": "2024-05-01T10:00:00.000000Z",
+        "updated_at": "2024-05-01T10:00:00.000000Z",
+    }
+    item.update(geohash_fields(item["location"]))
+    item.update({k: v for k, v in marker_fields(item["location"], photos).items() if v is not None})
+    return item
+
+
+def _to_dynamo(v):
+    if isinstance(v, float):
+        return Decimal(str(v))
+    if isinstance(v, dict):
+        return {k: _to_dynamo(x) for k, x in v.items()}
+    if isinstance(v, list):
+        return [_to_dynamo(x) for x in v]
+    return v
+
+
+def _from_dynamo(v):
+    if isinstance(v, Decimal):
+        return float(v) if v % 1 else int(v)
+    if isinstance(v, dict):
+        return {k: _from_dynamo(x) for k, x in v.items()}
+    if isinstance(v, list):
+        return [_from_dynamo(x) for x in v]
+    return v
+
+
+def resource_decode(wire):
+    return _from_dynamo({k: _deser.deserialize(v) for k, v in wire.items()})
+
+
+def resource_encode(item):
+    return {k: _ser.serialize(v) for k, v in _to_dynamo(item).items()}
+
+
+def main():
+    rnd = random.Random(1)
+    items = [make_item(i, rnd) for i in range(PAGE_SIZE)]
+    marker_keys = ("journalId", "title", "cover_photo", "lat", "lng", "location_name", "geohash", "created_at", "started_at")
+    markers = [{k: it[k] for k in marker_keys if k in it} for it in items]
+    wire_items = [resource_encode(it) for it in items]
+    wire_markers = [resource_encode(m) for m in markers]
+
+    # 2 đường cho cùng kết quả
+    assert [resource_decode(w) for w in wire_items] == [decode_item(w) for w in wire_items] == items
+    assert [encode_item(it) for it in items] == wire_items
+
+    cases = (
+        ("full item", "decode", lambda: resource_decode(wire_items[0]), lambda: decode_item(wire_items[0]), 1),
+        ("full item", "encode", lambda: resource_encode(items[0]), lambda: encode_item(items[0]), 1),
+        ("marker page", "decode",
+         lambda: [resource_decode(w) for w in wire_markers], lambda: [decode_item(w) for w in wire_markers], PAGE_SIZE),
+        ("batch 100", "decode",
+         lambda: [resource_decode(w) for w in wire_items[:100]], lambda: [decode_item(w) for w in wire_items[:100]], 100),
+        ("batch 25", "encode",
+         lambda: [resource_encode(it) for it in items[:25]], lambda: [encode_item(it) for it in items[:25]], 25),
+    )
+    for label, op, old, new, n in cases:
+        runs = max(20, 20000 // n)
+        t_old = min(timeit.repeat(old, number=runs, repeat=5)) / runs
+        t_new = min(timeit.repeat(new, number=runs, repeat=5)) / runs
+        print(
+            f"{label:12s} {op:6s} ({n:3d} item) resource={t_old * 1e6:9.1f} us  codec={t_new * 1e6:9.1f} us"
+            f"  ({t_old / t_new:.1f}x)"
+        )
+
+
+if __name__ == "__main__":
+    main()
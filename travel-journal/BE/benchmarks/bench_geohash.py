@@ -0,0 +1,57 @@
+# benchmarks/bench_geohash.py
+"""
+Encode / decode geohash theo lô: pygeohash (từng điểm) vs utils.geohash_batch (NumPy).
+  encode : lat/lng -> geohash precision 9 (như geohash_fields)
+  decode : geohash -> tâm ô + sai số (như decode_exactly)
+
+Chạy: python benchmarks/bench_geohash.py [n ...]   (mặc định 1k, 100k, 1M điểm)
+"""
+import os
+import sys
+import time
+
+import numpy as np
+import pygeohash
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from utils import geohash_batch  # noqa: E402
+
+PRECISION = 9
+SIZES = (1_000, 100_000, 1_000_000)
+
+
+def best_of(fn, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - t0)
+    return best
+
+
+def main(sizes):
+    rng = np.random.default_rng(1)
+    for n in sizes:
+        lat = rng.uniform(-90, 90, n)
+        lng = rng.uniform(-180, 180, n)
+        lat_l, lng_l = lat.tolist(), lng.tolist()
+        hashes = [pygeohash.encode(a, b, PRECISION) for a, b in zip(lat_l, lng_l)]
+        # kết quả phải trùng pygeohash
+        assert geohash_batch.encode_many(lat, lng, PRECISION).tolist() == hashes
+
+        repeat = 5 if n <= 100_000 else 2
+        rows = (
+            ("encode", "pygeohash", lambda: [pygeohash.encode(a, b, PRECISION) for a, b in zip(lat_l, lng_l)]),
+            ("encode", "batch", lambda: geohash_batch.encode_many(lat, lng, PRECISION)),
+            ("decode", "pygeohash", lambda: [pygeohash.decode_exactly(h) for h in hashes]),
+            ("decode", "batch", lambda: geohash_batch.decode_many(hashes)),
+        )
+        print(f"n={n:,}")
+        for op, name, fn in rows:
+            t = best_of(fn, repeat)
+            print(f"  {op:6s} {name:9s} {t * 1e3:10.2f} ms  {t / n * 1e9:8.1f} ns/point")
+
+
+if __name__ == "__main__":
+    main([int(a) for a in sys.argv[1:]] or SIZES)
@@ -0,0 +1,115 @@
+# benchmarks/bench_json_provider.py
+"""
+CPU dựng response JSON (encode + Response + header charset) cho các response điển hình.
+  default : DefaultJSONProvider của Flask (jsonify, ensure_ascii=False) + after_request force_utf8
+  std     : utils.json_provider.FastJSONProvider, encoder json chuẩn
+  orjson  : FastJSONProvider với orjson (bỏ qua nếu chưa cài)
+  stream  : FastJSONProvider.stream (orjson nếu có), gom hết chunk
+Dữ liệu: 1 journal, trang 100 marker (GET /journals?bbox=), 300 journal (GET /journals?ids=),
+1000 user (GET /users).
+
+Chạy: python benchmarks/bench_json_provider.py
+"""
+import json
+import os
+import random
+import sys
+import timeit
+
+from flask import Flask
+from flask.json.provider import DefaultJSONProvider
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from utils.json_provider import FastJSONProvider, orjson  # noqa: E402
+
+
+def make_journal(i, rnd):
+    lat, lng = round(rnd.uniform(20.9, 21.15), 6), round(rnd.uniform(105.65, 105.95), 6)
+    return {
+        "journalId": f"j-{i:06d}",
+        "userId": f"u-{i % 17}",
+        "title": f"Chuyến đi Hà Nội #{i}",
+        "content": "Đi dạo quanh hồ, ăn phở, uống cà phê trứng. " * rnd.randint(5, 40),
+        "location": {"lat": lat, "lng": lng, "name": "Hồ Hoàn Kiếm"},
+        "photos": [f"https://cdn.example.com/{i}/{k}.jpg" for k in range(rnd.randint(0, 6))],
+        "started_at": None,
+        "ended_at": None,
+        "visibility": "public",
+        "created_at": "2024-05-01T10:00:00.000000Z",
+        "updated_at": "2024-05-01T10:00:00.000000Z",
+        "geohash": "w7er8u0e0",
+        "geohash_prefix": "w7er8",
+    }
+
+
+def make_marker(j):
+    return {
+        "journalId": j["journalId"],
+        "title": j["title"],
+        "location": j["location"],
+        "imageUrl": (j["photos"] or [None])[0],
+    }
+
+
+def make_user(i):
+    return {
+        "userId": f"u-{i}",
+        "username": f"Nguyễn Văn {i}",
+        "email": f"user{i}@example.com",
+        "password_hash": "x" * 60,
+        "created_at": "2024-05-01T10:00:00.000000",
+        "updated_at": "2024-05-01T10:00:00.000000",
+        "profile_picture": None,
+    }
+
+
+def force_utf8(resp):
+    # như app.force_utf8
+    ct = resp.headers.get("Content-Type")
+    if ct and "charset=" not in ct:
+        resp.headers["Content-Type"] = f"{ct}; charset=utf-8"
+    return resp
+
+
+def main():
+    rnd = random.Random(1)
+    journals = [make_journal(i, rnd) for i in range(300)]
+    markers = [make_marker(j) for j in journals[:100]]
+    users = [make_user(i) for i in range(1000)]
+    cases = (
+        ("1 journal", journals[0], None),
+        ("100 markers", {"items": markers, "count": len(markers), "lastKey": "eyJwIjogMH0="}, None),
+        ("300 journals", {"items": journals, "count": 300, "notFound": [], "forbidden": []},
+         ("items", {"count": 300, "notFound": [], "forbidden": []})),
+        ("1000 users", users, (None, None)),
+    )
+
+    app = Flask(__name__)
+    default = DefaultJSONProvider(app)
+    default.ensure_ascii = False
+    providers = [("default", default), ("std", FastJSONProvider(app, encoder="std"))]
+    if orjson is not None:
+        providers.append(("orjson", FastJSONProvider(app, encoder="orjson")))
+    fast = providers[-1][1]
+
+    with app.test_request_context():
+        for label, obj, stream_args in cases:
+            bodies = {}
+            rows = [(name, lambda p=p: force_utf8(p.response(obj)).get_data()) for name, p in providers]
+            if stream_args is not None:
+                key, extra = stream_args
+                items = obj["items"] if key else obj
+                rows.append(("stream", lambda: b"".join(fast.stream(items, key=key, extra=extra).response)))
+            for name, fn in rows:
+                bodies[name] = fn()
+                runs = max(5, 2000 // (len(bodies[name]) // 1000 + 1))
+                best = min(timeit.repeat(fn, number=runs, repeat=5)) / runs
+                print(f"{label:13s} {name:8s} {best * 1e6:9.1f} us  ({len(bodies[name]) / 1024:7.1f} KiB)")
+            # cùng nội dung JSON ở mọi đường
+            decoded = [json.loads(b) for b in bodies.values()]
+            assert all(d == decoded[0] for d in decoded), label
+
+
+if __name__ == "__main__":
+    main()
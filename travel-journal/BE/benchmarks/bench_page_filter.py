@@ -0,0 +1,119 @@
+# benchmarks/bench_page_filter.py
+"""
+CPU / trang (200 item) của bước lọc list_by_bbox.
+  baseline : lọc từng item (float() + in_bbox + q) rồi _from_dynamo đệ quy (logic cũ)
+  batch    : utils.page_filter.filter_page trên projection marker phẳng (cột NumPy + record JSON-ready)
+Kèm kích thước trang: item đầy đủ (projection ALL cũ) vs projection marker (INCLUDE).
+
+Chạy: python benchmarks/bench_page_filter.py
+"""
+import json
+import os
+import random
+import sys
+import timeit
+from decimal import Decimal
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from utils.geo import in_bbox, marker_fields  # noqa: E402
+from utils.page_filter import filter_page  # noqa: E402
+from utils.text import doc_words, tokenize  # noqa: E402
+
+PAGE_SIZE = 200
+BBOX = (105.70, 20.95, 105.90, 21.10)
+
+
+def make_page(n=PAGE_SIZE, seed=1):
+    rnd = random.Random(seed)
+    page = []
+    for i in range(n):
+        # ~1/2 item nằm ngoài bbox (prefix phủ rộng hơn viewport)
+        lat = round(rnd.uniform(20.90, 21.15), 6)
+        lng = round(rnd.uniform(105.65, 105.95), 6)
+        page.append({
+            "journalId": f"j-{seed}-{i}",
+            "title": f"Chuyến đi Hà Nội #{i}",
+            "userId": f"u-{i % 17}",
+            "content": "Đi dạo quanh hồ, ăn phở, uống cà phê trứng. " * 20,
+            "location": {"lat": Decimal(str(lat)), "lng": Decimal(str(lng)), "name": "Hồ Hoàn Kiếm"},
+            "photos": [f"https://cdn.example.com/{i}/{k}.jpg" for k in range(3)],
+            "visibility": "public",
+            "geohash": "w7er8u0e0",
+            "created_at": "2024-05-01T10:00:00.000000Z",
+            "updated_at": "2024-05-01T10:00:00.000000Z",
+            "geohash_prefix": "w7er8",
+        })
+    return page
+
+
+def marker_page(page):
+    """Trang như Query trên GSI geo INCLUDE: key + thuộc tính marker phẳng."""
+    out = []
+    for it in page:
+        m = {k: it[k] for k in ("journalId", "title", "geohash", "created_at", "geohash_prefix")}
+        m.update({
+            k: Decimal(str(v)) if isinstance(v, float) else v
+            for k, v in marker_fields(it["location"], it["photos"]).items()
+        })
+        out.append(m)
+    return out
+
+
+def _from_dynamo(v):
+    if isinstance(v, Decimal):
+        return float(v) if v % 1 else int(v)
+    if isinstance(v, dict):
+        return {k: _from_dynamo(x) for k, x in v.items()}
+    if isinstance(v, list):
+        return [_from_dynamo(x) for x in v]
+    return v
+
+
+def baseline(batch, bbox, qnorm=""):
+    items = []
+    seen = set(x["journalId"] for x in items)
+    for it in batch:
+        jid = it.get("journalId")
+        if not jid or jid in seen:
+            continue
+        loc = it.get("location") or {}
+        try:
+            lat = float(loc.get("lat")); lng = float(loc.get("lng"))
+        except (TypeError, ValueError):
+            continue
+        if not in_bbox(lat, lng, bbox):
+            continue
+        if qnorm:
+            hay = " ".join([(it.get("title") or ""), (loc.get("name") or "")]).lower()
+            if qnorm not in hay:
+                continue
+        items.append(it)
+        seen.add(jid)
+    return [_from_dynamo(x) for x in items]
+
+
+def main():
+    page = make_page()
+    slim = marker_page(page)
+    assert [r["journalId"] for r in baseline(page, BBOX)] == [r["journalId"] for r in filter_page(slim, BBOX)[1]]
+
+    size = lambda p: len(json.dumps(_from_dynamo(p), ensure_ascii=False).encode("utf-8"))  # noqa: E731
+    print(f"page={PAGE_SIZE} items, kept={len(baseline(page, BBOX))}")
+    print(f"page bytes: full={size(page)} marker={size(slim)} ({size(page) / size(slim):.1f}x)")
+    for label, q in (("no q", ""), ("q='hoàn kiếm'", "hoàn kiếm")):
+        qtok = frozenset(tokenize(q))
+        rows = (
+            ("baseline", lambda: baseline(page, BBOX, q)),
+            # cache token (utils.text.doc_words) nguội: mỗi lần chạy như 1 trang mới
+            ("batch", lambda: (doc_words.cache_clear(), filter_page(slim, BBOX, qtok))),
+            ("batch/warm", lambda: filter_page(slim, BBOX, qtok)),
+        )
+        for name, fn in rows:
+            runs = 2000
+            best = min(timeit.repeat(fn, number=runs, repeat=5)) / runs
+            print(f"{label:16s} {name:10s} {best * 1e6:8.1f} us/page")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,55 @@
+# commands.py
+"""
+Flask CLI commands (bảo trì dữ liệu: backfill, rebuild bảng phụ).
+Local:   flask --app app backfill-geohash
+Lambda:  serverless wsgi flask --command "backfill-geohash"
+"""
+import click
+
+
+@click.command("backfill-geohash")
+@click.option("--dry-run", is_flag=True, help="Chỉ đếm item cần cập nhật, không ghi.")
+def backfill_geohash(dry_run):
+    """Bổ sung thang geohash_prefix_N + thuộc tính marker (lat/lng/location_name/cover_photo), chuẩn hoá started_at/ended_at cho các journal cũ."""
+    from services.journal_service import JournalService
+
+    scanned, updated = JournalService().backfill_geohash_fields(dry_run=dry_run)
+    verb = "would update" if dry_run else "updated"
+    click.echo(f"scanned={scanned} {verb}={updated}")
+
+
+@click.command("rebuild-cell-counts")
+def rebuild_cell_counts():
+    """Đếm lại bảng JournalCellCounts từ bảng Journal (sửa lệch số)."""
+    from services.journal_service import JournalService
+
+    journals, written, deleted = JournalService().rebuild_cell_counts()
+    click.echo(f"journals={journals} cells={written} stale_removed={deleted}")
+
+
+@click.command("rebuild-token-index")
+def rebuild_token_index():
+    """Dựng lại bảng JournalTokens (index tìm kiếm q) từ bảng Journal."""
+    from services.journal_service import JournalService
+
+    journals, written, deleted = JournalService().rebuild_token_index()
+    click.echo(f"journals={journals} rows={written} stale_removed={deleted}")
+
+
+@click.command("build-search-snapshot")
+@click.option("--out", default=None, help="File snapshot (mặc định SEARCH_SNAPSHOT_PATH).")
+@click.option("--upload", is_flag=True, help="Đẩy snapshot lên SEARCH_SNAPSHOT_S3.")
+def build_search_snapshot(out, upload):
+    """Dựng snapshot BM25 (full-text) từ bảng Journal."""
+    from services.fulltext_service import SNAPSHOT_PATH
+    from services.journal_service import JournalService
+
+    meta = JournalService().build_search_snapshot(out or SNAPSHOT_PATH, upload=upload)
+    click.echo(f"docs={meta['n_docs']} terms={meta['n_terms']} built_at={meta['built_at']}")
+
+
+def register_commands(app):
+    app.cli.add_command(backfill_geohash)
+    app.cli.add_command(rebuild_cell_counts)
+    app.cli.add_command(rebuild_token_index)
+    app.cli.add_command(build_search_snapshot)
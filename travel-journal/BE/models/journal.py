@@ -1,31 +1,89 @@
 # models/journal.py
-from dataclasses import dataclass, field
-from typing import List, Optional, Dict, Any
-from datetime import datetime
+from typing import Optional, Tuple
+from datetime import datetime, timedelta, timezone
 import uuid
 
+from models.schema import Field, Model, slot_names
+
 ISO = "%Y-%m-%dT%H:%M:%S.%fZ"
 
 def now_iso() -> str:
     return datetime.utcnow().strftime(ISO)
 
-@dataclass
-class Journal:
-    journalId: str
-    userId: str
-    title: str
-    content: str
-    location: Optional[Dict[str, Any]] = None
-    photos: List[str] = field(default_factory=list)
-    started_at: Optional[str] = None
-    ended_at: Optional[str] = None
-    visibility: str = "private"
-    created_at: str = field(default_factory=now_iso)
-    updated_at: str = field(default_factory=now_iso)
+# Mốc thời gian viết tắt: "2023", "2023-05", "2023-05-01"
+_PARTIAL_DATE = {4: "%Y", 7: "%Y-%m", 10: "%Y-%m-%d"}
+
+
+def time_bound(s: str, end: bool = False) -> str:
+    """
+    Chuỗi thời gian -> dạng ISO của created_at (so sánh được theo thứ tự chuỗi).
+    Ngày viết tắt được mở rộng: end=False => đầu kỳ, end=True => cuối kỳ (tính cả kỳ đó).
+    Ném ValueError nếu sai format.
+    """
+    s = s.strip()
+    fmt = _PARTIAL_DATE.get(len(s))
+    if fmt:
+        d = datetime.strptime(s, fmt)
+        if end:
+            if fmt == "%Y":
+                d = d.replace(year=d.year + 1)
+            elif fmt == "%Y-%m":
+                d = (d.replace(day=28) + timedelta(days=4)).replace(day=1)
+            else:
+                d += timedelta(days=1)
+            d -= timedelta(microseconds=1)
+        return d.strftime(ISO)
+    d = datetime.fromisoformat(s.replace("Z", "+00:00"))
+    if d.tzinfo is not None:
+        d = d.astimezone(timezone.utc).replace(tzinfo=None)
+    return d.strftime(ISO)
+
+
+def normalize_time(value, name: str, end: bool = False) -> Optional[str]:
+    """
+    started_at / ended_at lúc ghi -> cùng dạng ISO với mốc lọc (so sánh chuỗi đúng);
+    None / "" => None. Ném ValueError nếu sai kiểu / format.
+    """
+    if value is None or value == "":
+        return None
+    if not isinstance(value, str):
+        raise ValueError(f"{name} must be a string")
+    try:
+        return time_bound(value, end=end)
+    except ValueError:
+        raise ValueError(f"{name} invalid: {value}")
 
-    # ✅ thêm 2 field này để khớp item đã put vào DDB
-    geohash: Optional[str] = None
-    geohash_prefix: Optional[str] = None
+
+def parse_time_range(start: Optional[str], end: Optional[str]) -> Optional[Tuple[Optional[str], Optional[str]]]:
+    """(from, to) -> (lo, hi) đã chuẩn hoá, mỗi đầu có thể None; None nếu không lọc."""
+    if not start and not end:
+        return None
+    lo = time_bound(start) if start else None
+    hi = time_bound(end, end=True) if end else None
+    if lo and hi and lo > hi:
+        raise ValueError("from must be <= to")
+    return lo, hi
+
+class Journal(Model):
+    SCHEMA = (
+        Field("journalId"),
+        Field("userId"),
+        Field("title"),
+        Field("content"),
+        Field("location", None),
+        Field("photos", factory=list),
+        Field("started_at", None),
+        Field("ended_at", None),
+        Field("visibility", "private"),
+        Field("created_at", factory=now_iso),
+        Field("updated_at", factory=now_iso),
+        # ✅ thêm 2 field này để khớp item đã put vào DDB
+        Field("geohash", None),
+        Field("geohash_prefix", None),
+        # ảnh đại diện (= photos[0], utils.geo.marker_fields), chọn được qua ?fields= của timeline
+        Field("cover_photo", None),
+    )
+    __slots__ = slot_names(SCHEMA)
 
     @staticmethod
     def new(user_id: str, title: str, content: str, **kwargs) -> "Journal":
@@ -41,24 +99,4 @@ class Journal:
             visibility=kwargs.get("visibility", "private"),
         )
 
-    @staticmethod
-    def from_dict(d: Dict[str, Any]) -> "Journal":
-        return Journal(**d)
-
-    def to_dict(self) -> Dict[str, Any]:
-        return {
-            "journalId": self.journalId,
-            "userId": self.userId,
-            "title": self.title,
-            "content": self.content,
-            "location": self.location,
-            "photos": self.photos,
-            "started_at": self.started_at,
-            "ended_at": self.ended_at,
-            "visibility": self.visibility,
-            "created_at": self.created_at,
-            "updated_at": self.updated_at,
-            # ✅ xuất 2 field geo nếu có
-            "geohash": self.geohash,
-            "geohash_prefix": self.geohash_prefix,
-        }
+    # from_dict / to_dict / to_json: models.schema.Model (item DDB còn geohash_prefix_1..7, ... => bỏ qua)
@@ -0,0 +1,105 @@
+# models/schema.py
+"""
+Model gọn mô tả bằng schema (thay dataclass cho Journal / User).
+- SCHEMA = (Field, ...); lớp con khai báo __slots__ = slot_names(SCHEMA) => instance không có __dict__.
+- from_dict chỉ duyệt field của schema (attribute lạ của item DDB bỏ qua, không dựng dict trung gian).
+  fields=[...] => nạp 1 phần (projection): slot không nạp để trống, đọc => AttributeError,
+  to_dict / to_json bỏ qua.
+- to_json: bytes JSON (UTF-8, không escape ký tự ngoài ASCII) bằng encoder C dùng chung.
+"""
+import json
+from typing import Any, Callable, Dict, Iterable, NamedTuple, Optional, Tuple
+
+_UNSET = object()
+REQUIRED = object()
+
+_encode = json.JSONEncoder(ensure_ascii=False, separators=(",", ":")).encode
+
+
+class Field(NamedTuple):
+    name: str
+    default: Any = REQUIRED
+    factory: Optional[Callable[[], Any]] = None
+
+
+def slot_names(schema: Tuple[Field, ...]) -> Tuple[str, ...]:
+    return tuple(f.name for f in schema)
+
+
+class Model:
+    __slots__ = ()
+    SCHEMA: Tuple[Field, ...] = ()
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        cls._NAMES = slot_names(cls.SCHEMA)
+        cls._FIELDS = frozenset(cls._NAMES)
+
+    def __init__(self, **kwargs):
+        for f in self.SCHEMA:
+            v = kwargs.pop(f.name, _UNSET)
+            if v is _UNSET:
+                if f.factory is not None:
+                    v = f.factory()
+                elif f.default is REQUIRED:
+                    raise TypeError(f"{type(self).__name__}() missing required argument: '{f.name}'")
+                else:
+                    v = f.default
+            setattr(self, f.name, v)
+        if kwargs:
+            raise TypeError(f"{type(self).__name__}() got unexpected arguments: {', '.join(kwargs)}")
+        self.__post_init__()
+
+    def __post_init__(self) -> None:
+        pass
+
+    @classmethod
+    def from_dict(cls, d: Dict[str, Any], fields: Optional[Iterable[str]] = None):
+        """
+        Dict / item DDB -> instance. fields=None => đủ field (thiếu => default, field bắt buộc => None);
+        fields=[...] => chỉ nạp các field đó (có trong d), không chạy default / __post_init__.
+        """
+        obj = cls.__new__(cls)
+        if fields is not None:
+            known = cls._FIELDS
+            for name in fields:
+                if name in known and name in d:
+                    setattr(obj, name, d[name])
+            return obj
+        for f in cls.SCHEMA:
+            v = d.get(f.name, _UNSET)
+            if v is _UNSET:
+                v = f.factory() if f.factory is not None else (None if f.default is REQUIRED else f.default)
+            setattr(obj, f.name, v)
+        obj.__post_init__()
+        return obj
+
+    def to_dict(self, exclude: Iterable[str] = ()) -> Dict[str, Any]:
+        out = {}
+        for name in self._NAMES:
+            v = getattr(self, name, _UNSET)
+            if v is not _UNSET and name not in exclude:
+                out[name] = v
+        return out
+
+    def to_json(self, exclude: Iterable[str] = ()) -> bytes:
+        """JSON của các field đã nạp, theo thứ tự schema."""
+        return _encode(self.to_dict(exclude)).encode("utf-8")
+
+    @staticmethod
+    def to_json_many(objs: Iterable["Model"]) -> bytes:
+        """Mảng JSON của nhiều instance (qua to_json của từng lớp => User không lộ password_hash)."""
+        return b"[" + b",".join(o.to_json() for o in objs) + b"]"
+
+    def __eq__(self, other):
+        if type(other) is not type(self):
+            return NotImplemented
+        return all(
+            getattr(self, n, _UNSET) == getattr(other, n, _UNSET) for n in self._NAMES
+        )
+
+    def __repr__(self):
+        args = ", ".join(
+            f"{n}={getattr(self, n)!r}" for n in self._NAMES if getattr(self, n, _UNSET) is not _UNSET
+        )
+        return f"{type(self).__name__}({args})"
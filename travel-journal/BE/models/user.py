@@ -1,45 +1,35 @@
-from dataclasses import dataclass
-from typing import Optional
+from typing import Any, Dict, Iterable
 from datetime import datetime
 
-@dataclass
-class User:
-    userId: str
-    username: str
-    email: str
-    password_hash: str
-    created_at: str = None
-    updated_at: str = None
-    profile_picture: Optional[str] = None
-    
+from models.schema import Field, Model, slot_names
+
+
+class User(Model):
+    SCHEMA = (
+        Field("userId"),
+        Field("username"),
+        Field("email"),
+        Field("password_hash"),
+        Field("created_at", None),
+        Field("updated_at", None),
+        Field("profile_picture", None),
+    )
+    __slots__ = slot_names(SCHEMA)
+
     def __post_init__(self):
         if not self.created_at:
             self.created_at = datetime.utcnow().isoformat()
         if not self.updated_at:
             self.updated_at = self.created_at
 
-    @classmethod
-    def from_dict(cls, data: dict):
-        return cls(
-            userId=data.get("userId"),
-            username=data.get("username"),
-            email=data.get("email"),
-            password_hash=data.get("password_hash"),
-            created_at=data.get("created_at"),
-            updated_at=data.get("updated_at"),
-            profile_picture=data.get("profile_picture")
-        )
+    # exclude đứng đầu như Model.to_dict / to_json (Model.to_json gọi self.to_dict(exclude))
+    def to_dict(self, exclude: Iterable[str] = (), exclude_password: bool = False) -> Dict[str, Any]:
+        if exclude_password:
+            exclude = (*exclude, "password_hash")
+        return super().to_dict(exclude=exclude)
 
-    def to_dict(self, exclude_password: bool = False):
-        data = {
-            "userId": self.userId,
-            "username": self.username,
-            "email": self.email,
-            "password_hash": self.password_hash,
-            "created_at": self.created_at,
-            "updated_at": self.updated_at,
-            "profile_picture": self.profile_picture
-        }
+    def to_json(self, exclude: Iterable[str] = (), exclude_password: bool = True) -> bytes:
+        # JSON chỉ dùng cho response => mặc định không lộ password_hash
         if exclude_password:
-            data.pop("password_hash")
-        return data
\ No newline at end of file
+            exclude = (*exclude, "password_hash")
+        return super().to_json(exclude=exclude)
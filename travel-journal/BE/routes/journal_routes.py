@@ -1,8 +1,12 @@
 # routes/journal_routes.py
-from flask import Blueprint, request, jsonify, g
-from services.journal_service import JournalService
+from flask import Blueprint, Response, current_app, request, jsonify, g, make_response, stream_with_context
+from botocore.exceptions import ClientError
+from services.journal_service import JournalService, _encode_key, _decode_key
 import json
-from utils.geo import parse_bbox
+from utils.geo import parse_bbox, parse_center
+from models.journal import parse_time_range
+from models.schema import Model
+from services.photo_service import PHOTO_MAX_BYTES, PHOTO_URL_TTL
 import logging
 logger = logging.getLogger(__name__)
 
@@ -18,6 +22,14 @@ def login_required(f):
 bp = Blueprint("journal_routes", __name__, url_prefix="/journals")
 svc = JournalService()
 
+# Bán kính tối đa cho ?center=&radius_m= (m)
+MAX_RADIUS_M = 500_000
+# limit tối đa cho ?format=ndjson (stream từng dòng => bộ nhớ không tăng theo limit)
+NDJSON_MAX_LIMIT = 1000
+# Cache-Control cho tile (giây)
+TILE_MAX_AGE = 30
+TILE_STALE_WHILE_REVALIDATE = 60
+
 # Helper: đọc JSON chịu nhiều encoding (UTF-8/UTF-8-SIG/cp1258/…)
 def parse_json_tolerant():
     raw = request.get_data(cache=False)  # bytes as-is
@@ -32,6 +44,12 @@ def parse_json_tolerant():
             continue
     raise ValueError("Invalid JSON encoding. Gửi với Content-Type: application/json; charset=utf-8.")
 
+# số liệu cache (không có route công khai): ghi log định kỳ, xem JournalService.log_cache_stats
+@bp.after_request
+def _log_cache_stats(resp):
+    svc.log_cache_stats()
+    return resp
+
 # ---------- CREATE ----------
 @bp.route("/users/<user_id>", methods=["POST"])
 @login_required
@@ -63,6 +81,83 @@ def create_my_journal():
         logger.exception("Unhandled create error")
         return jsonify({"error": "Internal Server Error"}), 500
 
+# ---------- CREATE hàng loạt (import chuyến đi) ----------
+@bp.route("/batch", methods=["POST"])
+@login_required
+def create_journals_batch():
+    # body: [journal, ...] hoặc {"items": [journal, ...]}; kết quả theo từng phần tử (index = vị trí trong body)
+    try:
+        body = parse_json_tolerant()
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    payloads = body.get("items") if isinstance(body, dict) else body
+    if not isinstance(payloads, list) or not payloads:
+        return jsonify({"error": "items must be a non-empty list"}), 400
+    payloads = [fix_payload_texts(p) if isinstance(p, dict) else p for p in payloads]
+
+    try:
+        results = svc.create_many(g.current_user["userId"], payloads)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    except Exception:
+        logger.exception("Unhandled batch create error")
+        return jsonify({"error": "Internal Server Error"}), 500
+
+    out = [
+        {"index": i, "journal": j.to_dict()} if j is not None else {"index": i, "error": err}
+        for i, (j, err) in enumerate(results)
+    ]
+    failed = sum(1 for j, _ in results if j is None)
+    # 201: tạo hết; 207: có phần tử lỗi (xem "error" từng phần tử)
+    return jsonify({"results": out, "created": len(results) - failed, "failed": failed}), 207 if failed else 201
+
+# ---------- TIMELINE theo user (mới nhất trước) ----------
+def _timeline(owner_id):
+    # ?limit=20&lastKey=base64&visibility=public|private&fields=title,cover_photo,...
+    try:
+        limit = max(1, min(100, int(request.args.get("limit", "20"))))
+    except ValueError:
+        limit = 20
+    last_key = None
+    if request.args.get("lastKey"):
+        try:
+            last_key = _decode_key(request.args["lastKey"])
+        except Exception:
+            return jsonify({"error": "lastKey invalid"}), 400
+    fields_param = request.args.get("fields")
+    fields = [f.strip() for f in fields_param.split(",") if f.strip()] if fields_param else None
+
+    try:
+        items, next_key = svc.list_by_user(
+            owner_id,
+            g.current_user.get("userId"),
+            limit=limit,
+            last_key=last_key,
+            visibility=request.args.get("visibility"),
+            fields=fields,
+        )
+    except PermissionError:
+        return jsonify({"error": "Forbidden"}), 403
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    extra = {"count": len(items)}
+    if next_key:
+        extra["lastKey"] = _encode_key(next_key)
+    # Journal (đầy đủ / nạp 1 phần theo fields) -> JSON bằng Model.to_json_many, không qua dict trung gian
+    return current_app.json.stream(items, key="items", extra=extra, encode=Model.to_json_many)
+
+# <owner_id> (không phải <user_id>): login_required lấy viewer từ kwarg user_id
+@bp.route("/users/<owner_id>", methods=["GET"])
+@login_required
+def list_user_journals(owner_id):
+    return _timeline(owner_id)
+
+@bp.route("/me", methods=["GET"])
+@login_required
+def list_my_journals():
+    return _timeline(g.current_user["userId"])
+
 # ---------- GET ----------
 @bp.route("/<journal_id>", methods=["GET"])
 @login_required
@@ -104,6 +199,51 @@ def delete_journal(journal_id):
     except Exception:
         return jsonify({"error": "Internal Server Error"}), 500
     
+# ---------- ẢNH: presigned upload thẳng lên S3 + confirm ----------
+def _photo_body():
+    body = parse_json_tolerant()
+    if not isinstance(body, dict):
+        raise ValueError("body must be a JSON object")
+    return body
+
+@bp.route("/<journal_id>/photos/upload-url", methods=["POST"])
+@login_required
+def photo_upload_url(journal_id):
+    # body: {"files": [{"contentType": "image/jpeg", "size": 123456}, ...], "method": "post" | "put"}
+    try:
+        body = _photo_body()
+        uploads = svc.photo_upload_urls(
+            journal_id, g.current_user["userId"], body.get("files"), body.get("method") or "post"
+        )
+    except PermissionError:
+        return jsonify({"error": "Forbidden"}), 403
+    except ValueError as e:
+        msg = str(e)
+        return jsonify({"error": msg}), 404 if msg == "Not found" else 400
+    except ClientError as e:
+        # DynamoDB / S3 lỗi => JSON như các route khác, không phải trang HTML 500
+        logger.exception("Photo storage error on %s", request.path)
+        return jsonify({"error": f"storage error: {e.response.get('Error', {}).get('Code', 'unknown')}"}), 502
+    return jsonify({"uploads": uploads, "expiresIn": PHOTO_URL_TTL, "maxBytes": PHOTO_MAX_BYTES}), 200
+
+@bp.route("/<journal_id>/photos/confirm", methods=["POST"])
+@login_required
+def photo_confirm(journal_id):
+    # body: {"keys": [key nhận từ upload-url, ...]} => journal với photos đã nối thêm
+    try:
+        body = _photo_body()
+        j = svc.attach_photos(journal_id, g.current_user["userId"], body.get("keys"))
+    except PermissionError:
+        return jsonify({"error": "Forbidden"}), 403
+    except ValueError as e:
+        msg = str(e)
+        return jsonify({"error": msg}), 404 if msg == "Not found" else 400
+    except ClientError as e:
+        # S3 (HeadObject / DeleteObject) hoặc DynamoDB lỗi => JSON như các route khác, không phải trang HTML 500
+        logger.exception("Photo storage error on %s", request.path)
+        return jsonify({"error": f"storage error: {e.response.get('Error', {}).get('Code', 'unknown')}"}), 502
+    return jsonify(j.to_dict()), 200
+
 #--input endiconding test endpoint
 # ---- Stronger mojibake fixer ----
 def _try_fix(s: str):
@@ -137,22 +277,94 @@ def fix_payload_texts(p: dict) -> dict:
             p[k] = demojibake(p[k])
     return p
 
+# map gọn cho marker
+def to_marker(it: dict) -> dict:
+    imgs = it.get("imageUrls") or it.get("photos")
+    return {
+        "journalId": it.get("journalId"),
+        "title": it.get("title") or "",
+        "location": it.get("location") or {},
+        "imageUrl": it.get("cover_photo") or ((imgs or [None])[0] if isinstance(imgs, list) else None),
+    }
+
+# NDJSON: 1 marker / dòng, dòng cuối {"lastKey": ...}
+def ndjson_lines(records, cursor, with_distance=False):
+    dumps = current_app.json.dumps_bytes
+    try:
+        for it in records:
+            m = to_marker(it)
+            if with_distance:
+                m["distance_m"] = it["distance_m"]
+            yield dumps(m) + b"\n"
+    except Exception:
+        # header 200 đã gửi => báo lỗi bằng 1 dòng cuối
+        logger.exception("Unhandled list stream error")
+        yield dumps({"error": "Internal Server Error"}) + b"\n"
+        return
+    next_key = cursor.get("next_key")
+    yield dumps({"lastKey": _encode_key(next_key) if next_key else None}) + b"\n"
+
+# ---------- GET nhiều id (?ids=a,b,c) ----------
+@login_required
+def get_journals_by_ids(ids_str):
+    ids = [i.strip() for i in ids_str.split(",") if i.strip()]
+    try:
+        journals, missing, forbidden = svc.get_many(ids, g.current_user.get("userId"))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    # items theo thứ tự ids yêu cầu (bỏ id trùng / không tồn tại / không có quyền);
+    # tới GET_MANY_MAX journal đầy đủ => stream, encode dần từng journal
+    return current_app.json.stream(
+        journals,
+        key="items",
+        extra={"count": len(journals), "notFound": missing, "forbidden": forbidden},
+        encode=Model.to_json_many,
+    )
+
 # ---------- LIST by BBOX ----------    
 
 @bp.route("", methods=["GET"])
 def list_journals():
     # ?bbox=minLng,minLat,maxLng,maxLat&q=optional&limit=100&lastKey=base64
+    # hoặc ?center=lat,lng&radius_m=5000 (kết quả mỗi trang sắp theo khoảng cách)
+    # &format=ndjson: stream từng marker (không sắp theo khoảng cách), limit tối đa NDJSON_MAX_LIMIT
+    # &from=&to=: khoảng created_at ("2023", "2023-05", "2023-05-01" hoặc ISO đầy đủ, tính cả 2 đầu)
+    # &started_from=&started_to=: khoảng started_at (cùng format)
+    # hoặc ?ids=a,b,c: đọc nhiều journal theo id (BatchGetItem), không cần bbox
+    ids_str = request.args.get("ids")
+    if ids_str is not None:
+        return get_journals_by_ids(ids_str)
+    center_str = request.args.get("center")
     bbox_str = request.args.get("bbox")
-    if not bbox_str:
+    center = bbox = None
+    if center_str:
+        try:
+            center = parse_center(center_str)
+            radius_m = float(request.args.get("radius_m", ""))
+        except ValueError as e:
+            return jsonify({"error": f"center/radius_m invalid: {e}"}), 400
+        if not (0 < radius_m <= MAX_RADIUS_M):
+            return jsonify({"error": f"radius_m must be in (0, {MAX_RADIUS_M}]"}), 400
+    elif not bbox_str:
         return jsonify({"error": "bbox is required (minLng,minLat,maxLng,maxLat)"}), 400
-    try:
-        bbox = parse_bbox(bbox_str)
-    except Exception as e:
-        return jsonify({"error": f"bbox invalid: {e}"}), 400
+    else:
+        try:
+            bbox = parse_bbox(bbox_str)
+        except Exception as e:
+            return jsonify({"error": f"bbox invalid: {e}"}), 400
 
     q = request.args.get("q")
     try:
-        limit = max(1, min(100, int(request.args.get("limit", "100"))))
+        created = parse_time_range(request.args.get("from"), request.args.get("to"))
+        started = parse_time_range(request.args.get("started_from"), request.args.get("started_to"))
+    except ValueError as e:
+        return jsonify({"error": f"from/to invalid: {e}"}), 400
+    fmt = request.args.get("format", "json")
+    if fmt not in ("json", "ndjson"):
+        return jsonify({"error": "format must be json or ndjson"}), 400
+    max_limit = NDJSON_MAX_LIMIT if fmt == "ndjson" else 100
+    try:
+        limit = max(1, min(max_limit, int(request.args.get("limit", "100"))))
     except ValueError:
         limit = 100
 
@@ -164,16 +376,41 @@ def list_journals():
         except Exception:
             return jsonify({"error": "lastKey invalid"}), 400
 
-    items, next_key = svc.list_by_bbox(bbox, q=q, limit=limit, last_key=last_key)
+    if fmt == "ndjson":
+        cursor = {}
+        try:
+            if center:
+                records = svc.iter_by_radius(
+                    center, radius_m, q=q, limit=limit, last_key=last_key, cursor=cursor,
+                    created=created, started=started,
+                )
+            else:
+                records = svc.iter_by_bbox(
+                    bbox, q=q, limit=limit, last_key=last_key, cursor=cursor, created=created, started=started,
+                )
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+        return Response(
+            stream_with_context(ndjson_lines(records, cursor, with_distance=bool(center))),
+            content_type="application/x-ndjson; charset=utf-8",
+        )
 
-    # map gọn cho marker
-    markers = [{
-        "journalId": it.get("journalId"),
-        "title": it.get("title") or "",
-        "location": it.get("location") or {},
-        "imageUrl": (it.get("imageUrls") or it.get("photos") or [None])[0]
-                    if isinstance(it.get("imageUrls") or it.get("photos"), list) else None
-    } for it in items]
+    try:
+        if center:
+            items, next_key = svc.list_by_radius(
+                center, radius_m, q=q, limit=limit, last_key=last_key, created=created, started=started,
+            )
+            markers = [{**to_marker(it), "distance_m": it["distance_m"]} for it in items]
+        else:
+            # marker dựng thẳng từ generator, không giữ list record trung gian
+            cursor = {}
+            records = svc.iter_by_bbox(
+                bbox, q=q, limit=limit, last_key=last_key, cursor=cursor, created=created, started=started,
+            )
+            markers = [to_marker(it) for it in records]
+            next_key = cursor["next_key"]
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
 
     resp = {
         "items": markers,
@@ -183,3 +420,153 @@ def list_journals():
         resp["lastKey"] = _encode_key(next_key)
 
     return jsonify(resp), 200
+
+# Helper: đọc ?bbox=...&zoom=... chung cho clusters / heatmap
+def parse_bbox_zoom_args():
+    bbox_str = request.args.get("bbox")
+    if not bbox_str:
+        raise ValueError("bbox is required (minLng,minLat,maxLng,maxLat)")
+    try:
+        bbox = parse_bbox(bbox_str)
+    except Exception as e:
+        raise ValueError(f"bbox invalid: {e}")
+    try:
+        zoom = int(request.args.get("zoom", ""))
+    except ValueError:
+        raise ValueError("zoom is required (0..22)")
+    return bbox, max(0, min(22, zoom))
+
+# ---------- CLUSTERS (map zoom xa) ----------
+
+@bp.route("/clusters", methods=["GET"])
+def list_clusters():
+    # ?bbox=minLng,minLat,maxLng,maxLat&zoom=0..22
+    try:
+        bbox, zoom = parse_bbox_zoom_args()
+        clusters, precision, truncated = svc.cluster_by_bbox(bbox, zoom)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    return jsonify({
+        "clusters": clusters,
+        "count": len(clusters),
+        "precision": precision,
+        "truncated": truncated,
+    }), 200
+
+# ---------- NEARBY (k journal gần nhất) ----------
+
+@bp.route("/nearby", methods=["GET"])
+def list_nearby():
+    # ?lat=..&lng=..&k=10
+    try:
+        lat = float(request.args.get("lat", ""))
+        lng = float(request.args.get("lng", ""))
+    except ValueError:
+        return jsonify({"error": "lat and lng are required"}), 400
+    if not (-90 <= lat <= 90 and -180 <= lng <= 180):
+        return jsonify({"error": "lat/lng out of range"}), 400
+    try:
+        k = max(1, min(50, int(request.args.get("k", "10"))))
+    except ValueError:
+        k = 10
+
+    items, complete = svc.nearby(lat, lng, k=k)
+    markers = [{**to_marker(it), "distance_m": it["distance_m"]} for it in items]
+    return jsonify({
+        "items": markers,
+        "count": len(markers),
+        "complete": complete,
+    }), 200
+
+# ---------- SEARCH (index token, bỏ dấu) ----------
+
+@bp.route("/search", methods=["GET"])
+def search_journals():
+    # ?q=da lat&limit=20&lastKey=base64
+    q = (request.args.get("q") or "").strip()
+    if not q:
+        return jsonify({"error": "q is required"}), 400
+    try:
+        limit = max(1, min(100, int(request.args.get("limit", "20"))))
+    except ValueError:
+        limit = 20
+
+    last_key_param = request.args.get("lastKey")
+    last_key = None
+    if last_key_param:
+        try:
+            last_key = _decode_key(last_key_param)
+        except Exception:
+            return jsonify({"error": "lastKey invalid"}), 400
+
+    try:
+        items, next_key = svc.search(q, limit=limit, last_key=last_key)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    markers = [to_marker(it) for it in items]
+    resp = {"items": markers, "count": len(markers)}
+    if next_key:
+        resp["lastKey"] = _encode_key(next_key)
+    return jsonify(resp), 200
+
+# ---------- FULL-TEXT (BM25, cả content) ----------
+
+@bp.route("/fulltext", methods=["GET"])
+def fulltext_journals():
+    # ?q=...&k=20
+    q = (request.args.get("q") or "").strip()
+    if not q:
+        return jsonify({"error": "q is required"}), 400
+    try:
+        k = max(1, min(100, int(request.args.get("k", "20"))))
+    except ValueError:
+        k = 20
+
+    try:
+        items, built_at = svc.fulltext_search(q, k=k)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    markers = [{**to_marker(it), "score": it["score"]} for it in items]
+    body = {"items": markers, "count": len(markers), "snapshot": built_at}
+    if built_at is None:
+        # container không nạp được snapshot => kết quả chỉ gồm journal ghi trong DELTA_TTL_DAYS ngày gần nhất
+        body["warning"] = "search snapshot not loaded: results cover recent changes only"
+    return jsonify(body), 200
+
+# ---------- TILES (XYZ, cache được) ----------
+
+@bp.route("/tiles/<int:z>/<int:x>/<int:y>", methods=["GET"])
+def get_tile(z, x, y):
+    try:
+        etag, body = svc.tile(z, x, y)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    resp = make_response(body)
+    resp.content_type = "application/json; charset=utf-8"
+    resp.set_etag(etag)  # strong ETag
+    resp.cache_control.public = True
+    resp.cache_control.max_age = TILE_MAX_AGE
+    resp.cache_control.stale_while_revalidate = TILE_STALE_WHILE_REVALIDATE
+    # If-None-Match khớp => 304 không body
+    return resp.make_conditional(request)
+
+# ---------- HEATMAP (đếm theo ô geohash) ----------
+
+@bp.route("/heatmap", methods=["GET"])
+def heatmap():
+    # ?bbox=minLng,minLat,maxLng,maxLat&zoom=0..22
+    try:
+        bbox, zoom = parse_bbox_zoom_args()
+        cells, precision = svc.heatmap(bbox, zoom)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    return jsonify({
+        "cells": cells,
+        "count": len(cells),
+        "precision": precision,
+    }), 200
@@ -1,4 +1,4 @@
-from flask import Blueprint, jsonify, request
+from flask import Blueprint, current_app, jsonify, request
 from services.user_service import UserService
 from models.user import User
 import os
@@ -83,7 +83,8 @@ def delete_user(user_id):
 def list_users():
     """List all users"""
     users = user_service.list_users()
-    return jsonify([user.to_dict() for user in users])
+    # toàn bảng Users => stream, encode dần từng user
+    return current_app.json.stream(user.to_dict() for user in users)
 
 # New route to get current user's profile
 @user_routes.route("/users/me", methods=["GET"])
@@ -0,0 +1,228 @@
+# services/cell_count_service.py
+"""
+Bảng đếm số journal theo ô geohash (nhiều độ dài) cho heatmap zoom xa.
+- Item: {parent, cell, count}; partition `parent` = "<len>#<cell bỏ 2 ký tự cuối>"
+  => mỗi partition chứa tối đa 32*32 ô con, heatmap chỉ Query vài partition.
+- JournalService cập nhật bằng ADD (atomic) khi create / update (đổi vị trí) / delete.
+- Lệch số (ghi lỗi giữa chừng) => chạy lại `rebuild-cell-counts`.
+- Bảng này cũng quyết định write sharding của GSI geohash: ô vượt SHARD_THRESHOLD journal / shard
+  được gấp đôi `shards` (tối đa MAX_SHARDS); journal mới ghi prefix "<ô>#<k>" (utils.geo.shard_key),
+  list_by_bbox đọc đủ shard của mỗi ô. `shards` chỉ tăng => item đã ghi luôn nằm trong shard đang đọc.
+"""
+import os
+import logging
+from collections import Counter
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from botocore.exceptions import ClientError
+from boto3.dynamodb.conditions import Key
+
+from utils import geohash_batch
+from utils.cache import LRUCache
+from utils.ddb_batch import batch_get_chunk
+from utils.geo import GEOHASH_PREFIX_LADDER, bbox_to_prefixes
+
+logger = logging.getLogger(__name__)
+
+# Các độ dài ô được đếm (trùng thang prefix của GSI)
+COUNT_PRECISIONS = GEOHASH_PREFIX_LADDER
+# Số ô tối đa 1 response heatmap
+MAX_HEATMAP_CELLS = 1024
+
+# Write sharding: số journal / shard trước khi tách đôi ô (0 = tắt, ô đã shard vẫn được đọc đúng)
+SHARD_THRESHOLD = int(os.getenv("SHARD_THRESHOLD", "0"))
+MAX_SHARDS = int(os.getenv("MAX_SHARDS", "8"))
+# Cache số shard / ô trong container; container khác tăng shard => chậm tối đa SHARD_CACHE_TTL giây
+SHARD_CACHE_TTL = float(os.getenv("SHARD_CACHE_TTL", "60"))
+
+
+def _parent_key(cell: str) -> str:
+    return f"{len(cell)}#{cell[:-2]}"
+
+
+def cells_for(gh: Optional[str]) -> List[str]:
+    """Các ô (mọi độ dài trong COUNT_PRECISIONS) chứa geohash gh."""
+    if not gh:
+        return []
+    return [gh[:n] for n in COUNT_PRECISIONS if n <= len(gh)]
+
+
+class CellCountService:
+    def __init__(self, dynamodb, executor=None):
+        # dùng chung resource / thread pool với JournalService
+        self.table = dynamodb.Table(os.getenv("CELL_COUNTS_TABLE", "JournalCellCounts"))
+        self._executor = executor
+        # cell -> số shard (1 = không shard)
+        self.shard_cache = LRUCache(max_bytes=1024 * 1024, ttl_seconds=SHARD_CACHE_TTL)
+
+    def move(self, old_gh: Optional[str], new_gh: Optional[str]) -> None:
+        """
+        Journal đổi ô: -1 cho các ô cũ, +1 cho các ô mới (ô chung thì bỏ qua).
+        create: move(None, gh) — delete: move(gh, None).
+        """
+        self.move_many([(old_gh, new_gh)])
+
+    def move_many(self, moves: Iterable[Tuple[Optional[str], Optional[str]]]) -> None:
+        """move() cho cả lô: gộp delta theo ô => mỗi ô 1 lần ADD."""
+        deltas: Counter = Counter()
+        for old_gh, new_gh in moves:
+            deltas.update(cells_for(new_gh))
+            deltas.subtract(cells_for(old_gh))
+        self.apply(deltas)
+
+    def apply(self, deltas: Dict[str, int]) -> None:
+        """
+        ADD delta cho từng ô (1 journal = 7 ô, mỗi ô 1 item => không gộp được thành 1 lệnh ghi):
+        các UpdateItem chạy song song trên thread pool chung, độ trễ ghi ~ 1 round-trip thay vì 7.
+        Ô nào lỗi => ném lại lỗi đầu tiên sau khi các ô khác đã ghi xong.
+        """
+        todo = [(cell, d) for cell, d in deltas.items() if d]
+        if self._executor is not None and len(todo) > 1:
+            futures = [self._executor.submit(self._apply_one, cell, d) for cell, d in todo]
+            for fut in futures:
+                fut.result()
+        else:
+            for cell, d in todo:
+                self._apply_one(cell, d)
+
+    def _apply_one(self, cell: str, d: int) -> None:
+        resp = self.table.update_item(
+            Key={"parent": _parent_key(cell), "cell": cell},
+            UpdateExpression="ADD #n :d",
+            ExpressionAttributeNames={"#n": "count"},
+            ExpressionAttributeValues={":d": d},
+            ReturnValues="ALL_NEW" if SHARD_THRESHOLD and d > 0 else "NONE",
+        )
+        if SHARD_THRESHOLD and d > 0:
+            attrs = resp.get("Attributes") or {}
+            count, shards = int(attrs.get("count") or 0), int(attrs.get("shards") or 1)
+            if count > SHARD_THRESHOLD * shards and shards < MAX_SHARDS:
+                self._grow_shards(cell, min(MAX_SHARDS, shards * 2))
+
+    def _grow_shards(self, cell: str, shards: int) -> None:
+        try:
+            self.table.update_item(
+                Key={"parent": _parent_key(cell), "cell": cell},
+                UpdateExpression="SET shards = :s",
+                ConditionExpression="attribute_not_exists(shards) OR shards < :s",
+                ExpressionAttributeValues={":s": shards},
+            )
+            logger.info("Cell %s now has %d shards", cell, shards)
+        except ClientError as e:
+            # writer khác đã tăng trước
+            if e.response.get("Error", {}).get("Code") != "ConditionalCheckFailedException":
+                raise
+        self.shard_cache.delete(cell)
+
+    # WRITE SHARDING: số shard của các ô (qua cache), ô chưa có trong bảng = 1
+    def shards_for(self, cells: Iterable[str]) -> Dict[str, int]:
+        """
+        Đọc bảng lỗi / bị throttle => log và coi chunk đó là 1 shard (không cache, lần sau đọc lại):
+        ô đã shard tạm thời chỉ đọc shard 0 thay vì làm hỏng cả request.
+        """
+        out: Dict[str, int] = {}
+        missing = []
+        for cell in dict.fromkeys(cells):
+            n = self.shard_cache.get(cell)
+            if n is None:
+                missing.append(cell)
+            else:
+                out[cell] = n
+        client = self.table.meta.client
+        for i in range(0, len(missing), 100):
+            chunk = missing[i:i + 100]
+            try:
+                items = batch_get_chunk(
+                    client, self.table.name, [{"parent": _parent_key(c), "cell": c} for c in chunk], "cell, shards"
+                )
+            except (ClientError, RuntimeError):
+                logger.exception("Shard lookup failed for %d cells, assuming 1 shard", len(chunk))
+                out.update((c, 1) for c in chunk)
+                continue
+            found = {it["cell"]: int(it.get("shards") or 1) for it in items}
+            for c in chunk:
+                out[c] = found.get(c, 1)
+                self.shard_cache.set(c, out[c], size=64)
+        return out
+
+    # HEATMAP: đọc O(số ô hiển thị) item nhỏ thay vì O(số journal)
+    def counts_in_bbox(
+        self, bbox: Tuple[float, float, float, float], precision: int
+    ) -> List[Dict[str, Any]]:
+        if precision > 2:
+            parents = [f"{precision}#{p}" for p in bbox_to_prefixes(bbox, precision - 2)]
+        else:
+            parents = [f"{precision}#"]
+
+        if self._executor is not None and len(parents) > 1:
+            pages = self._executor.map(self._query_parent, parents)
+        else:
+            pages = map(self._query_parent, parents)
+
+        cells, counts = [], []
+        for items in pages:
+            for it in items:
+                n = int(it.get("count") or 0)
+                if n > 0:
+                    cells.append(it["cell"])
+                    counts.append(n)
+        if not cells:
+            return []
+
+        # giải mã cả lô ô 1 lượt; partition cha rộng hơn bbox => bỏ ô không giao bbox
+        min_lng, min_lat, max_lng, max_lat = bbox
+        lo_lat, lo_lng, hi_lat, hi_lng = geohash_batch.bounds(cells)
+        keep = (hi_lat >= min_lat) & (lo_lat <= max_lat) & (hi_lng >= min_lng) & (lo_lng <= max_lng)
+        lat = ((lo_lat + hi_lat) / 2).tolist()
+        lng = ((lo_lng + hi_lng) / 2).tolist()
+        out = [
+            {"cell": cells[i], "count": counts[i], "lat": lat[i], "lng": lng[i]}
+            for i in keep.nonzero()[0].tolist()
+        ]
+        out.sort(key=lambda c: c["cell"])
+        return out
+
+    def _query_parent(self, parent: str) -> List[Dict[str, Any]]:
+        items: List[Dict[str, Any]] = []
+        kwargs = {"KeyConditionExpression": Key("parent").eq(parent)}
+        while True:
+            resp = self.table.query(**kwargs)
+            items.extend(resp.get("Items", []))
+            lek = resp.get("LastEvaluatedKey")
+            if not lek:
+                return items
+            kwargs["ExclusiveStartKey"] = lek
+
+    # REBUILD toàn bộ bảng đếm từ danh sách geohash của các journal
+    def rebuild(self, geohashes: Iterable[Optional[str]]) -> Tuple[int, int]:
+        """Ghi đè count mọi ô, xoá ô không còn journal. Trả về (cells_written, cells_deleted)."""
+        counts: Counter = Counter()
+        for gh in geohashes:
+            counts.update(cells_for(gh))
+
+        stale = []
+        shards: Dict[str, int] = {}
+        scan_kwargs: Dict[str, Any] = {"ProjectionExpression": "parent, cell, shards"}
+        while True:
+            resp = self.table.scan(**scan_kwargs)
+            for it in resp.get("Items", []):
+                if it["cell"] not in counts:
+                    stale.append(it)
+                elif int(it.get("shards") or 1) > 1:
+                    shards[it["cell"]] = int(it["shards"])
+            lek = resp.get("LastEvaluatedKey")
+            if not lek:
+                break
+            scan_kwargs["ExclusiveStartKey"] = lek
+
+        with self.table.batch_writer(overwrite_by_pkeys=["parent", "cell"]) as bw:
+            for it in stale:
+                bw.delete_item(Key={"parent": it["parent"], "cell": it["cell"]})
+            for cell, n in counts.items():
+                item = {"parent": _parent_key(cell), "cell": cell, "count": n}
+                # giữ số shard: journal đã ghi vào shard k vẫn phải được đọc
+                if cell in shards:
+                    item["shards"] = shards[cell]
+                bw.put_item(Item=item)
+        logger.info("Rebuilt cell counts: %d cells, %d stale removed", len(counts), len(stale))
+        return len(counts), len(stale)
@@ -0,0 +1,225 @@
+# services/fulltext_service.py
+"""
+Tìm kiếm full-text (BM25) trên title + location.name + content của journal public.
+- Snapshot: file utils.bm25_index dựng offline (`build-search-snapshot`), nạp lười bằng mmap
+  ở lần tìm kiếm đầu tiên của container (tải từ S3 về /tmp nếu cấu hình SEARCH_SNAPSHOT_S3).
+  Container không tìm kiếm => không tốn gì lúc cold start.
+- Delta: mỗi lần ghi journal sau snapshot => 1 item ở bảng JournalSearchDelta
+  (partition theo ngày, sort key "<ts>#<journalId>", TTL). Container đọc thêm delta mới
+  mỗi SEARCH_DELTA_REFRESH giây; bản trong delta thay thế bản trong snapshot.
+  Mỗi lần đọc lùi lại DELTA_OVERLAP_S giây (item ghi muộn có ts nhỏ hơn mốc đã đọc),
+  áp theo sort key => đọc lại 1 item nhiều lần không đổi kết quả.
+"""
+import os
+import logging
+import threading
+import time
+from collections import Counter
+from datetime import datetime, timedelta
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+import boto3
+import numpy as np
+from boto3.dynamodb.conditions import Key
+
+from models.journal import ISO, now_iso
+from utils.bm25_index import Bm25Snapshot, bm25, write_snapshot
+from utils.text import terms, tokenize
+
+logger = logging.getLogger(__name__)
+
+SNAPSHOT_PATH = os.getenv("SEARCH_SNAPSHOT_PATH", "/tmp/search.snapshot")
+# "s3://bucket/key" (tuỳ chọn): nơi lấy / đẩy snapshot
+SNAPSHOT_S3 = os.getenv("SEARCH_SNAPSHOT_S3", "")
+DELTA_REFRESH_S = float(os.getenv("SEARCH_DELTA_REFRESH", "30"))
+# delta giữ tối đa DELTA_TTL_DAYS ngày (TTL) => phải dựng lại snapshot thường xuyên hơn
+DELTA_TTL_DAYS = 30
+# Cửa sổ đọc lại delta (lệch đồng hồ giữa container + item ghi chậm)
+DELTA_OVERLAP_S = 300
+# Số term khác nhau tối đa ghi vào 1 item delta (giới hạn kích thước item)
+MAX_DELTA_TERMS = 2000
+
+
+def doc_terms(item: Optional[Dict[str, Any]]) -> Optional[List[str]]:
+    """Term (có lặp) của journal; None nếu journal không được index (không public / đã xoá)."""
+    if not item or item.get("visibility") != "public":
+        return None
+    loc = item.get("location")
+    name = loc.get("name") if isinstance(loc, dict) else None
+    return terms(item.get("title"), name, item.get("content"))
+
+
+def _text_key(item: Optional[Dict[str, Any]]):
+    if not item:
+        return None
+    loc = item.get("location")
+    return (
+        item.get("visibility"),
+        item.get("title"),
+        item.get("content"),
+        loc.get("name") if isinstance(loc, dict) else None,
+    )
+
+
+def _split_s3(uri: str) -> Tuple[str, str]:
+    bucket, _, key = uri[len("s3://"):].partition("/")
+    return bucket, key
+
+
+class FullTextService:
+    def __init__(self, dynamodb):
+        self.table = dynamodb.Table(os.getenv("SEARCH_DELTA_TABLE", "JournalSearchDelta"))
+        self._lock = threading.Lock()
+        self._snapshot: Optional[Bm25Snapshot] = None
+        self._snapshot_loaded = False
+        # delta: journalId -> Counter term (None = đã xoá / không còn public)
+        self._delta: Dict[str, Optional[Counter]] = {}
+        # journalId -> sort key của bản đang giữ (bỏ qua item cũ hơn khi đọc lại cửa sổ overlap)
+        self._delta_sk: Dict[str, str] = {}
+        self._delta_since = ""  # sort key lớn nhất đã đọc
+        self._delta_refreshed = 0.0
+
+    # ---------- ghi ----------
+    def record_change(self, old: Optional[Dict[str, Any]], new: Optional[Dict[str, Any]]) -> None:
+        """Ghi delta nếu phần văn bản / visibility thay đổi và journal (đã / sẽ) nằm trong index."""
+        if _text_key(old) == _text_key(new):
+            return
+        old_terms, new_terms = doc_terms(old), doc_terms(new)
+        if old_terms is None and new_terms is None:
+            return
+        jid = (new or old)["journalId"]
+        ts = now_iso()
+        tf = Counter(new_terms) if new_terms is not None else None
+        item: Dict[str, Any] = {
+            "seg": ts[:10],
+            "sk": f"{ts}#{jid}",
+            "journalId": jid,
+            "deleted": tf is None,
+            "expires_at": int(time.time()) + DELTA_TTL_DAYS * 86400,
+        }
+        if tf is not None:
+            item["terms"] = dict(tf.most_common(MAX_DELTA_TERMS))
+        self.table.put_item(Item=item)
+        # đọc-lại-được-ngay trong container vừa ghi
+        with self._lock:
+            self._delta[jid] = tf
+            self._delta_sk[jid] = item["sk"]
+
+    # ---------- đọc ----------
+    def search(self, q: str, k: int = 20) -> Tuple[List[Tuple[str, float]], Optional[str]]:
+        """Top-k (journalId, score). Trả về (hits, built_at của snapshot | None)."""
+        qterms = tokenize(q)
+        if not qterms:
+            raise ValueError("q is required")
+        snap = self._load_snapshot()
+        self._refresh_delta(snap)
+        with self._lock:
+            delta = dict(self._delta)
+
+        live = {jid: tf for jid, tf in delta.items() if tf is not None}
+        live_dl = {jid: sum(tf.values()) for jid, tf in live.items()}
+        # df / N / avgdl chung cho snapshot và delta (điểm 2 bên so được với nhau)
+        df = {t: sum(1 for tf in live.values() if tf[t]) for t in qterms}
+        n_docs, total_dl = len(live), sum(live_dl.values())
+        hits: List[Tuple[str, float]] = []
+        if snap is not None:
+            # doc snapshot đã có bản mới hơn ở delta (sửa / xoá / hết public) => không đếm 2 lần
+            replaced = np.array(
+                sorted(i for jid in delta if (i := snap.doc_index(jid)) is not None), dtype=np.int64
+            )
+            for t in qterms:
+                docs, _ = snap.postings(t)
+                df[t] += len(docs)
+                if len(docs) and len(replaced):
+                    df[t] -= int(np.isin(docs, replaced).sum())
+            n_docs += snap.n_docs - len(replaced)
+            total_dl += snap.avgdl * snap.n_docs - float(snap.doc_len(replaced).sum())
+        avgdl = total_dl / n_docs if n_docs else 0.0
+        if snap is not None:
+            hits = snap.top_k(qterms, k, df=df, n_docs=n_docs, avgdl=avgdl, exclude=replaced)
+
+        for jid, tf in live.items():
+            dl = live_dl[jid]
+            score = sum(float(bm25(tf[t], dl, df[t], n_docs, avgdl)) for t in qterms if tf[t])
+            if score > 0:
+                hits.append((jid, score))
+        hits.sort(key=lambda h: (-h[1], h[0]))
+        return hits[:k], snap.built_at if snap is not None else None
+
+    def _load_snapshot(self) -> Optional[Bm25Snapshot]:
+        # nạp 1 lần / container, ở lần tìm kiếm đầu tiên
+        if self._snapshot_loaded:
+            return self._snapshot
+        with self._lock:
+            if not self._snapshot_loaded:
+                try:
+                    if not os.path.exists(SNAPSHOT_PATH) and SNAPSHOT_S3:
+                        bucket, key = _split_s3(SNAPSHOT_S3)
+                        boto3.client("s3").download_file(bucket, key, SNAPSHOT_PATH)
+                    if os.path.exists(SNAPSHOT_PATH):
+                        self._snapshot = Bm25Snapshot(SNAPSHOT_PATH)
+                    else:
+                        logger.warning(
+                            "No search snapshot at %s (SEARCH_SNAPSHOT_S3=%r): searching delta only",
+                            SNAPSHOT_PATH, SNAPSHOT_S3,
+                        )
+                except Exception:
+                    # không có snapshot => chỉ tìm trong delta
+                    logger.exception("Cannot load search snapshot %s", SNAPSHOT_PATH)
+                self._snapshot_loaded = True
+        return self._snapshot
+
+    def _refresh_delta(self, snap: Optional[Bm25Snapshot]) -> None:
+        now = time.monotonic()
+        if now - self._delta_refreshed < DELTA_REFRESH_S:
+            return
+        with self._lock:
+            since = self._delta_since
+        if not since:
+            # lần đầu: từ lúc dựng snapshot (delta cũ hơn đã nằm trong snapshot)
+            oldest = (datetime.utcnow() - timedelta(days=DELTA_TTL_DAYS)).strftime(ISO)
+            since = max(snap.built_at, oldest) if snap is not None else oldest
+        try:
+            start = (datetime.strptime(since[:27], ISO) - timedelta(seconds=DELTA_OVERLAP_S)).strftime(ISO)
+        except ValueError:
+            start = since
+
+        rows = []
+        day = datetime.strptime(start[:10], "%Y-%m-%d")
+        while day.strftime("%Y-%m-%d") <= now_iso()[:10]:
+            kwargs: Dict[str, Any] = {
+                "KeyConditionExpression": Key("seg").eq(day.strftime("%Y-%m-%d")) & Key("sk").gt(start),
+            }
+            while True:
+                resp = self.table.query(**kwargs)
+                rows.extend(resp.get("Items", []))
+                lek = resp.get("LastEvaluatedKey")
+                if not lek:
+                    break
+                kwargs["ExclusiveStartKey"] = lek
+            day += timedelta(days=1)
+
+        with self._lock:
+            for r in sorted(rows, key=lambda r: r["sk"]):
+                jid, sk = r["journalId"], r["sk"]
+                since = max(since, sk)
+                if sk <= self._delta_sk.get(jid, ""):
+                    continue  # đã áp (hoặc đang giữ bản mới hơn)
+                if r.get("deleted"):
+                    self._delta[jid] = None
+                else:
+                    self._delta[jid] = Counter({t: int(n) for t, n in (r.get("terms") or {}).items()})
+                self._delta_sk[jid] = sk
+            self._delta_since = since
+            self._delta_refreshed = now
+
+    # ---------- dựng snapshot (offline) ----------
+    def build_snapshot(self, items: Iterable[Dict[str, Any]], path: str, built_at: str, upload: bool = False) -> Dict[str, Any]:
+        docs = ((it["journalId"], ts) for it in items if (ts := doc_terms(it)))
+        meta = write_snapshot(path, docs, built_at)
+        if upload:
+            if not SNAPSHOT_S3:
+                raise ValueError("SEARCH_SNAPSHOT_S3 is not set")
+            bucket, key = _split_s3(SNAPSHOT_S3)
+            boto3.client("s3").upload_file(path, bucket, key)
+        return meta
@@ -1,53 +1,310 @@
 # services/journal_service.py
 import os
 import logging
-from typing import Dict, Any, Optional, List, Tuple
+from typing import Callable, Dict, Any, Iterator, Optional, List, Tuple
 
 import boto3
+from botocore.config import Config
 from botocore.exceptions import ClientError, ParamValidationError
-from boto3.dynamodb.conditions import Key
-import base64, json
+from boto3.dynamodb.conditions import Attr, Key
+import base64, json, hashlib
+import heapq
+import random
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from functools import partial
 
-from decimal import Decimal
 
-from models.journal import Journal, now_iso
+from models.journal import Journal, normalize_time, now_iso
+from services.cell_count_service import CellCountService, COUNT_PRECISIONS, MAX_HEATMAP_CELLS
+from services.token_index_service import TokenIndexService
+from services.fulltext_service import SNAPSHOT_PATH, FullTextService
+from services.photo_service import MAX_PHOTOS, PhotoService
+from utils.cache import LRUCache
+from utils.read_cache import ReadThroughCache, make_backend
+from utils.ddb_batch import batch_get_chunk
+from utils.ddb_codec import condition_kwargs, decode_item, encode_item
+from utils.page_filter import filter_page
+from utils.text import query_tokens
 from utils.geo import (
+    GEOHASH_PREFIX_LADDER,
+    MARKER_ATTRS,
     geohash_fields,
+    geohash_fields_many,
     bbox_to_prefixes,
-    in_bbox,
+    cell_may_intersect_circle,
+    circle_bbox,
+    cluster_markers,
+    cluster_precision,
+    haversine_m,
+    marker_fields,
+    pick_marker_payload,
+    pick_prefix_precision,
+    pick_shard,
+    prefix_attr,
+    prefix_index,
+    ring_cells,
+    ring_search_radius_m,
+    shard_key,
+    tile_bbox,
 )
 
 logger = logging.getLogger(__name__)
 
+# Số Query GSI chạy song song tối đa khi fan-out theo prefix
+QUERY_CONCURRENCY = int(os.getenv("DDB_QUERY_CONCURRENCY", "8"))
+# Số marker tối đa đọc cho 1 lần gom cụm (vượt => cụm là cận dưới, truncated=True)
+CLUSTER_SCAN_LIMIT = int(os.getenv("CLUSTER_SCAN_LIMIT", "2000"))
+# Cache trang Query theo prefix (in-process, theo container warm)
+PAGE_CACHE_MB = int(os.getenv("PAGE_CACHE_MB", "16"))
+PAGE_CACHE_TTL = float(os.getenv("PAGE_CACHE_TTL", "30"))
+# Ghi log số liệu cache (hit / miss / eviction, ...) mỗi CACHE_STATS_LOG_S giây / container (0 = tắt);
+# log DEBUG => ghi sau mỗi request
+CACHE_STATS_LOG_S = float(os.getenv("CACHE_STATS_LOG_S", "300"))
+
+# Cache read-through cho get(): "off" | "redis" (dùng chung giữa container) | "local" (LRU in-process).
+# "local": invalidate chỉ tới container vừa ghi => container khác đọc bản cũ tới JOURNAL_CACHE_TTL giây;
+# trên Lambda chỉ bật kèm TTL vài giây (chấp nhận đọc cũ trong khoảng đó)
+JOURNAL_CACHE = os.getenv("JOURNAL_CACHE", "off")
+JOURNAL_CACHE_URL = os.getenv("JOURNAL_CACHE_URL", "redis://localhost:6379/0")
+JOURNAL_CACHE_MB = int(os.getenv("JOURNAL_CACHE_MB", "16"))
+JOURNAL_CACHE_TTL = float(os.getenv("JOURNAL_CACHE_TTL", "60"))
+
+# Nearby (kNN): quét vành 0..NEARBY_RINGS ở từng mức, từ mịn tới thô
+NEARBY_PRECISIONS = (6, 5, 4, 3)
+NEARBY_RINGS = 2
+NEARBY_SCAN_LIMIT = int(os.getenv("NEARBY_SCAN_LIMIT", "2000"))
+_WORLD_BBOX = (-180.0, -90.0, 180.0, 90.0)
+
+# Tile XYZ: tối đa TILE_MARKER_LIMIT marker public mới nhất / tile,
+# đọc tối đa TILE_SCAN_LIMIT item / (prefix, shard)
+TILE_MARKER_LIMIT = 200
+TILE_SCAN_LIMIT = int(os.getenv("TILE_SCAN_LIMIT", "1000"))
+TILE_CACHE_MB = int(os.getenv("TILE_CACHE_MB", "8"))
+
+# q hiếm (token có <= TEXT_INTERSECT_MAX hit) => đi index token thay vì quét partition geohash
+TEXT_INTERSECT_MAX = int(os.getenv("TEXT_INTERSECT_MAX", "200"))
+# search(): số trang index token tối đa đọc trong 1 request
+SEARCH_MAX_PAGES = int(os.getenv("SEARCH_MAX_PAGES", "5"))
+# Tạo hàng loạt: tối đa BATCH_CREATE_MAX journal / request, ghi theo chunk 25 item (giới hạn BatchWriteItem)
+BATCH_CREATE_MAX = 100
+# Đọc nhiều journal theo id (GET /journals?ids=): tối đa GET_MANY_MAX id / request
+GET_MANY_MAX = 300
+BATCH_WRITE_CHUNK = 25
+BATCH_WRITE_RETRIES = 6
+# Timeline theo user (GSI userId-createdAt): field được phép chọn qua ?fields=
+USER_INDEX = "userId-createdAt"
+# list_by_user: số Query tối đa / request
+TIMELINE_MAX_QUERIES = int(os.getenv("TIMELINE_MAX_QUERIES", "5"))
+TIMELINE_FIELDS = frozenset({
+    "title", "content", "location", "photos", "cover_photo", "started_at", "ended_at",
+    "visibility", "created_at", "updated_at", "geohash",
+})
+# Thuộc tính đọc cho marker (Query GSI / BatchGetItem) = NonKeyAttributes của GSI geo (INCLUDE)
+_MARKER_PROJECTION = "#jid, #title, cover_photo, lat, lng, location_name, geohash, #ca, started_at, visibility"
+_MARKER_NAMES = {"#jid": "journalId", "#title": "title", "#ca": "created_at"}
+
+
+def _newest_first(rec: Dict[str, Any]) -> Tuple[str, str]:
+    """Khoá sắp marker (dùng với reverse=True): mới nhất trước, hoà thì theo journalId."""
+    return rec.get("created_at") or "", rec["journalId"]
+
+
+# Khoảng thời gian (lo, hi) từ models.journal.parse_time_range; mỗi đầu có thể None
+TimeRange = Tuple[Optional[str], Optional[str]]
+
+
+def _time_cond(cond, rng: TimeRange):
+    """Key(...) / Attr(...) -> điều kiện between / >= / <= theo khoảng."""
+    lo, hi = rng
+    if lo and hi:
+        return cond.between(lo, hi)
+    return cond.gte(lo) if lo else cond.lte(hi)
+
+
+def _valid_esk(esk: Any) -> bool:
+    """ExclusiveStartKey lấy từ cursor client: dict key chuỗi -> giá trị chuỗi / số."""
+    return isinstance(esk, dict) and bool(esk) and all(
+        isinstance(k, str) and isinstance(v, (str, int, float)) and not isinstance(v, bool)
+        for k, v in esk.items()
+    )
+
+
+def _normalized_times(item: Dict[str, Any]) -> Dict[str, str]:
+    """started_at / ended_at lưu chưa đúng dạng ISO -> giá trị chuẩn hoá (bỏ qua giá trị hỏng)."""
+    out = {}
+    for name in ("started_at", "ended_at"):
+        v = item.get(name)
+        if not v:
+            continue
+        try:
+            n = normalize_time(v, name, end=name == "ended_at")
+        except ValueError:
+            logger.warning("Skip %s of journal %s: %r", name, item.get("journalId"), v)
+            continue
+        if n != v:
+            out[name] = n
+    return out
+
+
+def _in_time_range(value: Optional[str], rng: Optional[TimeRange]) -> bool:
+    if rng is None:
+        return True
+    lo, hi = rng
+    return bool(value) and (not lo or value >= lo) and (not hi or value <= hi)
+
 
 class JournalService:
     def __init__(self):
         self.table_name = os.getenv("JOURNAL_TABLE", "Journal")
         is_offline = os.getenv("IS_OFFLINE", "false").lower() == "true"
+        # pool HTTP đủ lớn cho các Query song song (mặc định botocore = 10)
+        config = Config(max_pool_connections=max(10, 2 * QUERY_CONCURRENCY))
 
+        conn: Dict[str, Any] = {"config": config}
         if is_offline:
             # Trên Windows cần region + dummy creds
-            self.dynamodb = boto3.resource(
-                "dynamodb",
+            conn.update(
                 endpoint_url=os.getenv("DDB_ENDPOINT", "http://localhost:8000"),
                 region_name=os.getenv("AWS_REGION", "us-east-1"),
                 aws_access_key_id=os.getenv("AWS_ACCESS_KEY_ID", "dummy"),
                 aws_secret_access_key=os.getenv("AWS_SECRET_ACCESS_KEY", "dummy"),
             )
-        else:
-            self.dynamodb = boto3.resource("dynamodb")
+        self.dynamodb = boto3.resource("dynamodb", **conn)
 
         self.table = self.dynamodb.Table(self.table_name)
+        # client cấp thấp (thread-safe) cho đường nóng: item dạng AttributeValue, encode / decode bằng
+        # utils.ddb_codec (số -> int/float trực tiếp, không qua Decimal)
+        self.client = boto3.client("dynamodb", **conn)
+        self._executor = ThreadPoolExecutor(max_workers=QUERY_CONCURRENCY, thread_name_prefix="ddb-query")
+        self.cell_counts = CellCountService(self.dynamodb, executor=self._executor)
+        self.token_index = TokenIndexService(self.dynamodb, executor=self._executor)
+        # snapshot BM25 chỉ nạp ở lần full-text search đầu tiên
+        self.fulltext = FullTextService(self.dynamodb)
+        # ảnh upload thẳng lên S3 (presigned URL), client S3 tạo ở lần dùng đầu tiên
+        self.photos = PhotoService(executor=self._executor)
+        # key = (precision, prefix, ExclusiveStartKey, Limit, khoảng created_at, khoảng started_at, shard), tag = prefix
+        self.page_cache = LRUCache(max_bytes=PAGE_CACHE_MB * 1024 * 1024, ttl_seconds=PAGE_CACHE_TTL)
+        # key = (z, x, y) -> (etag, body), tag = prefix phủ tile
+        self.tile_cache = LRUCache(max_bytes=TILE_CACHE_MB * 1024 * 1024, ttl_seconds=PAGE_CACHE_TTL)
+        # key = journalId -> item (đã decode), xoá khi update / delete
+        backend = make_backend(JOURNAL_CACHE, JOURNAL_CACHE_URL, JOURNAL_CACHE_MB * 1024 * 1024, JOURNAL_CACHE_TTL)
+        self.item_cache = ReadThroughCache(backend) if backend is not None else None
+        self._stats_logged_at = time.monotonic()
+
+    def cache_stats(self) -> Dict[str, Any]:
+        stats = {"pageCache": self.page_cache.stats(), "tileCache": self.tile_cache.stats()}
+        if self.item_cache is not None:
+            stats["journalCache"] = self.item_cache.stats()
+        return stats
+
+    def log_cache_stats(self) -> None:
+        """Log số liệu cache (1 dòng JSON, lọc được bằng CloudWatch Logs Insights) theo CACHE_STATS_LOG_S."""
+        now = time.monotonic()
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("cache_stats %s", json.dumps(self.cache_stats(), sort_keys=True))
+        elif CACHE_STATS_LOG_S and now - self._stats_logged_at >= CACHE_STATS_LOG_S:
+            self._stats_logged_at = now
+            logger.info("cache_stats %s", json.dumps(self.cache_stats(), sort_keys=True))
 
     # CREATE
     def create(self, user_id: str, payload: Dict[str, Any]) -> Journal:
-        title = (payload.get("title") or "").strip()
-        content = (payload.get("content") or "").strip()
+        [(item, error)] = self._build_items(user_id, [payload])
+        if error:
+            raise ValueError(error)
+
+        try:
+            self.client.put_item(
+                TableName=self.table_name,
+                Item=encode_item(item),  # <-- dùng item đã bổ sung geo fields
+                ConditionExpression="attribute_not_exists(journalId)"
+            )
+        except ClientError as e:
+            msg = e.response.get("Error", {}).get("Message", str(e))
+            raise ValueError(f"DynamoDB error: {msg}")
+        self._on_item_changed(None, item)
+
+        # trả về Journal từ item vừa ghi (đã có geo fields)
+        return Journal.from_dict(item)
+
+    # CREATE hàng loạt (import cả chuyến đi): BatchWriteItem song song theo chunk
+    def create_many(
+        self, user_id: str, payloads: List[Dict[str, Any]]
+    ) -> List[Tuple[Optional[Journal], Optional[str]]]:
+        """
+        Validate + geohash cả lô 1 lượt, ghi theo chunk BATCH_WRITE_CHUNK item song song,
+        thử lại UnprocessedItems (backoff + jitter). Trả về (Journal | None, lỗi | None) theo thứ tự payload.
+        """
+        if len(payloads) > BATCH_CREATE_MAX:
+            raise ValueError(f"at most {BATCH_CREATE_MAX} journals per batch")
+        built = self._build_items(user_id, payloads)
+        items = [item for item, _ in built if item is not None]
+        chunks = [items[i:i + BATCH_WRITE_CHUNK] for i in range(0, len(items), BATCH_WRITE_CHUNK)]
+        failed: Dict[str, str] = {}
+        for errors in self._executor.map(self._batch_write, chunks):
+            failed.update(errors)
+
+        self._on_items_changed([(None, it) for it in items if it["journalId"] not in failed])
+        out: List[Tuple[Optional[Journal], Optional[str]]] = []
+        for item, error in built:
+            if item is not None and item["journalId"] in failed:
+                item, error = None, failed[item["journalId"]]
+            out.append((Journal.from_dict(item) if item is not None else None, error))
+        return out
+
+    def _build_items(
+        self, user_id: str, payloads: List[Dict[str, Any]]
+    ) -> List[Tuple[Optional[Dict[str, Any]], Optional[str]]]:
+        """
+        Payload -> item sẵn sàng ghi (geo fields + marker + shard), kiểu Python (encode khi ghi).
+        Lỗi validate của từng payload không làm hỏng cả lô: trả về (item | None, lỗi | None).
+        """
+        built: List[Tuple[Optional[Dict[str, Any]], Optional[str]]] = []
+        for payload in payloads:
+            try:
+                built.append((self._new_item(user_id, payload), None))
+            except ValueError as e:
+                built.append((None, str(e)))
+
+        # Thêm geohash / geohash_prefix (QUAN TRỌNG CHO BBOX): encode cả lô 1 lượt,
+        # lô có location hỏng => encode lẻ để chỉ loại item hỏng
+        valid = [i for i, (item, _) in enumerate(built) if item is not None]
+        try:
+            geos = geohash_fields_many([built[i][0]["location"] for i in valid])
+        except ValueError:
+            geos = []
+            for i in valid:
+                try:
+                    geos.append(geohash_fields(built[i][0]["location"]))
+                except (TypeError, ValueError) as e:
+                    built[i] = (None, f"invalid location: {e}")
+                    geos.append(None)
+        for i, geo in zip(valid, geos):
+            if geo is not None:
+                built[i][0].update(geo)
+
+        # nạp số shard của mọi ô 1 lượt, _sharded_prefixes sau đó chỉ đọc cache
+        ok = [item for item, _ in built if item is not None]
+        self.cell_counts.shards_for(it["geohash"][:n] for it in ok for n in GEOHASH_PREFIX_LADDER)
+        for item in ok:
+            item.update(self._sharded_prefixes(item["journalId"], item["geohash"]))
+        return built
+
+    def _new_item(self, user_id: str, payload: Dict[str, Any]) -> Dict[str, Any]:
+        """Validate 1 payload -> item journal + thuộc tính marker (chưa có geohash). Ném ValueError."""
+        if not isinstance(payload, dict):
+            raise ValueError("journal must be an object")
+        title = payload.get("title") or ""
+        content = payload.get("content") or ""
+        if not isinstance(title, str) or not isinstance(content, str):
+            raise ValueError("title and content must be strings")
+        title, content = title.strip(), content.strip()
         if not title or not content:
             raise ValueError("title and content are required")
 
         location = payload.get("location") or {}
-        if "lat" not in location or "lng" not in location:
+        if not isinstance(location, dict) or "lat" not in location or "lng" not in location:
             raise ValueError("location.lat and location.lng are required")
 
         j = Journal.new(
@@ -56,47 +313,72 @@ class JournalService:
             content=content,
             location=location,
             photos=payload.get("photos") or [],       # giữ nguyên schema hiện tại
-            started_at=payload.get("started_at"),
-            ended_at=payload.get("ended_at"),
+            started_at=normalize_time(payload.get("started_at"), "started_at"),
+            ended_at=normalize_time(payload.get("ended_at"), "ended_at", end=True),
             visibility=(payload.get("visibility") or "private"),
         )
 
-        # chuyển sang dict để có thể chèn thêm geo fields
-        item = j.to_dict()
-        logger.info("Item location before geohash: %s", item["location"])
-
-        # Thêm geohash / geohash_prefix (QUAN TRỌNG CHO BBOX)
+        # chuyển sang dict để có thể chèn thêm geo fields (cover_photo do marker_fields quyết định)
+        item = j.to_dict(exclude=("cover_photo",))
         try:
-            item.update(geohash_fields(item["location"]))
-        except Exception as e:
+            marker = marker_fields(item["location"], item["photos"])
+        except (TypeError, ValueError) as e:
             raise ValueError(f"invalid location: {e}")
+        item.update({k: v for k, v in marker.items() if v is not None})
+        return item
 
-        # (Tuỳ chọn) field thừa cũ, nếu bạn không dùng ở nơi khác nên bỏ:
-        # item["entryId"] = item["journalId"]
-         
-        
-        db_item = self._to_dynamo(item)  
-        try:
-            self.table.put_item(
-                Item= db_item,  # <-- dùng item đã bổ sung geo fields
-                ConditionExpression="attribute_not_exists(journalId)"
-            )
-        except ClientError as e:
-            msg = e.response.get("Error", {}).get("Message", str(e))
-            raise ValueError(f"DynamoDB error: {msg}")
-
-        # trả về Journal từ item vừa ghi (đã có geo fields)
-        return Journal.from_dict(item)
+    def _batch_write(self, items: List[Dict[str, Any]]) -> Dict[str, str]:
+        """BatchWriteItem 1 chunk (<= 25 item), thử lại UnprocessedItems. Trả về {journalId: lỗi} item không ghi được."""
+        request = {self.table_name: [{"PutRequest": {"Item": encode_item(it)}} for it in items]}
+        for attempt in range(BATCH_WRITE_RETRIES + 1):
+            if attempt:
+                time.sleep(random.uniform(0, 0.05 * (2 ** attempt)))
+            try:
+                resp = self.client.batch_write_item(RequestItems=request)
+            except ClientError as e:
+                msg = e.response.get("Error", {}).get("Message", str(e))
+                return {r["PutRequest"]["Item"]["journalId"]["S"]: f"DynamoDB error: {msg}" for r in request[self.table_name]}
+            request = resp.get("UnprocessedItems") or {}
+            if not request:
+                return {}
+        # vẫn bị throttle sau BATCH_WRITE_RETRIES lần => báo lỗi từng item, client gửi lại phần này
+        return {r["PutRequest"]["Item"]["journalId"]["S"]: "throttled, retry later" for r in request[self.table_name]}
 
     # READ
     def get(self, journal_id: str) -> Optional[Journal]:
-        resp = self.table.get_item(Key={"journalId": journal_id})
-        item = resp.get("Item")
-        if not item:
-            return None
-        item = self._from_dynamo(item)  # chuyển Decimal -> float/int
+        if self.item_cache is not None:
+            item = self.item_cache.get_or_load(journal_id, self._load_item)
+        else:
+            item = self._load_item(journal_id)
         return Journal.from_dict(item) if item else None
 
+    def _load_item(self, journal_id: str) -> Optional[Dict[str, Any]]:
+        resp = self.client.get_item(TableName=self.table_name, Key={"journalId": {"S": journal_id}})
+        return decode_item(resp.get("Item"))
+
+    # READ nhiều id 1 lượt (feed / màn chi tiết)
+    def get_many(
+        self, journal_ids: List[str], viewer_id: Optional[str]
+    ) -> Tuple[List[Journal], List[str], List[str]]:
+        """
+        BatchGetItem (song song theo chunk 100 key) + kiểm visibility như get_journal cho cả lô.
+        Trả về (journal đọc được theo thứ tự yêu cầu, id không tồn tại, id không có quyền).
+        """
+        ids = list(dict.fromkeys(journal_ids))
+        if len(ids) > GET_MANY_MAX:
+            raise ValueError(f"at most {GET_MANY_MAX} ids per request")
+        found = self._batch_get(ids, projection=None)
+        items, missing, forbidden = [], [], []
+        for jid in ids:
+            it = found.get(jid)
+            if it is None:
+                missing.append(jid)
+            elif it.get("visibility") != "public" and it.get("userId") != viewer_id:
+                forbidden.append(jid)
+            else:
+                items.append(Journal.from_dict(it))
+        return items, missing, forbidden
+
     # UPDATE (owner-only)
     def update(self, journal_id: str, owner_user_id: str, updates: Dict[str, Any]) -> Journal:
         allowed = {"title", "content", "location", "photos", "started_at", "ended_at", "visibility"}
@@ -104,9 +386,12 @@ class JournalService:
         names: Dict[str, str] = {}
         values: Dict[str, Any] = {}
         sets: List[str] = []
+        removes: List[str] = []
 
-        # Gắn các field cho phép
+        # Gắn các field cho phép (mốc thời gian chuẩn hoá như lúc create)
         for k, v in updates.items():
+            if k in ("started_at", "ended_at"):
+                v = normalize_time(v, k, end=k == "ended_at")
             if k in allowed:
                 names[f"#_{k}"] = k
                 values[f":{k}"] = v
@@ -121,6 +406,7 @@ class JournalService:
                 geo = geohash_fields(loc)
             except Exception as e:
                 raise ValueError(f"invalid location: {e}")
+            geo.update(self._sharded_prefixes(journal_id, geo["geohash"]))
 
             # chèn 2 field geo vào update expression
             for gk, gv in geo.items():
@@ -128,6 +414,19 @@ class JournalService:
                 values[f":{gk}"] = gv
                 sets.append(f"#_{gk} = :{gk}")
 
+        # thuộc tính marker phẳng theo location / photos mới (None => REMOVE)
+        marker = marker_fields(
+            location=updates["location"] if isinstance(updates.get("location"), dict) else None,
+            photos=updates["photos"] if "photos" in updates else None,
+        )
+        for mk, mv in marker.items():
+            names[f"#_{mk}"] = mk
+            if mv is None:
+                removes.append(mk)
+            else:
+                values[f":{mk}"] = mv
+                sets.append(f"#_{mk} = :{mk}")
+
         # luôn cập nhật updated_at
         names["#_updated_at"] = "updated_at"
         values[":updated_at"] = now_iso()
@@ -140,22 +439,32 @@ class JournalService:
             return current
 
         try:
-            values_dynamo = self._to_dynamo(values)  # chuyển float -> Decimal
-
+            try:
+                values_av = encode_item({**values, ":owner": owner_user_id})
+            except TypeError as e:
+                raise ValueError(f"invalid value: {e}")
 
             kwargs = {
-                "Key": {"journalId": journal_id},
-                "UpdateExpression": "SET " + ", ".join(sets),
-                "ExpressionAttributeValues": {**values_dynamo, ":owner": owner_user_id},
+                "TableName": self.table_name,
+                "Key": encode_item({"journalId": journal_id}),
+                "UpdateExpression": "SET " + ", ".join(sets)
+                + (" REMOVE " + ", ".join(f"#_{k}" for k in removes) if removes else ""),
+                "ExpressionAttributeValues": values_av,
                 "ConditionExpression": "attribute_exists(journalId) AND userId = :owner",
-                "ReturnValues": "ALL_NEW",
+                # lấy item CŨ (cần geohash cũ cho bảng đếm), item mới = cũ + các field vừa SET
+                "ReturnValues": "ALL_OLD",
             }
             if names:
                 kwargs["ExpressionAttributeNames"] = names
 
-            resp = self.table.update_item(**kwargs)
-            updated = resp.get("Attributes") or self.table.get_item(Key={"journalId": journal_id}).get("Item") 
-            updated = self._from_dynamo(updated)  # chuyển Decimal -> float/int
+            resp = self.client.update_item(**kwargs)
+            old = decode_item(resp.get("Attributes")) or {}
+            # giá trị mới đọc lại qua codec => cùng kiểu với item đọc từ bảng (21.0 -> 21, ...)
+            new_values = decode_item(values_av)
+            updated = {**old, **{attr: new_values[":" + attr] for attr in names.values() if attr not in removes}}
+            for attr in removes:
+                updated.pop(attr, None)
+            self._on_item_changed(old, updated)
             return Journal.from_dict(updated)  # type: ignore
 
         except ClientError as e:
@@ -172,16 +481,180 @@ class JournalService:
     # DELETE (owner-only)
     def delete(self, journal_id: str, owner_user_id: str) -> None:
         try:
-            self.table.delete_item(
-                Key={"journalId": journal_id},
+            resp = self.client.delete_item(
+                TableName=self.table_name,
+                Key=encode_item({"journalId": journal_id}),
                 ConditionExpression="attribute_exists(journalId) AND userId = :owner",
-                ExpressionAttributeValues={":owner": owner_user_id},
+                ExpressionAttributeValues=encode_item({":owner": owner_user_id}),
+                ReturnValues="ALL_OLD",
             )
         except ClientError as e:
             code = e.response.get("Error", {}).get("Code")
             if code == "ConditionalCheckFailedException":
                 raise PermissionError("Forbidden or not found")
             raise
+        self._on_item_changed(decode_item(resp.get("Attributes")), None)
+
+    # ẢNH: client upload thẳng lên S3 bằng presigned URL, rồi confirm để gắn vào journal
+    def photo_upload_urls(
+        self, journal_id: str, owner_user_id: str, files: Any, method: str = "post"
+    ) -> List[Dict[str, Any]]:
+        current = self._owned_item(journal_id, owner_user_id)
+        n = len(files) if isinstance(files, list) else 0
+        if len(current.get("photos") or []) + n > MAX_PHOTOS:
+            raise ValueError(f"at most {MAX_PHOTOS} photos per journal")
+        return self.photos.upload_urls(journal_id, files, method)
+
+    def attach_photos(self, journal_id: str, owner_user_id: str, keys: Any) -> Journal:
+        """Confirm: key đã upload (HeadObject) => nối URL vào cuối photos (bỏ URL đã có)."""
+        current = self._owned_item(journal_id, owner_user_id)
+        urls = self.photos.verify(journal_id, keys)
+        photos = list(current.get("photos") or [])
+        new = [u for u in urls if u not in photos]
+        if not new:
+            return Journal.from_dict(current)
+        if len(photos) + len(new) > MAX_PHOTOS:
+            raise ValueError(f"at most {MAX_PHOTOS} photos per journal")
+        # update() tính lại cover_photo + làm cũ cache / trang marker như mọi lần sửa photos
+        return self.update(journal_id, owner_user_id, {"photos": photos + new})
+
+    def _owned_item(self, journal_id: str, owner_user_id: str) -> Dict[str, Any]:
+        # đọc thẳng bảng (không qua item_cache): photos hiện tại phải mới nhất trước khi nối thêm
+        item = self._load_item(journal_id)
+        if item is None:
+            raise ValueError("Not found")
+        if item.get("userId") != owner_user_id:
+            raise PermissionError("Forbidden")
+        return item
+
+    # WRITE SHARDING: ô đông (theo bảng đếm) => prefix của journal mang hậu tố shard
+    def _sharded_prefixes(self, journal_id: str, gh: str) -> Dict[str, str]:
+        """Các prefix_attr cần ghi giá trị shard_key (chỉ ô có shard > 1 và journal rơi vào shard k > 0)."""
+        cells = {n: gh[:n] for n in GEOHASH_PREFIX_LADDER}
+        shards = self.cell_counts.shards_for(cells.values())
+        out = {}
+        for n, cell in cells.items():
+            k = pick_shard(journal_id, shards.get(cell, 1))
+            if k:
+                out[prefix_attr(n)] = shard_key(cell, k)
+        return out
+
+    # Đồng bộ dữ liệu phụ sau mỗi lần ghi (old/new = item DDB, None nếu create/delete)
+    def _on_item_changed(self, old: Optional[Dict[str, Any]], new: Optional[Dict[str, Any]]) -> None:
+        self._on_items_changed([(old, new)])
+
+    def _on_items_changed(self, changes: List[Tuple[Optional[Dict[str, Any]], Optional[Dict[str, Any]]]]) -> None:
+        """Như _on_item_changed cho cả lô: gộp delta bảng đếm / index token thành ít lần ghi nhất."""
+        if not changes:
+            return
+        geohashes = [((old or {}).get("geohash"), (new or {}).get("geohash")) for old, new in changes]
+
+        if self.item_cache is not None:
+            for old, new in changes:
+                if old is not None:
+                    self.item_cache.invalidate(old["journalId"])
+
+        # mọi thay đổi (kể cả title/photos) làm cũ trang marker của prefix chứa journal
+        tags = {gh[:n] for pair in geohashes for gh in set(pair) - {None} for n in GEOHASH_PREFIX_LADDER}
+        for tag in tags:
+            self.page_cache.invalidate_tag(tag)
+            self.tile_cache.invalidate_tag(tag)
+
+        moves = [(old_gh, new_gh) for old_gh, new_gh in geohashes if old_gh != new_gh]
+        if moves:
+            try:
+                self.cell_counts.move_many(moves)
+            except ClientError:
+                # best-effort: journal đã ghi xong, lệch đếm sửa bằng rebuild-cell-counts
+                logger.exception("Cell count update failed for %s", moves[:5])
+
+        try:
+            self.token_index.move_many(changes)
+        except ClientError:
+            # best-effort như bảng đếm, sửa bằng rebuild-token-index
+            logger.exception("Token index update failed for %d journal(s)", len(changes))
+
+        for old, new in changes:
+            try:
+                self.fulltext.record_change(old, new)
+            except ClientError:
+                # mất delta => journal chỉ tìm được (đúng) sau lần build-search-snapshot kế tiếp
+                logger.exception("Search delta write failed for %s", (new or old or {}).get("journalId"))
+
+    # TIMELINE của 1 user: mới nhất trước, O(trang) trên GSI userId-createdAt
+    def list_by_user(
+        self,
+        user_id: str,
+        viewer_id: Optional[str],
+        limit: int = 20,
+        last_key: Optional[Dict[str, Any]] = None,
+        visibility: Optional[str] = None,
+        fields: Optional[List[str]] = None,
+    ) -> Tuple[List[Journal], Optional[Dict[str, Any]]]:
+        """
+        Journal của user_id, sắp created_at giảm dần. Người khác chỉ thấy journal public.
+        visibility: lọc thêm "public" / "private" (private chỉ chủ sở hữu).
+        fields: chỉ đọc các field này (+ journalId, userId, created_at) => Journal nạp 1 phần
+        (Model.from_dict(fields=), field khác không có trong to_dict / to_json); None = journal đầy đủ.
+        Cursor = LastEvaluatedKey của GSI {journalId, userId, created_at}; trang có thể ít hơn limit
+        (kèm cursor) khi đã hết TIMELINE_MAX_QUERIES Query.
+        """
+        if visibility not in (None, "public", "private"):
+            raise ValueError("visibility must be public or private")
+        if viewer_id != user_id:
+            if visibility == "private":
+                raise PermissionError("Forbidden")
+            visibility = "public"
+        if fields is not None:
+            unknown = set(fields) - TIMELINE_FIELDS
+            if unknown:
+                raise ValueError(f"unknown fields: {', '.join(sorted(unknown))}")
+        if last_key is not None and (
+            not isinstance(last_key, dict)
+            or set(last_key) != {"journalId", "userId", "created_at"}
+            or last_key.get("userId") != user_id
+        ):
+            raise ValueError("lastKey invalid")
+
+        query_kwargs: Dict[str, Any] = {
+            "TableName": self.table_name,
+            "IndexName": USER_INDEX,
+            "ScanIndexForward": False,
+            **condition_kwargs(
+                Key("userId").eq(user_id),
+                Attr("visibility").eq(visibility) if visibility is not None else None,
+            ),
+        }
+        attrs = list(dict.fromkeys(["journalId", "userId", "created_at", *(fields or ())]))
+        if fields is not None:
+            names = {f"#f{i}": a for i, a in enumerate(attrs)}
+            query_kwargs["ProjectionExpression"] = ", ".join(names)
+            query_kwargs["ExpressionAttributeNames"].update(names)
+
+        # Mỗi Query đọc đủ `limit` item (Limit tính trên item ĐỌC, trước FilterExpression visibility),
+        # dư thì cắt tại item thứ limit và dựng cursor từ item đó (GSI key nằm sẵn trong item).
+        # Người khác xem user hầu hết private => mỗi Query trả về ít => tối đa TIMELINE_MAX_QUERIES
+        # Query / request, hết thì trả trang thiếu kèm cursor.
+        items: List[Dict[str, Any]] = []
+        esk = last_key
+        query_kwargs["Limit"] = limit
+        for _ in range(TIMELINE_MAX_QUERIES):
+            if esk is not None:
+                query_kwargs["ExclusiveStartKey"] = encode_item(esk)
+            resp = self.client.query(**query_kwargs)
+            items.extend(decode_item(it) for it in resp.get("Items", []))
+            esk = decode_item(resp.get("LastEvaluatedKey"))
+            if len(items) >= limit:
+                if len(items) > limit:
+                    items = items[:limit]
+                    esk = {k: items[-1][k] for k in ("journalId", "userId", "created_at")}
+                break
+            if not esk:
+                break
+
+        if fields is None:
+            return [Journal.from_dict(it) for it in items], esk
+        return [Journal.from_dict(it, fields=attrs) for it in items], esk
 
     # LIST theo viewport (bbox) cho trang Map
     def list_by_bbox(
@@ -189,110 +662,706 @@ class JournalService:
         bbox: Tuple[float, float, float, float],  # (minLng, minLat, maxLng, maxLat)
         q: Optional[str] = None,
         limit: int = 100,
-        last_key: Optional[Dict[str, Any]] = None, 
+        last_key: Optional[Dict[str, Any]] = None,
+        created: Optional[TimeRange] = None,
+        started: Optional[TimeRange] = None,
+    ) -> Tuple[List[Dict[str, Any]], Optional[Dict[str, Any]]]:
+        cursor: Dict[str, Any] = {}
+        items = list(self.iter_by_bbox(
+            bbox, q=q, limit=limit, last_key=last_key, cursor=cursor, created=created, started=started,
+        ))
+        return items, cursor.get("next_key")
+
+    def iter_by_bbox(
+        self,
+        bbox: Tuple[float, float, float, float],
+        q: Optional[str] = None,
+        limit: int = 100,
+        last_key: Optional[Dict[str, Any]] = None,
+        cursor: Optional[Dict[str, Any]] = None,
+        created: Optional[TimeRange] = None,
+        started: Optional[TimeRange] = None,
+    ) -> Iterator[Dict[str, Any]]:
+        """
+        Như list_by_bbox nhưng lười: record được yield ngay khi trang chứa nó lọc xong.
+        Đọc hết generator => cursor["next_key"] = key trang sau (None nếu hết).
+        bbox / lastKey / q sai => ValueError ngay khi gọi (trước item đầu tiên).
+        created: khoảng created_at, thành điều kiện sort key của Query GSI (chỉ đọc đúng lát thời gian).
+        started: khoảng started_at (không phải key => FilterExpression).
+        """
+        # chọn mức prefix theo kích thước viewport => số partition luôn nhỏ
+        precision = pick_prefix_precision(bbox)
+        prefixes = bbox_to_prefixes(bbox, precision=precision)
+        qtokens = query_tokens(q)
+
+        # q có token hiếm => lấy hit từ index token, giao với ô geohash của viewport
+        # (cursor "t" = trang sau của chế độ text; cursor "p"/"a" = đang ở chế độ geo)
+        if qtokens and not (last_key and "t" not in last_key):
+            ids = self._text_candidates(qtokens, precision, prefixes)
+            if ids is not None:
+                return self._iter_text(ids, bbox, qtokens, limit, last_key, cursor, created, started)
+        if last_key and "t" in last_key:
+            raise ValueError("lastKey invalid")
+
+        return self._fan_out(
+            precision, prefixes, limit, last_key,
+            lambda batch, seen: filter_page(batch, bbox, qtokens, seen),
+            cursor, created, started,
+        )
+
+    # LIST theo bán kính (center + radius_m), mỗi trang sắp theo khoảng cách
+    def list_by_radius(
+        self,
+        center: Tuple[float, float],  # (lat, lng)
+        radius_m: float,
+        q: Optional[str] = None,
+        limit: int = 100,
+        last_key: Optional[Dict[str, Any]] = None,
+        created: Optional[TimeRange] = None,
+        started: Optional[TimeRange] = None,
     ) -> Tuple[List[Dict[str, Any]], Optional[Dict[str, Any]]]:
+        cursor: Dict[str, Any] = {}
+        items = list(self.iter_by_radius(
+            center, radius_m, q=q, limit=limit, last_key=last_key, cursor=cursor, created=created, started=started,
+        ))
+        items.sort(key=lambda it: it["distance_m"])
+        return items, cursor.get("next_key")
+
+    def iter_by_radius(
+        self,
+        center: Tuple[float, float],
+        radius_m: float,
+        q: Optional[str] = None,
+        limit: int = 100,
+        last_key: Optional[Dict[str, Any]] = None,
+        cursor: Optional[Dict[str, Any]] = None,
+        created: Optional[TimeRange] = None,
+        started: Optional[TimeRange] = None,
+    ) -> Iterator[Dict[str, Any]]:
+        """Như iter_by_bbox cho hình tròn; record theo thứ tự trang về (chưa sắp theo khoảng cách)."""
+        lat, lng = center
+        bbox = circle_bbox(lat, lng, radius_m)
+        precision = pick_prefix_precision(bbox)
+        # bỏ các ô góc bbox chắc chắn nằm ngoài hình tròn
+        prefixes = [
+            c for c in bbox_to_prefixes(bbox, precision=precision)
+            if cell_may_intersect_circle(c, lat, lng, radius_m)
+        ]
+        qtokens = query_tokens(q)
+        return self._fan_out(
+            precision, prefixes, limit, last_key,
+            lambda batch, seen: filter_page(batch, bbox, qtokens, seen, circle=(lat, lng, radius_m)),
+            cursor, created, started,
+        )
 
-        prefixes = bbox_to_prefixes(bbox, precision=5)
+    def _fan_out(
+        self,
+        precision: int,
+        prefixes: List[str],
+        limit: int,
+        last_key: Optional[Dict[str, Any]],
+        page_filter: Callable[[List[Dict[str, Any]], set], Tuple[List[int], List[Dict[str, Any]]]],
+        cursor: Optional[Dict[str, Any]] = None,
+        created: Optional[TimeRange] = None,
+        started: Optional[TimeRange] = None,
+    ) -> Iterator[Dict[str, Any]]:
+        """
+        Query song song các prefix (GSI mức `precision`), lọc từng trang bằng page_filter,
+        yield record tới khi đủ limit; cuối cùng ghi cursor["next_key"].
+        Cursor sai => ValueError ngay (không đợi lần next() đầu).
+        created / started: khoảng thời gian áp cho mọi Query (xem _query_prefix_page).
+        """
+        # last_key: {"p": index prefix chưa bắt đầu kế tiếp,
+        #            "a": [[index prefix đang dở, ExclusiveStartKey | null(, shard nếu > 0)], ...]}
+        try:
+            next_pi = int(last_key.get("p", 0)) if last_key else 0
+            pending = deque(
+                (int(a[0]), int(a[2]) if len(a) > 2 else 0, a[1]) for a in (last_key or {}).get("a", [])
+            )
+        except (AttributeError, TypeError, ValueError, IndexError, KeyError):
+            raise ValueError("lastKey invalid")
+        # kiểm hết ở đây: ESK / index sai đi tới encode_item / Query trong worker thread => 500
+        for pi, sh, esk in pending:
+            if not 0 <= pi < len(prefixes) or sh < 0 or not (esk is None or _valid_esk(esk)):
+                raise ValueError("lastKey invalid")
+        cursor = {} if cursor is None else cursor
+        cursor["next_key"] = None
         if not prefixes:
-            return [], None
+            return iter(())
+        return self._fan_out_iter(precision, prefixes, limit, next_pi, pending, page_filter, cursor, created, started)
+
+    def _fan_out_iter(
+        self,
+        precision: int,
+        prefixes: List[str],
+        limit: int,
+        next_pi: int,
+        pending: deque,
+        page_filter: Callable[[List[Dict[str, Any]], set], Tuple[List[int], List[Dict[str, Any]]]],
+        cursor: Dict[str, Any],
+        created: Optional[TimeRange] = None,
+        started: Optional[TimeRange] = None,
+    ) -> Iterator[Dict[str, Any]]:
+        pk_attr = prefix_attr(precision)
+        count = 0
+        seen = set()
+
+        # để lọc sau query, overfetch nhẹ để bù lọc bbox/q.
+        # Cố định theo limit (không theo số item đã gom) => key page_cache ổn định giữa các request
+        page_limit = min(200, max(20, limit * 3))
+
+        # (index prefix, shard, ExclusiveStartKey)
+        inflight: Dict[Any, Tuple[int, int, Optional[Dict[str, Any]]]] = {}
+        # ô đã write-shard => đọc mọi shard (scatter-gather), gộp như các prefix khác
+        shards = self.cell_counts.shards_for(prefixes)
+
+        def _fill():
+            nonlocal next_pi
+            while len(inflight) < QUERY_CONCURRENCY:
+                if pending:
+                    pi, sh, esk = pending.popleft()
+                elif next_pi < len(prefixes):
+                    pi, sh, esk = next_pi, 0, None
+                    next_pi += 1
+                    pending.extend((pi, k, None) for k in range(1, shards.get(prefixes[pi], 1)))
+                else:
+                    return
+                fut = self._executor.submit(
+                    self._query_prefix_page, precision, prefixes[pi], esk, page_limit, created, started, sh
+                )
+                inflight[fut] = (pi, sh, esk)
+
+        # fan-out: tối đa QUERY_CONCURRENCY Query cùng lúc, gộp kết quả theo thứ tự trả về.
+        # Trong lúc consumer xử lý record, các Query đang bay vẫn chạy (prefetch).
+        try:
+            _fill()
+            while inflight and count < limit:
+                done, _ = wait(inflight, return_when=FIRST_COMPLETED)
+                for fut in done:
+                    if count >= limit:
+                        break  # trang đã đủ, prefix này giữ nguyên trong inflight để ghi vào cursor
+                    pi, sh, esk = inflight.pop(fut)
+                    batch, lek = fut.result()
+
+                    # lọc cả trang 1 lượt (bbox vector hoá + q + de-dup), record đã JSON-ready
+                    positions, records = page_filter(batch, seen)
+                    need = limit - count
+                    if len(records) > need:
+                        positions, records = positions[:need], records[:need]
+                    count += len(records)
+                    if count >= limit and positions and positions[-1] + 1 < len(batch):
+                        # dừng giữa trang => resume ngay sau item này (key = khoá bảng + khoá GSI)
+                        last = records[-1]
+                        lek = {k: last[k] for k in ("journalId", pk_attr, "created_at")}
+                    if lek:
+                        pending.appendleft((pi, sh, lek))  # prefix còn trang => ưu tiên đọc tiếp
+                    yield from records
+                _fill()
+        finally:
+            # huỷ sớm các Query chưa chạy (kể cả khi consumer bỏ dở generator);
+            # Query đang chạy bị bỏ kết quả, vị trí cũ vẫn nằm trong cursor
+            for fut, state in inflight.items():
+                fut.cancel()
+                pending.append(state)
+
+        if pending or next_pi < len(prefixes):
+            cursor["next_key"] = {
+                "p": next_pi,
+                "a": [[pi, k, sh] if sh else [pi, k] for pi, sh, k in sorted(pending, key=lambda e: e[:2])],
+            }
+
+    def _text_candidates(self, qtokens, precision: int, prefixes: List[str]) -> Optional[List[str]]:
+        """
+        journalId có đủ mọi token hiếm của q và nằm trong các ô `prefixes`.
+        None nếu mọi token đều phổ biến (> TEXT_INTERSECT_MAX hit) => dùng quét geo.
+        Token phổ biến không tham gia giao, được kiểm lại ở filter_page.
+        """
+        complete = [rows for rows, ok in self.token_index.hits_many(qtokens, TEXT_INTERSECT_MAX).values() if ok]
+        if not complete:
+            return None
+        cells = set(prefixes)
+        ids = None
+        for rows in complete:
+            hit = {r["journalId"] for r in rows if r["gk"][:precision] in cells}
+            ids = hit if ids is None else ids & hit
+        return sorted(ids)
+
+    def _iter_text(
+        self,
+        ids: List[str],
+        bbox: Tuple[float, float, float, float],
+        qtokens,
+        limit: int,
+        last_key: Optional[Dict[str, Any]],
+        cursor: Optional[Dict[str, Any]],
+        created: Optional[TimeRange] = None,
+        started: Optional[TimeRange] = None,
+    ) -> Iterator[Dict[str, Any]]:
+        """Trang kết quả chế độ text: mới nhất trước; cursor {"t": [created_at, journalId]} của item cuối."""
+        try:
+            after = tuple(last_key["t"]) if last_key else None
+            if after is not None and len(after) != 2:
+                raise ValueError
+        except (TypeError, ValueError, KeyError):
+            raise ValueError("lastKey invalid")
+        cursor = {} if cursor is None else cursor
+        cursor["next_key"] = None
+
+        def _gen():
+            found = self._batch_get(ids)
+            batch = [
+                it for it in (found[j] for j in ids if j in found)
+                if _in_time_range(it.get("created_at"), created) and _in_time_range(it.get("started_at"), started)
+            ]
+            _, records = filter_page(batch, bbox, qtokens)
+            records.sort(key=lambda r: (r.get("created_at") or "", r["journalId"]), reverse=True)
+            if after is not None:
+                records = [r for r in records if (r.get("created_at") or "", r["journalId"]) < after]
+            page = records[:limit]
+            if len(records) > limit:
+                last = page[-1]
+                cursor["next_key"] = {"t": [last.get("created_at") or "", last["journalId"]]}
+            yield from page
 
-        # last_key định nghĩa: {"p": index prefix hiện tại, "k": LastEvaluatedKey của DDB}
-        start_pi = int(last_key.get("p", 0)) if last_key else 0
-        lek = last_key.get("k") if last_key else None
+        return _gen()
+
+    # SEARCH toàn bảng theo q (không cần bbox)
+    def search(
+        self,
+        q: str,
+        limit: int = 20,
+        last_key: Optional[Dict[str, Any]] = None,
+    ) -> Tuple[List[Dict[str, Any]], Optional[Dict[str, Any]]]:
+        """
+        Journal chứa mọi token của q. Đọc lần lượt partition của token hiếm nhất (pivot),
+        kiểm các token còn lại trên record. Cursor: {"s": pivot, "k": ExclusiveStartKey}.
+        Chỉ journal public. Đọc tối đa SEARCH_MAX_PAGES trang / request => trang trả về có thể
+        ít hơn limit (kèm cursor nếu chưa hết).
+        """
+        qtokens = query_tokens(q)
+        if not qtokens:
+            raise ValueError("q is required")
+        if last_key:
+            try:
+                pivot, esk = last_key["s"], last_key.get("k")
+            except (TypeError, KeyError, AttributeError):
+                raise ValueError("lastKey invalid")
+            if pivot not in qtokens:
+                raise ValueError("lastKey invalid")
+        else:
+            counts = self.token_index.hits_many(qtokens, TEXT_INTERSECT_MAX)
+            # token ít hit nhất (đủ hết trước), hoà thì token dài hơn
+            pivot = min(counts, key=lambda t: (not counts[t][1], len(counts[t][0]), -len(t), t))
+            esk = None
 
         items: List[Dict[str, Any]] = []
-        qnorm = (q or "").strip().lower()
+        seen = set()
+        page_limit = min(200, max(20, limit * 3))
+        # tối đa SEARCH_MAX_PAGES trang index / request: hết ngân sách => trả cursor dù trang chưa đủ limit
+        for _ in range(SEARCH_MAX_PAGES):
+            if len(items) >= limit:
+                break
+            rows, lek = self.token_index.query_page(pivot, esk, limit=page_limit)
+            found = self._batch_get([r["journalId"] for r in rows])
+            # chỉ journal public (index token có cả journal private)
+            rows = [r for r in rows if found.get(r["journalId"], {}).get("visibility") == "public"]
+            positions, records = filter_page(
+                [found[r["journalId"]] for r in rows], _WORLD_BBOX, qtokens, seen
+            )
+            need = limit - len(items)
+            if len(records) > need:
+                positions, records = positions[:need], records[:need]
+            items.extend(records)
+            if len(items) >= limit and positions and positions[-1] + 1 < len(rows):
+                lek = {"token": pivot, "gk": rows[positions[-1]]["gk"]}
+            if not lek:
+                return items, None
+            esk = lek
+        return items, {"s": pivot, "k": esk}
 
-        # để lọc sau query, overfetch nhẹ để bù lọc bbox/q
-        def _overfetch(n: int) -> int:
-            return min(200, max(20, n * 3))
+    # FULL-TEXT (BM25 trên title + địa điểm + content, journal public)
+    def fulltext_search(self, q: str, k: int = 20) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+        """Top-k journal theo điểm BM25 (record marker + score). Trả về (items, built_at của snapshot)."""
+        hits, built_at = self.fulltext.search(q, k=k)
+        found = self._batch_get([jid for jid, _ in hits])
+        # kiểm lại visibility hiện tại: delta ghi lỗi / container chưa đọc delta => journal vừa
+        # chuyển private vẫn có thể nằm trong hits
+        public = [found[jid] for jid, _ in hits if found.get(jid, {}).get("visibility") == "public"]
+        # filter_page (bbox = cả thế giới) chỉ để dựng record marker từ projection phẳng
+        _, records = filter_page(public, _WORLD_BBOX)
+        scores = dict(hits)
+        return [{**rec, "score": round(scores[rec["journalId"]], 4)} for rec in records], built_at
 
-        for pi in range(start_pi, len(prefixes)):
-            pfx = prefixes[pi]
-            exclusive_key = lek if pi == start_pi else None  # chỉ áp dụng lek cho prefix đầu tiên
+    def build_search_snapshot(self, path: str = SNAPSHOT_PATH, upload: bool = False) -> Dict[str, Any]:
+        """Dựng snapshot BM25 từ toàn bảng Journal (chạy offline)."""
+        # delta ghi sau thời điểm này sẽ được đọc đè lên snapshot => lấy mốc TRƯỚC khi scan
+        built_at = now_iso()
+        scan_kwargs = {
+            "ProjectionExpression": "#jid, #title, #loc, content, visibility",
+            "ExpressionAttributeNames": {"#jid": "journalId", "#title": "title", "#loc": "location"},
+        }
 
+        def _items():
+            kwargs = dict(scan_kwargs)
             while True:
-                query_kwargs = {
-                    "IndexName": "geohash_prefix-index",
-                    "KeyConditionExpression": Key("geohash_prefix").eq(pfx),
-                    "ProjectionExpression": "#jid, #title, #loc, photos, geohash_prefix",
-                    "ExpressionAttributeNames": {
-                        "#jid": "journalId",
-                        "#title": "title",
-                        "#loc": "location",
-                    },
-                    "Limit": _overfetch(limit - len(items)),
-                }
-                if exclusive_key is not None:
-                   query_kwargs["ExclusiveStartKey"] = exclusive_key
+                resp = self.table.scan(**kwargs)
+                yield from resp.get("Items", [])
+                lek = resp.get("LastEvaluatedKey")
+                if not lek:
+                    return
+                kwargs["ExclusiveStartKey"] = lek
+
+        return self.fulltext.build_snapshot(_items(), path, built_at, upload=upload)
+
+    def _batch_get(
+        self, ids: List[str], projection: Optional[str] = _MARKER_PROJECTION
+    ) -> Dict[str, Dict[str, Any]]:
+        """
+        BatchGetItem theo chunk 100 key (các chunk chạy song song), thử lại UnprocessedKeys.
+        projection mặc định = marker; None = item đầy đủ. Trả về {journalId: item}.
+        """
+        ids = list(dict.fromkeys(ids))
+        chunks = [ids[i:i + 100] for i in range(0, len(ids), 100)]
+        if len(chunks) > 1:
+            pages = self._executor.map(partial(self._batch_get_chunk, projection=projection), chunks)
+        else:
+            pages = (self._batch_get_chunk(c, projection) for c in chunks)
+        out: Dict[str, Dict[str, Any]] = {}
+        for page in pages:
+            out.update(page)
+        return out
+
+    def _batch_get_chunk(self, ids: List[str], projection: Optional[str]) -> Dict[str, Dict[str, Any]]:
+        items = batch_get_chunk(
+            self.client, self.table_name, [{"journalId": {"S": j}} for j in ids], projection, _MARKER_NAMES
+        )
+        out: Dict[str, Dict[str, Any]] = {}
+        for it in items:
+            it = decode_item(it)
+            out[it["journalId"]] = it
+        return out
+
+    # CLUSTERS theo viewport + zoom (map zoom xa)
+    def cluster_by_bbox(
+        self,
+        bbox: Tuple[float, float, float, float],
+        zoom: int,
+    ) -> Tuple[List[Dict[str, Any]], int, bool]:
+        """
+        Gom cụm marker trong bbox theo lưới geohash. Trả về (clusters, precision, truncated).
+        Số cụm <= MAX_CLUSTERS bất kể mật độ; truncated=True nếu đã chạm CLUSTER_SCAN_LIMIT.
+        Chỉ đếm / chọn đại diện trong journal public (endpoint công khai).
+        """
+        precision = cluster_precision(bbox, zoom)
+        cursor: Dict[str, Any] = {}
+        records = self.iter_by_bbox(bbox, limit=CLUSTER_SCAN_LIMIT, cursor=cursor)
+        clusters = cluster_markers((it for it in records if it.get("visibility") == "public"), precision)
+        return clusters, precision, cursor["next_key"] is not None
+
+    # NEARBY: k journal gần (lat, lng) nhất, sắp theo khoảng cách
+    def nearby(self, lat: float, lng: float, k: int = 10) -> Tuple[List[Dict[str, Any]], bool]:
+        """
+        Đọc các vành ô geohash từ trong ra ngoài, giữ max-heap k khoảng cách nhỏ nhất.
+        Dừng khi heap đủ k và phần tử xa nhất vẫn gần hơn mọi ô chưa đọc (ring_search_radius_m).
+        Trả về (items kèm distance_m, complete); complete=False nếu hết vành / chạm NEARBY_SCAN_LIMIT.
+        Chỉ journal public (NEARBY_SCAN_LIMIT vẫn tính cả item private đã đọc).
+        """
+        heap: List[Tuple[float, str, Dict[str, Any]]] = []  # (-distance, journalId, record)
+        seen = set()
+        scanned = 0
 
-                resp = self.table.query(**query_kwargs)
-                batch = resp.get("Items", [])
-                exclusive_key = resp.get("LastEvaluatedKey")
+        def _result():
+            out = []
+            for neg_d, _, rec in sorted(heap, reverse=True):
+                out.append({**rec, "distance_m": round(-neg_d, 1)})
+            return out
+
+        for precision in NEARBY_PRECISIONS:
+            for r in range(NEARBY_RINGS + 1):
+                cells = ring_cells(lat, lng, precision, r)
+                self.cell_counts.shards_for(cells)  # nạp cache số shard 1 lượt cho cả vành
+                read = partial(self._query_prefix_all, precision, max_items=NEARBY_SCAN_LIMIT - scanned)
+                for batch in self._executor.map(read, cells):
+                    scanned += len(batch)
+                    # endpoint công khai => chỉ journal public
+                    public = [it for it in batch if it.get("visibility") == "public"]
+                    _, records = filter_page(public, _WORLD_BBOX, seen=seen)
+                    for rec in records:
+                        d = haversine_m(lat, lng, rec["location"]["lat"], rec["location"]["lng"])
+                        if len(heap) < k:
+                            heapq.heappush(heap, (-d, rec["journalId"], rec))
+                        elif d < -heap[0][0]:
+                            heapq.heapreplace(heap, (-d, rec["journalId"], rec))
+
+                if len(heap) >= k and -heap[0][0] <= ring_search_radius_m(lat, lng, precision, r):
+                    return _result(), True
+                if scanned >= NEARBY_SCAN_LIMIT:
+                    return _result(), False
+        return _result(), False
+
+    def _query_prefix_all(self, precision: int, prefix: str, max_items: int = 1000) -> List[Dict[str, Any]]:
+        """Đọc mọi trang của 1 prefix, mọi shard (tối đa ~max_items item)."""
+        items: List[Dict[str, Any]] = []
+        for sh in range(self.cell_counts.shards_for([prefix])[prefix]):
+            esk = None
+            while len(items) < max_items:
+                batch, esk = self._query_prefix_page(precision, prefix, esk, 200, shard=sh)
+                items.extend(batch)
+                if not esk:
+                    break
+        return items
+
+    # TILE XYZ: response xác định (deterministic) => cache được ở CDN / trình duyệt / in-process
+    def tile(self, z: int, x: int, y: int) -> Tuple[str, bytes]:
+        """
+        Marker của tile (z, x, y) dạng JSON bytes + ETag (sha1 nội dung).
+        Cùng dữ liệu => cùng bytes => cùng ETag, kể cả ở container khác.
+        """
+        cached = self.tile_cache.get((z, x, y))
+        if cached is not None:
+            return cached
+
+        bbox = tile_bbox(z, x, y)
+        precision = pick_prefix_precision(bbox)
+        tags = bbox_to_prefixes(bbox, precision=precision)
+        versions = self.tile_cache.tag_versions(tags)
+
+        # mỗi (prefix, shard) đọc mới nhất trước => luồng đã sắp; trộn k-way => kết quả không phụ thuộc
+        # thứ tự các Query song song trả về
+        shards = self.cell_counts.shards_for(tags)
+        streams = [(p, sh) for p in tags for sh in range(shards.get(p, 1))]
+        results = list(self._executor.map(lambda ps: self._tile_stream(precision, ps[0], ps[1], bbox), streams))
+        truncated = any(more for _, more in results)
+        markers: List[Dict[str, Any]] = []
+        seen = set()
+        for rec in heapq.merge(*(recs for recs, _ in results), key=_newest_first, reverse=True):
+            if rec["journalId"] in seen:
+                continue
+            if len(markers) == TILE_MARKER_LIMIT:
+                truncated = True
+                break
+            seen.add(rec["journalId"])
+            markers.append(pick_marker_payload(rec))
+        body = json.dumps(
+            {
+                "z": z, "x": x, "y": y,
+                "items": markers,
+                "count": len(markers),
+                "truncated": truncated,
+            },
+            ensure_ascii=False, sort_keys=True, separators=(",", ":"),
+        ).encode("utf-8")
+        etag = hashlib.sha1(body).hexdigest()
+
+        self.tile_cache.set((z, x, y), (etag, body), tags=tags, size=len(body) + 200, versions=versions)
+        return etag, body
+
+    def _tile_stream(
+        self, precision: int, prefix: str, shard: int, bbox: Tuple[float, float, float, float]
+    ) -> Tuple[List[Dict[str, Any]], bool]:
+        """
+        Tối đa TILE_MARKER_LIMIT record public trong bbox của 1 (prefix, shard), mới nhất trước.
+        Trả về (records, còn item chưa đọc / chưa lấy).
+        Tile được cache public (CDN) => chỉ lấy journal public.
+        """
+        records: List[Dict[str, Any]] = []
+        seen: set = set()
+        esk, scanned = None, 0
+        while True:
+            batch, esk = self._query_prefix_page(
+                precision, prefix, esk, TILE_MARKER_LIMIT, shard=shard, newest_first=True,
+            )
+            scanned += len(batch)
+            _, recs = filter_page([it for it in batch if it.get("visibility") == "public"], bbox, seen=seen)
+            records.extend(recs)
+            if len(records) >= TILE_MARKER_LIMIT or not esk or scanned >= TILE_SCAN_LIMIT:
+                break
+        records.sort(key=_newest_first, reverse=True)
+        return records[:TILE_MARKER_LIMIT], esk is not None or len(records) > TILE_MARKER_LIMIT
 
-                # lọc chính xác theo bbox + q, de-dup
-                seen = set(x["journalId"] for x in items)
-                for it in batch:
-                    jid = it.get("journalId")
-                    if not jid or jid in seen:
-                        continue
+    # HEATMAP: số journal theo ô geohash từ bảng đếm
+    def heatmap(self, bbox: Tuple[float, float, float, float], zoom: int) -> Tuple[List[Dict[str, Any]], int]:
+        precision = min(cluster_precision(bbox, zoom, max_clusters=MAX_HEATMAP_CELLS), max(COUNT_PRECISIONS))
+        return self.cell_counts.counts_in_bbox(bbox, precision), precision
 
-                    loc = it.get("location") or {}
+    def rebuild_token_index(self) -> Tuple[int, int, int]:
+        """Dựng lại index token từ bảng Journal. Trả về (journals, rows_written, rows_deleted)."""
+        items = []
+        scan_kwargs = {
+            "ProjectionExpression": "#jid, #title, #loc, geohash",
+            "ExpressionAttributeNames": {"#jid": "journalId", "#title": "title", "#loc": "location"},
+        }
+        while True:
+            resp = self.table.scan(**scan_kwargs)
+            items.extend(resp.get("Items", []))
+            lek = resp.get("LastEvaluatedKey")
+            if not lek:
+                break
+            scan_kwargs["ExclusiveStartKey"] = lek
+        written, deleted = self.token_index.rebuild(items)
+        return len(items), written, deleted
+
+    def rebuild_cell_counts(self) -> Tuple[int, int, int]:
+        """Đếm lại từ bảng Journal. Trả về (journals, cells_written, cells_deleted)."""
+        geohashes = list(self._scan_attr("geohash"))
+        written, deleted = self.cell_counts.rebuild(geohashes)
+        return len(geohashes), written, deleted
+
+    def _scan_attr(self, attr: str):
+        scan_kwargs = {"ProjectionExpression": "#a", "ExpressionAttributeNames": {"#a": attr}}
+        while True:
+            resp = self.table.scan(**scan_kwargs)
+            for it in resp.get("Items", []):
+                yield it.get(attr)
+            lek = resp.get("LastEvaluatedKey")
+            if not lek:
+                return
+            scan_kwargs["ExclusiveStartKey"] = lek
+
+    def _query_prefix_page(
+        self,
+        precision: int,
+        prefix: str,
+        exclusive_key: Optional[Dict[str, Any]],
+        limit: int,
+        created: Optional[TimeRange] = None,
+        started: Optional[TimeRange] = None,
+        shard: int = 0,
+        newest_first: bool = False,
+    ) -> Tuple[List[Dict[str, Any]], Optional[Dict[str, Any]]]:
+        """
+        1 trang Query trên GSI của 1 prefix (chạy trong thread pool), qua page_cache.
+        shard > 0 => partition shard_key(prefix, shard); tag cache vẫn là prefix gốc.
+        newest_first => đọc created_at giảm dần (ScanIndexForward=False).
+        created => `created_at between` trong KeyConditionExpression (sort key của GSI);
+        started => FilterExpression (vẫn tính RCU phần đã đọc, chỉ bớt dữ liệu trả về).
+        """
+        cache_key = (
+            precision,
+            prefix,
+            json.dumps(exclusive_key, sort_keys=True) if exclusive_key else None,
+            limit,
+            created,
+            started,
+            shard,
+            newest_first,
+        )
+        cached = self.page_cache.get(cache_key)
+        if cached is not None:
+            return cached
+        versions = self.page_cache.tag_versions((prefix,))
+
+        pk_attr = prefix_attr(precision)
+        key_cond = Key(pk_attr).eq(shard_key(prefix, shard))
+        if created is not None:
+            key_cond &= _time_cond(Key("created_at"), created)
+        query_kwargs = {
+            "TableName": self.table_name,
+            "IndexName": prefix_index(precision),
+            **condition_kwargs(key_cond, _time_cond(Attr("started_at"), started) if started is not None else None),
+            # created_at + prefix để dựng lại ExclusiveStartKey khi dừng giữa trang
+            "ProjectionExpression": _MARKER_PROJECTION + ", #pk",
+            "Limit": limit,
+            "ScanIndexForward": not newest_first,
+        }
+        query_kwargs["ExpressionAttributeNames"].update({**_MARKER_NAMES, "#pk": pk_attr})
+        if exclusive_key is not None:
+            query_kwargs["ExclusiveStartKey"] = encode_item(exclusive_key)
+        try:
+            resp = self.client.query(**query_kwargs)
+        except ClientError as e:
+            # cursor của khoảng thời gian khác => ExclusiveStartKey nằm ngoài điều kiện key
+            if exclusive_key is not None and e.response.get("Error", {}).get("Code") == "ValidationException":
+                raise ValueError("lastKey invalid")
+            raise
+        page = ([decode_item(it) for it in resp.get("Items", [])], decode_item(resp.get("LastEvaluatedKey")))
+        self.page_cache.set(cache_key, page, tags=(prefix,), versions=versions)
+        return page
+
+    # BACKFILL thang geohash_prefix + thuộc tính marker phẳng cho item cũ
+    def backfill_geohash_fields(self, dry_run: bool = False) -> Tuple[int, int]:
+        """
+        Scan toàn bảng, bổ sung các prefix còn thiếu và lat / lng / location_name / cover_photo
+        (GSI geo chỉ project các thuộc tính này), chuẩn hoá started_at / ended_at cũ về dạng ISO
+        (lọc started_from / started_to so sánh chuỗi). Trả về (scanned, updated).
+        """
+        ladder_attrs = [prefix_attr(n) for n in GEOHASH_PREFIX_LADDER]
+        attrs = ["geohash"] + ladder_attrs + list(MARKER_ATTRS) + ["photos", "started_at", "ended_at"]
+        names = {"#jid": "journalId", "#loc": "location"}
+        names.update({f"#_{a}": a for a in attrs})
+        scan_kwargs = {
+            "TableName": self.table_name,
+            "ProjectionExpression": ", ".join(["#jid", "#loc"] + [f"#_{a}" for a in attrs]),
+            "ExpressionAttributeNames": names,
+        }
+
+        scanned = updated = 0
+        while True:
+            resp = self.client.scan(**scan_kwargs)
+            page = [decode_item(it) for it in resp.get("Items", [])]
+            scanned += len(page)
+            todo = [
+                it for it in page
+                if "lat" in (it.get("location") or {}) and "lng" in (it.get("location") or {})
+            ]
+            # encode cả trang 1 lượt; trang có location hỏng => encode lẻ để chỉ bỏ item hỏng
+            try:
+                geos = geohash_fields_many([it["location"] for it in todo])
+            except ValueError:
+                geos = []
+                for it in todo:
                     try:
-                        lat = float(loc.get("lat")); lng = float(loc.get("lng"))
+                        geos.append(geohash_fields(it["location"]))
                     except (TypeError, ValueError):
-                        continue
-
-                    # dùng helper hiện có
-                    if not in_bbox(lat, lng, bbox):
-                        continue
-
-                    if qnorm:
-                        hay = " ".join([
-                            (it.get("title") or ""),
-                            # (tuỳ) có thể ghép content hoặc location.name nếu muốn lọc sâu hơn
-                            (loc.get("name") or "") if isinstance(loc, dict) else ""
-                        ]).lower()
-                        if qnorm not in hay:
-                            continue
-
-                    items.append(it)
-                    seen.add(jid)
-
-                    if len(items) >= limit:
-                        # còn trang? => trả next_key tương ứng
-                        next_key = {"p": pi, "k": exclusive_key} if exclusive_key else (
-                            {"p": pi + 1} if (pi + 1) < len(prefixes) else None
-                        )
-                        return [self._from_dynamo(x) for x in items], next_key
-
-                if not exclusive_key:
-                    break  # hết trang cho prefix này, chuyển prefix tiếp theo
-
-        # hết tất cả prefix
-        return [self._from_dynamo(x) for x in items], None
-    
-# Helper functions to convert float <-> Decimal for DynamoDB
- 
-    def _to_dynamo(self, v):
-            """Đổi float -> Decimal (đệ quy) trước khi put/update vào DDB."""
-            if isinstance(v, float):
-                return Decimal(str(v))          # dùng str để giữ chính xác
-            if isinstance(v, dict):
-                return {k: self._to_dynamo(x) for k, x in v.items()}
-            if isinstance(v, list):
-                return [self._to_dynamo(x) for x in v]
-            return v
-
-    def _from_dynamo(self,v):
-            """Đổi Decimal -> float/int (đệ quy) để trả JSON an toàn."""
-            if isinstance(v, Decimal):
-                return float(v) if v % 1 else int(v)
-            if isinstance(v, dict):
-                return {k: self._from_dynamo(x) for k, x in v.items()}
-            if isinstance(v, list):
-                return [self._from_dynamo(x) for x in v]
-            return v
+                        logger.warning("Skip journal %s: invalid location %s", it["journalId"], it["location"])
+                        geos.append(None)
+
+            geo_by_id = {it["journalId"]: geo for it, geo in zip(todo, geos) if geo is not None}
+            for it in page:
+                geo = geo_by_id.get(it["journalId"]) or {}
+                want = _normalized_times(it)
+                if geo:
+                    want.update(geo)
+                    want.update(marker_fields(it["location"], it.get("photos") or []))
+                # chỉ ghi phần thiếu / lệch (prefix có sẵn thì giữ như cũ)
+                sets = {
+                    k: v for k, v in want.items()
+                    if v is not None and it.get(k) != v and not (k in geo and it.get(k))
+                }
+                removes = [k for k, v in want.items() if v is None and k in it]
+                if not sets and not removes:
+                    continue
+                if dry_run:
+                    updated += 1
+                    continue
+                expr = []
+                if sets:
+                    expr.append("SET " + ", ".join(f"#_{k} = :{k}" for k in sets))
+                if removes:
+                    expr.append("REMOVE " + ", ".join(f"#_{k}" for k in removes))
+                kwargs = {
+                    "TableName": self.table_name,
+                    "Key": encode_item({"journalId": it["journalId"]}),
+                    "UpdateExpression": " ".join(expr),
+                    "ExpressionAttributeNames": {f"#_{k}": k for k in [*sets, *removes]},
+                    "ConditionExpression": "attribute_exists(journalId)",
+                }
+                if sets:
+                    kwargs["ExpressionAttributeValues"] = encode_item({f":{k}": v for k, v in sets.items()})
+                try:
+                    self.client.update_item(**kwargs)
+                    updated += 1
+                except ClientError as e:
+                    # journal bị xoá trong lúc scan => bỏ qua
+                    if e.response.get("Error", {}).get("Code") != "ConditionalCheckFailedException":
+                        raise
+
+            lek = resp.get("LastEvaluatedKey")
+            if not lek:
+                return scanned, updated
+            scan_kwargs["ExclusiveStartKey"] = lek
+
+
 # Helper function for list_by_bbox
 def _encode_key(obj: dict) -> str:
     return base64.urlsafe_b64encode(json.dumps(obj).encode("utf-8")).decode("utf-8")
@@ -0,0 +1,162 @@
+# services/photo_service.py
+"""
+Upload ảnh journal thẳng từ client lên S3 (byte ảnh không đi qua API Gateway / Lambda).
+- upload_urls: mỗi file 1 key journals/<journalId>/<uuid>.<ext> + presigned URL hết hạn sau PHOTO_URL_TTL giây.
+  POST: policy ép Content-Type và content-length-range [1, PHOTO_MAX_BYTES] ngay tại S3.
+  PUT : ký sẵn Content-Type (+ Content-Length khai báo); S3 không ép được kích thước => kiểm lại ở verify.
+- verify (bước confirm): HeadObject từng key => chỉ nhận object đã upload, đúng loại / kích thước;
+  object quá cỡ / sai loại bị xoá. Trả về URL để gắn vào photos của journal.
+- S3_ENDPOINT (MinIO / localstack / moto server) => client path-style để chạy local.
+Object upload mà không confirm vẫn nằm trong bucket: dọn bằng lifecycle rule của bucket.
+"""
+import os
+import threading
+import uuid
+from typing import Any, Dict, List, Optional
+
+import boto3
+from botocore.config import Config
+from botocore.exceptions import ClientError
+
+PHOTOS_BUCKET = os.getenv("PHOTOS_BUCKET", "")
+S3_ENDPOINT = os.getenv("S3_ENDPOINT", "")
+# Gốc URL ảnh lưu vào journal.photos (CDN / CloudFront); mặc định URL của bucket
+PHOTO_PUBLIC_URL = os.getenv("PHOTO_PUBLIC_URL", "")
+PHOTO_MAX_BYTES = int(os.getenv("PHOTO_MAX_MB", "10")) * 1024 * 1024
+PHOTO_URL_TTL = int(os.getenv("PHOTO_URL_TTL", "300"))
+# Số ảnh tối đa / journal (cũng là số URL tối đa / request)
+MAX_PHOTOS = 20
+PHOTO_TYPES = {
+    "image/jpeg": "jpg",
+    "image/png": "png",
+    "image/webp": "webp",
+    "image/heic": "heic",
+    "image/gif": "gif",
+}
+
+
+class PhotoService:
+    def __init__(self, bucket: str = PHOTOS_BUCKET, endpoint: str = S3_ENDPOINT, executor=None):
+        self.bucket = bucket
+        self.endpoint = endpoint or None
+        self._executor = executor
+        self._s3 = None
+        self._lock = threading.Lock()
+        if PHOTO_PUBLIC_URL:
+            self.public_url = PHOTO_PUBLIC_URL.rstrip("/")
+        elif self.endpoint:
+            self.public_url = f"{self.endpoint.rstrip('/')}/{bucket}"
+        else:
+            self.public_url = f"https://{bucket}.s3.amazonaws.com"
+
+    @property
+    def s3(self):
+        # tạo client ở lần dùng đầu tiên (container không upload ảnh => không tốn lúc cold start)
+        if self._s3 is None:
+            with self._lock:
+                if self._s3 is None:
+                    self._s3 = boto3.client(
+                        "s3",
+                        endpoint_url=self.endpoint,
+                        region_name=os.getenv("AWS_REGION", "us-east-1"),
+                        config=Config(
+                            signature_version="s3v4",
+                            s3={"addressing_style": "path" if self.endpoint else "auto"},
+                        ),
+                    )
+        return self._s3
+
+    def _require_bucket(self) -> None:
+        if not self.bucket:
+            raise ValueError("photo upload is not configured (PHOTOS_BUCKET is not set)")
+
+    @staticmethod
+    def key_prefix(journal_id: str) -> str:
+        return f"journals/{journal_id}/"
+
+    def url_for(self, key: str) -> str:
+        return f"{self.public_url}/{key}"
+
+    def upload_urls(self, journal_id: str, files: Any, method: str = "post") -> List[Dict[str, Any]]:
+        """
+        files = [{"contentType": "image/jpeg", "size": 123456}, ...] (size bắt buộc với PUT).
+        Trả về [{"key", "url" (URL ảnh sau confirm), "method", "uploadUrl", "fields" | "headers"}] theo thứ tự files.
+        """
+        self._require_bucket()
+        if method not in ("post", "put"):
+            raise ValueError("method must be post or put")
+        if not isinstance(files, list) or not files:
+            raise ValueError("files must be a non-empty list")
+        if len(files) > MAX_PHOTOS:
+            raise ValueError(f"at most {MAX_PHOTOS} files per request")
+
+        out = []
+        for i, f in enumerate(files):
+            if not isinstance(f, dict):
+                raise ValueError(f"files[{i}] must be an object")
+            ctype, size = f.get("contentType"), f.get("size")
+            if ctype not in PHOTO_TYPES:
+                raise ValueError(f"files[{i}].contentType must be one of {', '.join(PHOTO_TYPES)}")
+            if size is not None or method == "put":
+                if not isinstance(size, int) or isinstance(size, bool) or not 0 < size <= PHOTO_MAX_BYTES:
+                    raise ValueError(f"files[{i}].size must be an integer in (0, {PHOTO_MAX_BYTES}]")
+
+            key = f"{self.key_prefix(journal_id)}{uuid.uuid4().hex}.{PHOTO_TYPES[ctype]}"
+            entry: Dict[str, Any] = {"key": key, "url": self.url_for(key), "method": method.upper()}
+            if method == "post":
+                post = self.s3.generate_presigned_post(
+                    Bucket=self.bucket,
+                    Key=key,
+                    Fields={"Content-Type": ctype},
+                    Conditions=[{"Content-Type": ctype}, ["content-length-range", 1, size or PHOTO_MAX_BYTES]],
+                    ExpiresIn=PHOTO_URL_TTL,
+                )
+                entry.update(uploadUrl=post["url"], fields=post["fields"])
+            else:
+                entry["uploadUrl"] = self.s3.generate_presigned_url(
+                    "put_object",
+                    Params={"Bucket": self.bucket, "Key": key, "ContentType": ctype, "ContentLength": size},
+                    ExpiresIn=PHOTO_URL_TTL,
+                )
+                entry["headers"] = {"Content-Type": ctype}
+            out.append(entry)
+        return out
+
+    def verify(self, journal_id: str, keys: Any) -> List[str]:
+        """Key đã upload của journal -> URL ảnh (theo thứ tự keys, bỏ trùng). Ném ValueError nếu key sai / chưa upload."""
+        self._require_bucket()
+        if not isinstance(keys, list) or not keys or not all(isinstance(k, str) for k in keys):
+            raise ValueError("keys must be a non-empty list of strings")
+        keys = list(dict.fromkeys(keys))
+        if len(keys) > MAX_PHOTOS:
+            raise ValueError(f"at most {MAX_PHOTOS} keys per request")
+        prefix = self.key_prefix(journal_id)
+        foreign = [k for k in keys if not k.startswith(prefix) or "/" in k[len(prefix):]]
+        if foreign:
+            raise ValueError(f"keys do not belong to this journal: {', '.join(foreign)}")
+
+        if self._executor is not None and len(keys) > 1:
+            problems = list(self._executor.map(self._check, keys))
+        else:
+            problems = [self._check(k) for k in keys]
+        bad = [f"{k} ({p})" for k, p in zip(keys, problems) if p]
+        if bad:
+            raise ValueError(f"invalid uploads: {', '.join(bad)}")
+        return [self.url_for(k) for k in keys]
+
+    def _check(self, key: str) -> Optional[str]:
+        """None nếu object hợp lệ, ngược lại lý do (object sai loại / quá cỡ bị xoá)."""
+        try:
+            head = self.s3.head_object(Bucket=self.bucket, Key=key)
+        except ClientError as e:
+            if e.response.get("Error", {}).get("Code") in ("404", "NoSuchKey", "NotFound"):
+                return "not uploaded"
+            raise
+        if head.get("ContentType") not in PHOTO_TYPES:
+            problem = "unsupported content type"
+        elif not 0 < head.get("ContentLength", 0) <= PHOTO_MAX_BYTES:
+            problem = "too large"
+        else:
+            return None
+        self.s3.delete_object(Bucket=self.bucket, Key=key)
+        return problem
@@ -0,0 +1,123 @@
+# services/token_index_service.py
+"""
+Index đảo token -> journal cho tìm kiếm `q` (bỏ dấu: "da lat" tìm được "Đà Lạt").
+- Item: {token, gk, journalId}; partition `token`, sort key `gk` = "<geohash>#<journalId>"
+  => hit của 1 token lọc theo ô geohash bằng begins_with / so prefix, không cần đọc journal.
+- Token lấy từ title + location.name (utils.text.tokenize).
+- JournalService cập nhật khi create / update / delete (chỉ ghi phần token thay đổi).
+- Lệch index (ghi lỗi giữa chừng) => chạy lại `rebuild-token-index`.
+"""
+import os
+import logging
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
+
+from boto3.dynamodb.conditions import Key
+
+from utils.text import tokenize
+
+logger = logging.getLogger(__name__)
+
+
+def doc_tokens(item: Optional[Dict[str, Any]]) -> Set[str]:
+    """Token index của 1 journal (rỗng nếu không có geohash => không hiện trên map)."""
+    if not item or not item.get("geohash"):
+        return set()
+    loc = item.get("location")
+    name = loc.get("name") if isinstance(loc, dict) else None
+    return set(tokenize(item.get("title"), name))
+
+
+def _gk(item: Dict[str, Any]) -> str:
+    return f"{item['geohash']}#{item['journalId']}"
+
+
+class TokenIndexService:
+    def __init__(self, dynamodb, executor=None):
+        # dùng chung resource / thread pool với JournalService
+        self.table = dynamodb.Table(os.getenv("TOKENS_TABLE", "JournalTokens"))
+        self._executor = executor
+
+    def move(self, old: Optional[Dict[str, Any]], new: Optional[Dict[str, Any]]) -> None:
+        """
+        Đồng bộ index khi journal đổi: xoá (token, gk) cũ không còn, thêm (token, gk) mới.
+        create: move(None, item) — delete: move(item, None).
+        """
+        self.move_many([(old, new)])
+
+    def move_many(self, changes: Iterable[Tuple[Optional[Dict[str, Any]], Optional[Dict[str, Any]]]]) -> None:
+        """move() cho cả lô journal, chung 1 batch_writer (25 dòng / BatchWriteItem)."""
+        stale: Set[Tuple[str, str]] = set()
+        added: Dict[Tuple[str, str], str] = {}
+        for old, new in changes:
+            old_rows = {(t, _gk(old)) for t in doc_tokens(old)}
+            new_rows = {(t, _gk(new)) for t in doc_tokens(new)}
+            stale |= old_rows - new_rows
+            added.update(dict.fromkeys(new_rows - old_rows, new["journalId"] if new else None))
+        stale -= added.keys()
+        if not stale and not added:
+            return
+        with self.table.batch_writer(overwrite_by_pkeys=["token", "gk"]) as bw:
+            for token, gk in stale:
+                bw.delete_item(Key={"token": token, "gk": gk})
+            for (token, gk), jid in added.items():
+                bw.put_item(Item={"token": token, "gk": gk, "journalId": jid})
+
+    def query_page(
+        self,
+        token: str,
+        exclusive_key: Optional[Dict[str, Any]] = None,
+        limit: int = 100,
+    ) -> Tuple[List[Dict[str, Any]], Optional[Dict[str, Any]]]:
+        """1 trang hit của token, theo thứ tự gk (geohash)."""
+        kwargs: Dict[str, Any] = {"KeyConditionExpression": Key("token").eq(token), "Limit": limit}
+        if exclusive_key is not None:
+            kwargs["ExclusiveStartKey"] = exclusive_key
+        resp = self.table.query(**kwargs)
+        return resp.get("Items", []), resp.get("LastEvaluatedKey")
+
+    def hits(self, token: str, max_hits: int) -> Tuple[List[Dict[str, Any]], bool]:
+        """Tối đa max_hits hit của token. Trả về (rows, complete); complete=False nếu còn nữa."""
+        rows: List[Dict[str, Any]] = []
+        esk = None
+        while True:
+            page, esk = self.query_page(token, esk, limit=max_hits + 1 - len(rows))
+            rows.extend(page)
+            if len(rows) > max_hits:
+                return rows[:max_hits], False
+            if not esk:
+                return rows, True
+
+    def hits_many(self, tokens: Iterable[str], max_hits: int) -> Dict[str, Tuple[List[Dict[str, Any]], bool]]:
+        """hits() cho nhiều token song song."""
+        tokens = list(tokens)
+        if self._executor is not None and len(tokens) > 1:
+            results = self._executor.map(lambda t: self.hits(t, max_hits), tokens)
+        else:
+            results = (self.hits(t, max_hits) for t in tokens)
+        return dict(zip(tokens, results))
+
+    # REBUILD toàn bộ index từ các journal
+    def rebuild(self, items: Iterable[Dict[str, Any]]) -> Tuple[int, int]:
+        """Ghi đè index, xoá dòng không còn đúng. Trả về (rows_written, rows_deleted)."""
+        rows: Dict[Tuple[str, str], str] = {}
+        for it in items:
+            for t in doc_tokens(it):
+                rows[(t, _gk(it))] = it["journalId"]
+
+        stale = []
+        scan_kwargs: Dict[str, Any] = {"ProjectionExpression": "#t, gk", "ExpressionAttributeNames": {"#t": "token"}}
+        while True:
+            resp = self.table.scan(**scan_kwargs)
+            stale.extend(it for it in resp.get("Items", []) if (it["token"], it["gk"]) not in rows)
+            lek = resp.get("LastEvaluatedKey")
+            if not lek:
+                break
+            scan_kwargs["ExclusiveStartKey"] = lek
+
+        with self.table.batch_writer(overwrite_by_pkeys=["token", "gk"]) as bw:
+            for it in stale:
+                bw.delete_item(Key={"token": it["token"], "gk": it["gk"]})
+            for (token, gk), jid in rows.items():
+                bw.put_item(Item={"token": token, "gk": gk, "journalId": jid})
+        logger.info("Rebuilt token index: %d rows, %d stale removed", len(rows), len(stale))
+        return len(rows), len(stale)
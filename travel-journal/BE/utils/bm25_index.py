@@ -0,0 +1,217 @@
+# utils/bm25_index.py
+"""
+Snapshot index full-text (BM25) dạng 1 file nhị phân, đọc bằng mmap.
+- Dựng offline (write_snapshot) từ bảng Journal, nạp lười lúc tìm kiếm đầu tiên trong container:
+  mở file chỉ map trang ảo, các mảng là view NumPy trên mmap => không parse / copy toàn bộ.
+- Bố cục (little-endian, mỗi section căn 8 byte):
+    MAGIC | u32 độ dài meta | meta JSON {built_at, n_docs, avgdl, n_terms, sections}
+    doc_len   u32[n_docs]          số token mỗi doc
+    doc_off   u32[n_docs + 1]      offset journalId trong doc_blob
+    doc_blob  bytes
+    term_off  u32[n_terms + 1]     offset term (đã sort) trong term_blob
+    term_blob bytes
+    term_post u64[n_terms + 1]     vị trí bắt đầu postings của term
+    post_doc  u32[n_post]          chỉ số doc
+    post_tf   u16[n_post]          tần suất term trong doc
+"""
+import json
+import mmap
+import os
+import struct
+from collections import Counter
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+MAGIC = b"TJBM25v1"
+K1 = 1.2
+B = 0.75
+
+_SECTIONS = (
+    ("doc_len", np.uint32),
+    ("doc_off", np.uint32),
+    ("doc_blob", np.uint8),
+    ("term_off", np.uint32),
+    ("term_blob", np.uint8),
+    ("term_post", np.uint64),
+    ("post_doc", np.uint32),
+    ("post_tf", np.uint16),
+)
+
+
+def idf(df, n_docs: int):
+    """IDF BM25 (biến thể luôn dương)."""
+    return np.log(1.0 + (n_docs - df + 0.5) / (df + 0.5))
+
+
+def bm25(tf, dl, df, n_docs: int, avgdl: float):
+    """Điểm BM25 của 1 term cho (các) doc: tf / dl có thể là mảng."""
+    tf = np.asarray(tf, dtype=np.float64)
+    dl = np.asarray(dl, dtype=np.float64)
+    norm = K1 * (1.0 - B + B * dl / max(avgdl, 1e-9))
+    return idf(df, n_docs) * tf * (K1 + 1.0) / (tf + norm)
+
+
+def write_snapshot(path: str, docs: Iterable[Tuple[str, List[str]]], built_at: str) -> Dict[str, object]:
+    """
+    Ghi snapshot từ (journalId, danh sách term có lặp). Ghi ra file tạm rồi rename (atomic).
+    Trả về meta.
+    """
+    doc_ids: List[bytes] = []
+    doc_len: List[int] = []
+    postings: Dict[str, List[Tuple[int, int]]] = {}
+    for jid, terms in docs:
+        i = len(doc_ids)
+        doc_ids.append(jid.encode("utf-8"))
+        doc_len.append(len(terms))
+        for t, tf in Counter(terms).items():
+            postings.setdefault(t, []).append((i, tf))
+
+    terms_sorted = sorted(postings, key=lambda t: t.encode("utf-8"))
+    term_bytes = [t.encode("utf-8") for t in terms_sorted]
+    post_doc = np.fromiter((d for t in terms_sorted for d, _ in postings[t]), dtype=np.uint32)
+    post_tf = np.fromiter((min(tf, 65535) for t in terms_sorted for _, tf in postings[t]), dtype=np.uint16)
+    arrays = {
+        "doc_len": np.array(doc_len, dtype=np.uint32),
+        "doc_off": np.concatenate([[0], np.cumsum([len(b) for b in doc_ids])]).astype(np.uint32),
+        "doc_blob": np.frombuffer(b"".join(doc_ids), dtype=np.uint8),
+        "term_off": np.concatenate([[0], np.cumsum([len(b) for b in term_bytes])]).astype(np.uint32),
+        "term_blob": np.frombuffer(b"".join(term_bytes), dtype=np.uint8),
+        "term_post": np.concatenate([[0], np.cumsum([len(postings[t]) for t in terms_sorted])]).astype(np.uint64),
+        "post_doc": post_doc,
+        "post_tf": post_tf,
+    }
+
+    meta: Dict[str, object] = {
+        "built_at": built_at,
+        "n_docs": len(doc_ids),
+        "avgdl": (sum(doc_len) / len(doc_len)) if doc_len else 0.0,
+        "n_terms": len(terms_sorted),
+    }
+    # offset section phụ thuộc độ dài meta (chứa chính các offset) => tính lặp tới khi ổn định
+    sections: Dict[str, List[int]] = {}
+    for _ in range(3):
+        meta["sections"] = sections
+        header_len = len(MAGIC) + 4 + len(json.dumps(meta).encode("utf-8"))
+        pos, new_sections = header_len, {}
+        for name, _dtype in _SECTIONS:
+            pos = (pos + 7) & ~7
+            new_sections[name] = [pos, int(arrays[name].size)]
+            pos += arrays[name].nbytes
+        if new_sections == sections:
+            break
+        sections = new_sections
+    meta["sections"] = sections
+    meta_bytes = json.dumps(meta).encode("utf-8")
+
+    tmp = f"{path}.tmp"
+    with open(tmp, "wb") as f:
+        f.write(MAGIC)
+        f.write(struct.pack("<I", len(meta_bytes)))
+        f.write(meta_bytes)
+        for name, dtype in _SECTIONS:
+            f.write(b"\0" * (sections[name][0] - f.tell()))
+            f.write(np.ascontiguousarray(arrays[name], dtype=dtype).tobytes())
+    os.replace(tmp, path)
+    return meta
+
+
+class Bm25Snapshot:
+    """Snapshot read-only trên mmap. Thread-safe (chỉ đọc)."""
+
+    def __init__(self, path: str):
+        self.path = path
+        with open(path, "rb") as f:
+            self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        if self._mm[:len(MAGIC)] != MAGIC:
+            raise ValueError(f"not a BM25 snapshot: {path}")
+        (meta_len,) = struct.unpack_from("<I", self._mm, len(MAGIC))
+        start = len(MAGIC) + 4
+        self.meta = json.loads(self._mm[start:start + meta_len].decode("utf-8"))
+        self.built_at: str = self.meta["built_at"]
+        self.n_docs: int = self.meta["n_docs"]
+        self.avgdl: float = self.meta["avgdl"]
+        self.n_terms: int = self.meta["n_terms"]
+        for name, dtype in _SECTIONS:
+            offset, count = self.meta["sections"][name]
+            setattr(self, f"_{name}", np.frombuffer(self._mm, dtype=dtype, count=count, offset=offset))
+        self._doc_index: Optional[Dict[str, int]] = None
+
+    def _term(self, i: int) -> bytes:
+        return self._term_blob[self._term_off[i]:self._term_off[i + 1]].tobytes()
+
+    def _find(self, term: str) -> Optional[int]:
+        """Tìm nhị phân trên term đã sort (chỉ chạm O(log V) trang của mmap)."""
+        key = term.encode("utf-8")
+        lo, hi = 0, self.n_terms
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self._term(mid) < key:
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo if lo < self.n_terms and self._term(lo) == key else None
+
+    def df(self, term: str) -> int:
+        i = self._find(term)
+        return 0 if i is None else int(self._term_post[i + 1] - self._term_post[i])
+
+    def postings(self, term: str) -> Tuple[np.ndarray, np.ndarray]:
+        """(chỉ số doc, tf) của term; mảng rỗng nếu không có."""
+        i = self._find(term)
+        if i is None:
+            return self._post_doc[:0], self._post_tf[:0]
+        a, b = int(self._term_post[i]), int(self._term_post[i + 1])
+        return self._post_doc[a:b], self._post_tf[a:b]
+
+    def doc_id(self, i: int) -> str:
+        return self._doc_blob[self._doc_off[i]:self._doc_off[i + 1]].tobytes().decode("utf-8")
+
+    def doc_index(self, jid: str) -> Optional[int]:
+        """Chỉ số doc của journalId (dict dựng 1 lần / container, ở lần gọi đầu tiên)."""
+        if self._doc_index is None:
+            blob = self._doc_blob.tobytes()
+            off = self._doc_off.tolist()
+            self._doc_index = {blob[off[i]:off[i + 1]].decode("utf-8"): i for i in range(self.n_docs)}
+        return self._doc_index.get(jid)
+
+    def doc_len(self, docs) -> np.ndarray:
+        return self._doc_len[docs]
+
+    def top_k(
+        self,
+        terms: Iterable[str],
+        k: int,
+        df: Optional[Dict[str, int]] = None,
+        n_docs: Optional[int] = None,
+        avgdl: Optional[float] = None,
+        exclude: Optional[np.ndarray] = None,
+    ) -> List[Tuple[str, float]]:
+        """
+        k doc điểm BM25 cao nhất. df / n_docs / avgdl: thống kê của cả corpus (snapshot + delta,
+        đã trừ doc bị thay) để điểm snapshot và delta so được với nhau; mặc định = của snapshot.
+        exclude: chỉ số doc đã có bản mới hơn ở delta (không chấm điểm).
+        """
+        n_docs = self.n_docs if n_docs is None else n_docs
+        avgdl = self.avgdl if avgdl is None else avgdl
+        acc = None
+        for t in set(terms):
+            docs, tf = self.postings(t)
+            if not len(docs):
+                continue
+            w = bm25(tf, self._doc_len[docs], len(docs) if df is None else df[t], n_docs, avgdl)
+            if acc is None:
+                acc = np.zeros(self.n_docs, dtype=np.float64)
+            acc[docs] += w
+        if acc is None:
+            return []
+        if exclude is not None and len(exclude):
+            acc[exclude] = 0.0
+
+        # top k bằng argpartition, rồi mới sort / giải mã journalId
+        hit = np.flatnonzero(acc)
+        want = min(len(hit), k)
+        if not want:
+            return []
+        top = hit[np.argpartition(-acc[hit], want - 1)[:want]] if want < len(hit) else hit
+        return [(self.doc_id(i), float(acc[i])) for i in sorted(top.tolist(), key=lambda i: (-acc[i], i))]
@@ -0,0 +1,146 @@
+# utils/cache.py
+"""
+Cache in-process (sống theo Lambda container warm).
+- LRU + TTL, giới hạn theo dung lượng ước lượng (bytes) chứ không theo số entry.
+- Invalidation theo tag (vd. geohash prefix): ghi journal => xoá mọi entry gắn tag đó.
+- Version của tag giữ trong LRU tối đa MAX_TAG_VERSIONS tag; tag bị đẩy ra => nâng mức sàn
+  (_floor) lên version của nó, tag không còn trong bảng có version = sàn => đọc dở dang trước đó
+  không ghi được (an toàn), cùng lắm bỏ lỡ 1 lần ghi cache.
+- Thread-safe (fan-out Query chạy trong thread pool).
+"""
+import sys
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, Iterable, Optional, Tuple
+
+_MISSING = object()
+# Số tag tối đa giữ version (mỗi tag vài chục bytes)
+MAX_TAG_VERSIONS = 4096
+
+
+def approx_size(obj: Any) -> int:
+    """Ước lượng bytes của dict/list/str lồng nhau (đủ dùng để giới hạn cache)."""
+    if isinstance(obj, dict):
+        return sys.getsizeof(obj) + sum(approx_size(k) + approx_size(v) for k, v in obj.items())
+    if isinstance(obj, (list, tuple)):
+        return sys.getsizeof(obj) + sum(approx_size(x) for x in obj)
+    return sys.getsizeof(obj)
+
+
+class LRUCache:
+    def __init__(self, max_bytes: int, ttl_seconds: float, max_tags: int = MAX_TAG_VERSIONS):
+        self.max_bytes = max_bytes
+        self.ttl = ttl_seconds
+        self.max_tags = max_tags
+        # key -> (expires_at, size, tags, value); thứ tự = LRU (cũ nhất ở đầu)
+        self._data: "OrderedDict[Hashable, Tuple[float, int, Tuple[str, ...], Any]]" = OrderedDict()
+        self._tags: Dict[str, set] = {}
+        # version (đồng hồ chung, tăng mỗi lần invalidate) của tag => chặn ghi kết quả đã đọc trước
+        # khi invalidate; LRU giới hạn max_tags, tag không có trong bảng = _floor
+        self._versions: "OrderedDict[str, int]" = OrderedDict()
+        self._clock = 0
+        self._floor = 0
+        self._lock = threading.Lock()
+        self.bytes = 0
+        self.hits = self.misses = self.evictions = self.expirations = self.invalidations = 0
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        with self._lock:
+            entry = self._data.get(key, _MISSING)
+            if entry is _MISSING:
+                self.misses += 1
+                return default
+            if entry[0] < time.monotonic():
+                self._remove(key)
+                self.expirations += 1
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return entry[3]
+
+    def tag_versions(self, tags: Iterable[str]) -> Tuple[int, ...]:
+        with self._lock:
+            return tuple(self._versions.get(t, self._floor) for t in tags)
+
+    def set(
+        self,
+        key: Hashable,
+        value: Any,
+        tags: Iterable[str] = (),
+        size: Optional[int] = None,
+        versions: Optional[Tuple[int, ...]] = None,
+    ) -> bool:
+        """
+        Lưu value. `versions` = tag_versions(tags) lấy TRƯỚC khi đọc DB:
+        nếu tag đã bị invalidate trong lúc đọc thì bỏ qua (tránh cache dữ liệu cũ).
+        """
+        tags = tuple(tags)
+        size = approx_size(value) if size is None else size
+        if size > self.max_bytes:
+            return False
+        with self._lock:
+            if versions is not None and versions != tuple(self._versions.get(t, self._floor) for t in tags):
+                return False
+            if key in self._data:
+                self._remove(key)
+            self._data[key] = (time.monotonic() + self.ttl, size, tags, value)
+            self.bytes += size
+            for t in tags:
+                self._tags.setdefault(t, set()).add(key)
+            while self.bytes > self.max_bytes:
+                self._remove(next(iter(self._data)))
+                self.evictions += 1
+            return True
+
+    def invalidate_tag(self, tag: str) -> int:
+        with self._lock:
+            self._clock += 1
+            self._versions[tag] = self._clock
+            self._versions.move_to_end(tag)
+            while len(self._versions) > self.max_tags:
+                _, v = self._versions.popitem(last=False)
+                self._floor = max(self._floor, v)
+            keys = self._tags.pop(tag, ())
+            for key in list(keys):
+                if key in self._data:
+                    self._remove(key)
+            self.invalidations += len(keys)
+            return len(keys)
+
+    def delete(self, key: Hashable) -> None:
+        with self._lock:
+            if key in self._data:
+                self._remove(key)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+            self._tags.clear()
+            self.bytes = 0
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "entries": len(self._data),
+                "bytes": self.bytes,
+                "max_bytes": self.max_bytes,
+                "ttl_seconds": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+                "invalidations": self.invalidations,
+                "tag_versions": len(self._versions),
+            }
+
+    def _remove(self, key: Hashable) -> None:
+        _, size, tags, _ = self._data.pop(key)
+        self.bytes -= size
+        for t in tags:
+            keys = self._tags.get(t)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._tags[t]
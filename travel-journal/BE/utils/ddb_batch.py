@@ -0,0 +1,42 @@
+# utils/ddb_batch.py
+"""
+BatchGetItem 1 chunk (<= 100 key) kèm thử lại UnprocessedKeys (backoff + jitter), dùng chung cho
+JournalService và CellCountService.
+Không đụng tới kiểu giá trị: client cấp thấp => key / item dạng AttributeValue,
+client của resource (table.meta.client) => kiểu Python.
+"""
+import random
+import time
+from typing import Any, Dict, List, Optional
+
+# Số lần thử lại UnprocessedKeys
+BATCH_GET_RETRIES = 5
+
+
+def batch_get_chunk(
+    client,
+    table_name: str,
+    keys: List[Dict[str, Any]],
+    projection: Optional[str] = None,
+    names: Optional[Dict[str, str]] = None,
+    retries: int = BATCH_GET_RETRIES,
+) -> List[Dict[str, Any]]:
+    """
+    Item tìm thấy của `keys` (thứ tự tuỳ DynamoDB; key không tồn tại thì không có).
+    Hết `retries` lần mà vẫn còn UnprocessedKeys (bị throttle) => RuntimeError.
+    """
+    spec: Dict[str, Any] = {"Keys": keys}
+    if projection is not None:
+        spec["ProjectionExpression"] = projection
+        if names:
+            spec["ExpressionAttributeNames"] = names
+    request = {table_name: spec}
+    out: List[Dict[str, Any]] = []
+    for attempt in range(retries + 1):
+        resp = client.batch_get_item(RequestItems=request)
+        out.extend(resp.get("Responses", {}).get(table_name, []))
+        request = resp.get("UnprocessedKeys") or {}
+        if not request:
+            return out
+        time.sleep(random.uniform(0, 0.05 * (2 ** attempt)))
+    raise RuntimeError("DynamoDB error: too many unprocessed keys")
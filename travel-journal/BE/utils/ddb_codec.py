@@ -0,0 +1,136 @@
+# utils/ddb_codec.py
+"""
+Codec AttributeValue <-> kiểu Python cho client DynamoDB cấp thấp (boto3.client, không qua resource).
+- Đọc: "N" -> int (chuỗi nguyên) / float, không qua Decimal; số có phần lẻ bằng 0 ("21.0", "1E+2")
+  -> int, giống JournalService._from_dynamo => item đọc về dùng / trả JSON được ngay.
+- Ghi: float -> "N" bằng repr (chuỗi ngắn nhất khứ hồi đúng), không đổi sang Decimal trước.
+- condition_kwargs: Key() / Attr() của boto3 -> biểu thức + placeholder đã encode.
+Giới hạn: số > ~15 chữ số có phần lẻ mất chính xác khi đọc thành float (Journal chỉ có toạ độ / đếm).
+"""
+import math
+from decimal import Decimal
+from typing import Any, Dict, Optional
+
+from boto3.dynamodb.conditions import ConditionBase, ConditionExpressionBuilder
+
+AttributeValue = Dict[str, Any]
+
+
+def _decode_n(s: str):
+    try:
+        return int(s)
+    except ValueError:
+        f = float(s)
+        return int(f) if f.is_integer() else f
+
+
+def _decode_m(m: Dict[str, AttributeValue]) -> Dict[str, Any]:
+    return {k: decode_value(v) for k, v in m.items()}
+
+
+def _decode_l(items) -> list:
+    return [decode_value(v) for v in items]
+
+
+_DECODERS = {
+    "N": _decode_n,
+    "BOOL": bool,
+    "NULL": lambda _: None,
+    "M": _decode_m,
+    "L": _decode_l,
+    "SS": set,
+    "NS": lambda ns: {_decode_n(s) for s in ns},
+    "B": bytes,
+    "BS": set,
+}
+
+
+def decode_value(av: AttributeValue) -> Any:
+    """{"S": ...} / {"N": ...} / ... -> giá trị Python."""
+    s = av.get("S")
+    if s is not None:
+        return s
+    [(tag, v)] = av.items()
+    decoder = _DECODERS.get(tag)
+    if decoder is None:
+        raise TypeError(f"unsupported AttributeValue type: {tag}")
+    return decoder(v)
+
+
+def decode_item(item: Optional[Dict[str, AttributeValue]]) -> Optional[Dict[str, Any]]:
+    """Item (Item / Items[i] / LastEvaluatedKey) -> dict Python; None giữ nguyên."""
+    if item is None:
+        return None
+    return {k: decode_value(v) for k, v in item.items()}
+
+
+def _encode_number(v) -> str:
+    if isinstance(v, float):
+        if not math.isfinite(v):
+            raise TypeError("Infinity and NaN not supported")
+        return repr(v)
+    if isinstance(v, Decimal) and not v.is_finite():
+        raise TypeError("Infinity and NaN not supported")
+    return str(v)
+
+
+def encode_value(v: Any) -> AttributeValue:
+    """Giá trị Python -> AttributeValue (cùng quy tắc TypeSerializer, float ghi thẳng)."""
+    t = type(v)
+    if t is str:
+        return {"S": v}
+    if t is float or t is int or t is Decimal:
+        return {"N": _encode_number(v)}
+    if t is bool:
+        return {"BOOL": v}
+    if v is None:
+        return {"NULL": True}
+    if t is dict:
+        return {"M": {k: encode_value(x) for k, x in v.items()}}
+    if t is list or t is tuple:
+        return {"L": [encode_value(x) for x in v]}
+    if t is bytes or t is bytearray:
+        return {"B": bytes(v)}
+    if t is set or t is frozenset:
+        if not v:
+            raise TypeError("empty sets are not supported")
+        if all(type(x) is str for x in v):
+            return {"SS": list(v)}
+        if all(type(x) in (int, float, Decimal) for x in v):
+            return {"NS": [_encode_number(x) for x in v]}
+        if all(type(x) in (bytes, bytearray) for x in v):
+            return {"BS": [bytes(x) for x in v]}
+    raise TypeError(f"Unsupported type {t.__name__} for value {v!r}")
+
+
+def encode_item(item: Dict[str, Any]) -> Dict[str, AttributeValue]:
+    return {k: encode_value(v) for k, v in item.items()}
+
+
+def condition_kwargs(
+    key_condition: Optional[ConditionBase] = None,
+    filter_condition: Optional[ConditionBase] = None,
+) -> Dict[str, Any]:
+    """
+    KeyConditionExpression / FilterExpression + ExpressionAttributeNames / Values (đã encode)
+    cho Query / Scan của client cấp thấp. Placeholder dạng #n0 / :v0 (tránh đặt tên trùng).
+    """
+    builder = ConditionExpressionBuilder()
+    out: Dict[str, Any] = {}
+    names: Dict[str, str] = {}
+    values: Dict[str, Any] = {}
+    for param, cond, is_key in (
+        ("KeyConditionExpression", key_condition, True),
+        ("FilterExpression", filter_condition, False),
+    ):
+        if cond is None:
+            continue
+        built = builder.build_expression(cond, is_key_condition=is_key)
+        out[param] = built.condition_expression
+        names.update(built.attribute_name_placeholders)
+        values.update(built.attribute_value_placeholders)
+    if names:
+        out["ExpressionAttributeNames"] = names
+    if values:
+        out["ExpressionAttributeValues"] = encode_item(values)
+    return out
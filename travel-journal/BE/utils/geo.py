@@ -1,34 +1,130 @@
 # utils/geo.py
 """
 Geo utilities for Travel Journal
-- Thuần Python, dùng pygeohash (không cần build C).
+- Điểm lẻ dùng pygeohash; xử lý theo lô (backfill, phủ viewport lớn) dùng utils.geohash_batch (NumPy).
 - Mục tiêu:
-  + Tính geohash / geohash_prefix khi ghi dữ liệu
+  + Tính geohash / thang geohash_prefix (nhiều độ dài) khi ghi dữ liệu
   + Chuyển bbox -> danh sách geohash prefixes để query GSI
   + Kiểm tra 1 điểm có nằm trong bbox hay không
 """
 
-from typing import Dict, Any, Iterable, List, Tuple
+import math
+import zlib
+from typing import Dict, Any, Iterable, List, Optional, Sequence, Tuple
+import numpy as np
 import pygeohash as geohash
 
+from utils import geohash_batch
+
 # Độ chính xác khuyến nghị:
 # - Ghi dữ liệu (marker): precision 9 cho geohash đầy đủ
 # - Tìm theo vùng: dùng prefix 5 (≈ vài km); có thể tăng/giảm theo zoom
 GEOHASH_PRECISION_FULL = 9
 GEOHASH_PREFIX_LEN = 5
 
+# Số ô tối đa bbox_to_prefixes được phép sinh ra (mỗi ô = 1 Query GSI)
+GEOHASH_MAX_CELLS = 512
+
+# Thang độ dài prefix ghi vào mỗi journal, mỗi mức có 1 GSI riêng.
+# Viewport càng lớn thì query ở mức càng thô => số partition luôn nhỏ.
+GEOHASH_PREFIX_LADDER = (1, 2, 3, 4, 5, 6, 7)
+# Số partition (prefix) tối đa 1 viewport được fan-out
+GEOHASH_MAX_PARTITIONS = 32
+
+# Gom cụm marker: ~4x4 cụm trên mỗi tile 256px, tối đa MAX_CLUSTERS cụm / response
+CLUSTERS_PER_TILE_SIDE = 4
+MAX_CLUSTERS = 256
+
+_BASE32 = "0123456789bcdefghjkmnpqrstuvwxyz"
+
+# Bán kính trung bình Trái Đất (m), dùng cho haversine
+EARTH_RADIUS_M = 6371008.8
+
+
+def prefix_attr(length: int) -> str:
+    """
+    Tên attribute chứa prefix độ dài `length`.
+    Mức 5 giữ tên cũ `geohash_prefix` để dữ liệu / GSI hiện có vẫn dùng được.
+    """
+    if length == GEOHASH_PREFIX_LEN:
+        return "geohash_prefix"
+    return f"geohash_prefix_{length}"
+
+
+def prefix_index(length: int) -> str:
+    """Tên GSI tương ứng với prefix_attr(length)."""
+    return f"{prefix_attr(length)}-index"
+
+
+def shard_key(prefix: str, shard: int) -> str:
+    """
+    Giá trị partition key GSI của 1 shard của ô `prefix`.
+    Shard 0 = prefix nguyên bản => item cũ / ô không shard không cần đổi gì.
+    """
+    return prefix if shard == 0 else f"{prefix}#{shard}"
+
+
+def pick_shard(journal_id: str, shards: int) -> int:
+    """Shard cố định của 1 journal (crc32, không đổi giữa các process) trong `shards` shard."""
+    return zlib.crc32(journal_id.encode("utf-8")) % shards if shards > 1 else 0
+
 
 def geohash_fields(location: Dict[str, Any]) -> Dict[str, str]:
     """
-    Tạo geohash và geohash_prefix từ location {lat, lng, [name]}
+    Tạo geohash và toàn bộ thang prefix (geohash_prefix_1..7) từ location {lat, lng, [name]}
     """
     lat = float(location["lat"])
     lng = float(location["lng"])
     gh = geohash.encode(lat, lng, precision=GEOHASH_PRECISION_FULL)
-    return {
-        "geohash": gh,
-        "geohash_prefix": gh[:GEOHASH_PREFIX_LEN],
-    }
+    fields = {"geohash": gh}
+    for length in GEOHASH_PREFIX_LADDER:
+        fields[prefix_attr(length)] = gh[:length]
+    return fields
+
+
+def geohash_fields_many(locations: Sequence[Dict[str, Any]]) -> List[Dict[str, str]]:
+    """
+    Như geohash_fields nhưng cho cả lô location (encode 1 lượt bằng NumPy).
+    Ném ValueError nếu có location thiếu / sai toạ độ.
+    """
+    if not locations:
+        return []
+    try:
+        lat = [float(loc["lat"]) for loc in locations]
+        lng = [float(loc["lng"]) for loc in locations]
+    except (KeyError, TypeError) as e:
+        raise ValueError(f"invalid location: {e}")
+    out = []
+    for gh in geohash_batch.encode_many(lat, lng, GEOHASH_PRECISION_FULL).tolist():
+        fields = {"geohash": gh}
+        for length in GEOHASH_PREFIX_LADDER:
+            fields[prefix_attr(length)] = gh[:length]
+        out.append(fields)
+    return out
+
+
+# Thuộc tính marker phẳng (denormalize từ location / photos), xem marker_fields
+MARKER_ATTRS = ("lat", "lng", "location_name", "cover_photo")
+
+
+def marker_fields(
+    location: Optional[Dict[str, Any]] = None,
+    photos: Optional[Sequence[Any]] = None,
+) -> Dict[str, Any]:
+    """
+    Thuộc tính marker phẳng để GSI geo chỉ project phần map cần (không cả location / photos):
+    lat / lng / location_name từ location, cover_photo = ảnh đầu tiên của photos.
+    Chỉ trả phần được truyền vào; giá trị None = không có (xoá attribute khi update).
+    """
+    out: Dict[str, Any] = {}
+    if location is not None:
+        out["lat"] = float(location["lat"])
+        out["lng"] = float(location["lng"])
+        out["location_name"] = location.get("name") or None
+    if photos is not None:
+        first = photos[0] if isinstance(photos, list) and photos else None
+        out["cover_photo"] = first if isinstance(first, str) and first else None
+    return out
 
 
 def in_bbox(lat: float, lng: float, bbox: Tuple[float, float, float, float]) -> bool:
@@ -54,28 +150,121 @@ def parse_bbox(bbox_str: str) -> Tuple[float, float, float, float]:
     return (min_lng, min_lat, max_lng, max_lat)
 
 
+def _cell_bits(precision: int) -> Tuple[int, int]:
+    """
+    Số bit kinh độ / vĩ độ của 1 ô geohash ở precision cho trước.
+    Geohash xen kẽ bit bắt đầu từ kinh độ => lng nhận phần lẻ.
+    """
+    n = 5 * precision
+    return (n + 1) // 2, n // 2
+
+
+def cell_size(precision: int) -> Tuple[float, float]:
+    """
+    Kích thước 1 ô geohash (độ): (lat_height, lng_width).
+    """
+    lng_bits, lat_bits = _cell_bits(precision)
+    return 180.0 / (1 << lat_bits), 360.0 / (1 << lng_bits)
+
+
+def _spread_bits(v: int) -> int:
+    """Chèn 1 bit 0 giữa các bit của v (0b101 -> 0b10001)."""
+    out = 0
+    i = 0
+    while v:
+        out |= (v & 1) << (2 * i)
+        v >>= 1
+        i += 1
+    return out
+
+
+def _cell_range(lo: float, hi: float, origin: float, span: float, bits: int) -> Tuple[int, int]:
+    """Chỉ số ô [i0, i1] (theo 1 trục) giao với đoạn [lo, hi]."""
+    n = 1 << bits
+    i0 = int((max(lo, origin) - origin) / span * n)
+    i1 = int((min(hi, origin + span) - origin) / span * n)
+    return max(0, min(n - 1, i0)), max(0, min(n - 1, i1))
+
+
+def _cover_ranges(
+    bbox: Tuple[float, float, float, float], precision: int
+) -> Tuple[Tuple[int, int], Tuple[int, int]]:
+    min_lng, min_lat, max_lng, max_lat = bbox
+    lng_bits, lat_bits = _cell_bits(precision)
+    return (
+        _cell_range(min_lng, max_lng, -180.0, 360.0, lng_bits),
+        _cell_range(min_lat, max_lat, -90.0, 180.0, lat_bits),
+    )
+
+
+def _code_to_hash(code: int, precision: int) -> str:
+    chars = []
+    for _ in range(precision):
+        chars.append(_BASE32[code & 31])
+        code >>= 5
+    return "".join(reversed(chars))
+
+
+def _cell_xy(lat: float, lng: float, precision: int) -> Tuple[int, int]:
+    """Chỉ số ô (x theo lng, y theo lat) chứa điểm."""
+    lng_bits, lat_bits = _cell_bits(precision)
+    x = _cell_range(lng, lng, -180.0, 360.0, lng_bits)[0]
+    y = _cell_range(lat, lat, -90.0, 180.0, lat_bits)[0]
+    return x, y
+
+
+def _xy_hash(x: int, y: int, precision: int) -> str:
+    if (5 * precision) % 2:
+        code = _spread_bits(x) | (_spread_bits(y) << 1)
+    else:
+        code = (_spread_bits(x) << 1) | _spread_bits(y)
+    return _code_to_hash(code, precision)
+
+
+def cover_cell_count(bbox: Tuple[float, float, float, float], precision: int) -> int:
+    """
+    Số ô geohash (ở precision) giao với bbox — tính bằng số học, không encode.
+    """
+    (x0, x1), (y0, y1) = _cover_ranges(bbox, precision)
+    return (x1 - x0 + 1) * (y1 - y0 + 1)
+
+
 def bbox_to_prefixes(
     bbox: Tuple[float, float, float, float],
     precision: int = GEOHASH_PREFIX_LEN,
-    step_deg: float = 0.045,
+    max_cells: int = GEOHASH_MAX_CELLS,
 ) -> List[str]:
     """
-    Rải lưới điểm trong bbox -> encode geohash -> lấy prefix (unique).
-    - precision=5 ~ ô vài km. step_deg ~ 0.045 (~5km) là hợp lý.
+    Tập tối thiểu các ô geohash (độ dài = precision) giao với bbox.
+    - Tính chỉ số ô ở 2 góc rồi sinh cả lưới chỉ số ô -> geohash 1 lượt (NumPy),
+      nên chi phí tỉ lệ với số ô trả về chứ không theo diện tích bbox.
+    - Ném ValueError nếu số ô vượt max_cells (bbox quá lớn so với precision).
+    - Kết quả đã sort => thứ tự ổn định giữa các lần gọi (cần cho cursor `p`).
     - Kết quả dùng để Query GSI `geohash_prefix-index` theo từng prefix.
     """
-    min_lng, min_lat, max_lng, max_lat = bbox
-    prefixes = set()
-    lat = min_lat
-    # + step nhỏ để không bỏ sót biên do sai số float
-    EPS = 1e-9
-    while lat <= max_lat + EPS:
-        lng = min_lng
-        while lng <= max_lng + EPS:
-            prefixes.add(geohash.encode(lat, lng, precision=precision)[:precision])
-            lng += step_deg
-        lat += step_deg
-    return list(prefixes)
+    (x0, x1), (y0, y1) = _cover_ranges(bbox, precision)
+    count = (x1 - x0 + 1) * (y1 - y0 + 1)
+    if count > max_cells:
+        raise ValueError(
+            f"bbox too large: {count} geohash cells at precision {precision} (max {max_cells})"
+        )
+
+    xs, ys = np.meshgrid(np.arange(x0, x1 + 1), np.arange(y0, y1 + 1))
+    return np.sort(geohash_batch.xy_to_hashes(xs, ys, precision)).tolist()
+
+
+def pick_prefix_precision(
+    bbox: Tuple[float, float, float, float],
+    max_partitions: int = GEOHASH_MAX_PARTITIONS,
+) -> int:
+    """
+    Chọn độ dài prefix mịn nhất trong thang mà bbox chỉ phủ <= max_partitions ô.
+    Zoom gần -> prefix dài (ít item thừa), zoom xa -> prefix ngắn (ít Query).
+    """
+    for length in reversed(GEOHASH_PREFIX_LADDER):
+        if cover_cell_count(bbox, length) <= max_partitions:
+            return length
+    return GEOHASH_PREFIX_LADDER[0]
 
 
 def pick_marker_payload(item: Dict[str, Any]) -> Dict[str, Any]:
@@ -88,5 +277,183 @@ def pick_marker_payload(item: Dict[str, Any]) -> Dict[str, Any]:
         "journalId": item.get("journalId"),
         "title": item.get("title", ""),
         "location": item.get("location", {}),
-        "imageUrl": imgs[0] if imgs else None,
+        "imageUrl": item.get("cover_photo") or (imgs[0] if imgs else None),
     }
+
+
+def cluster_precision(
+    bbox: Tuple[float, float, float, float],
+    zoom: int,
+    max_clusters: int = MAX_CLUSTERS,
+) -> int:
+    """
+    Độ dài geohash dùng làm ô gom cụm cho mức zoom (web map, tile 256px).
+    Ô không nhỏ hơn 1/CLUSTERS_PER_TILE_SIDE tile, và bbox phủ <= max_clusters ô.
+    """
+    target_w = 360.0 / (1 << zoom) / CLUSTERS_PER_TILE_SIDE
+    precision = 1
+    for p in range(GEOHASH_PRECISION_FULL, 0, -1):
+        if cell_size(p)[1] >= target_w:
+            precision = p
+            break
+    while precision > 1 and cover_cell_count(bbox, precision) > max_clusters:
+        precision -= 1
+    return precision
+
+
+def cluster_markers(items: Iterable[Dict[str, Any]], precision: int) -> List[Dict[str, Any]]:
+    """
+    Gom marker theo ô geohash độ dài `precision` (grid clustering).
+    Mỗi cụm: tâm (trung bình lat/lng), số lượng, journal đại diện (mới nhất) + thumbnail.
+    """
+    cells: Dict[str, Dict[str, Any]] = {}
+    for it in items:
+        loc = it.get("location") or {}
+        try:
+            lat = float(loc["lat"]); lng = float(loc["lng"])
+        except (KeyError, TypeError, ValueError):
+            continue
+        gh = it.get("geohash") or geohash.encode(lat, lng, precision=GEOHASH_PRECISION_FULL)
+        cell = gh[:precision]
+
+        c = cells.get(cell)
+        if c is None:
+            c = cells[cell] = {"cell": cell, "count": 0, "_lat": 0.0, "_lng": 0.0, "_rep": it}
+        c["count"] += 1
+        c["_lat"] += lat
+        c["_lng"] += lng
+        if (it.get("created_at") or "") > (c["_rep"].get("created_at") or ""):
+            c["_rep"] = it
+
+    out = []
+    for c in cells.values():
+        rep = pick_marker_payload(c.pop("_rep"))
+        n = c["count"]
+        out.append({
+            "cell": c["cell"],
+            "count": n,
+            "lat": c.pop("_lat") / n,
+            "lng": c.pop("_lng") / n,
+            "journalId": rep["journalId"],
+            "imageUrl": rep["imageUrl"],
+        })
+    out.sort(key=lambda c: c["cell"])
+    return out
+
+
+def haversine_m(lat1: float, lng1: float, lat2: float, lng2: float) -> float:
+    """Khoảng cách mặt cầu (m) giữa 2 điểm."""
+    p1 = math.radians(lat1)
+    p2 = math.radians(lat2)
+    a = (math.sin((p2 - p1) / 2) ** 2
+         + math.cos(p1) * math.cos(p2) * math.sin(math.radians(lng2 - lng1) / 2) ** 2)
+    return 2 * EARTH_RADIUS_M * math.asin(min(1.0, math.sqrt(a)))
+
+
+def ring_cells(lat: float, lng: float, precision: int, r: int) -> List[str]:
+    """
+    Các ô geohash cách ô chứa (lat, lng) đúng r ô (vành thứ r, r=0 là chính ô đó).
+    Kinh độ quay vòng qua ±180, vĩ độ dừng ở cực.
+    """
+    lng_bits, lat_bits = _cell_bits(precision)
+    nx, ny = 1 << lng_bits, 1 << lat_bits
+    x0, y0 = _cell_xy(lat, lng, precision)
+
+    if r == 0:
+        offsets = [(0, 0)]
+    else:
+        offsets = [(dx, dy) for dx in range(-r, r + 1) for dy in (-r, r)]
+        offsets += [(dx, dy) for dy in range(-r + 1, r) for dx in (-r, r)]
+
+    cells = set()
+    for dx, dy in offsets:
+        y = y0 + dy
+        if 0 <= y < ny:
+            cells.add(_xy_hash((x0 + dx) % nx, y, precision))
+    return sorted(cells)
+
+
+def ring_search_radius_m(lat: float, lng: float, precision: int, r: int) -> float:
+    """
+    Bán kính (m) quanh điểm chắc chắn đã quét hết sau khi đọc vành 0..r:
+    khoảng cách ngắn nhất từ điểm tới biên khối (2r+1)x(2r+1) ô.
+    Mọi journal chưa đọc đều xa hơn giá trị này.
+    """
+    h, w = cell_size(precision)
+    x0, y0 = _cell_xy(lat, lng, precision)
+    south = -90.0 + (y0 - r) * h
+    north = -90.0 + (y0 + r + 1) * h
+    west = -180.0 + (x0 - r) * w
+    east = -180.0 + (x0 + r + 1) * w
+
+    d = math.inf
+    # tới vĩ tuyến: đi dọc kinh tuyến
+    if south > -90.0:
+        d = min(d, math.radians(lat - south) * EARTH_RADIUS_M)
+    if north < 90.0:
+        d = min(d, math.radians(north - lat) * EARTH_RADIUS_M)
+    # tới kinh tuyến: asin(sin Δλ · cos φ)
+    if (2 * r + 1) * w < 360.0:
+        cos_lat = math.cos(math.radians(lat))
+        for edge in (west, east):
+            dl = min(math.radians(abs(lng - edge)), math.pi / 2)
+            d = min(d, EARTH_RADIUS_M * math.asin(math.sin(dl) * cos_lat))
+    return d
+
+
+def parse_center(center_str: str) -> Tuple[float, float]:
+    """
+    Convert chuỗi "lat,lng" -> (lat, lng). Ném ValueError nếu sai.
+    """
+    parts = [p.strip() for p in center_str.split(",")]
+    if len(parts) != 2:
+        raise ValueError("center must be 'lat,lng'")
+    lat, lng = map(float, parts)
+    if not (-90 <= lat <= 90 and -180 <= lng <= 180):
+        raise ValueError("center out of range")
+    return lat, lng
+
+
+def circle_bbox(lat: float, lng: float, radius_m: float) -> Tuple[float, float, float, float]:
+    """
+    bbox bao hình tròn (lat, lng, radius_m). Chạm cực => phủ hết kinh độ;
+    không xử lý vượt ±180 (cắt tại biên).
+    """
+    ang = radius_m / EARTH_RADIUS_M
+    dlat = math.degrees(ang)
+    min_lat, max_lat = max(-90.0, lat - dlat), min(90.0, lat + dlat)
+    cos_lat = math.cos(math.radians(lat))
+    if min_lat <= -90.0 or max_lat >= 90.0 or math.sin(ang) >= cos_lat:
+        return (-180.0, min_lat, 180.0, max_lat)
+    dlng = math.degrees(math.asin(math.sin(ang) / cos_lat))
+    return (max(-180.0, lng - dlng), min_lat, min(180.0, lng + dlng), max_lat)
+
+
+def cell_may_intersect_circle(cell: str, lat: float, lng: float, radius_m: float) -> bool:
+    """
+    False chỉ khi chắc chắn ô nằm ngoài hình tròn:
+    khoảng cách tới tâm ô - bán kính ô (tâm -> góc xa nhất) > radius_m (bất đẳng thức tam giác).
+    """
+    clat, clng, dlat, dlng = geohash.decode_exactly(cell)
+    cell_radius = max(
+        haversine_m(clat, clng, clat + sy * dlat, clng + sx * dlng)
+        for sy in (-1, 1) for sx in (-1, 1)
+    )
+    return haversine_m(lat, lng, clat, clng) - cell_radius <= radius_m
+
+
+def tile_bbox(z: int, x: int, y: int) -> Tuple[float, float, float, float]:
+    """
+    bbox (minLng, minLat, maxLng, maxLat) của tile XYZ (Web Mercator, như OSM / Google).
+    Ném ValueError nếu tile ngoài phạm vi.
+    """
+    if not 0 <= z <= 22:
+        raise ValueError("tile out of range")
+    n = 1 << z
+    if not (0 <= x < n and 0 <= y < n):
+        raise ValueError("tile out of range")
+
+    def _lat(yy: int) -> float:
+        return math.degrees(math.atan(math.sinh(math.pi * (1 - 2 * yy / n))))
+
+    return (x / n * 360.0 - 180.0, _lat(y + 1), (x + 1) / n * 360.0 - 180.0, _lat(y))
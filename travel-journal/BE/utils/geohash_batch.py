@@ -0,0 +1,193 @@
+# utils/geohash_batch.py
+"""
+Geohash theo lô (NumPy) cho import / backfill / phủ viewport lớn.
+- encode_many: lượng tử hoá lat/lng thành chỉ số ô rồi xen kẽ bit (Morton) cả mảng 1 lượt.
+- decode_many / bounds: tra bảng base32 -> mã số -> tách bit -> tâm / biên ô.
+- neighbors: láng giềng 8 hướng bằng số học trên chỉ số ô (vòng kinh độ, dừng ở cực).
+Kết quả trùng pygeohash.encode / decode_exactly (precision 1..12).
+"""
+from typing import Iterable, Sequence, Tuple, Union
+
+import numpy as np
+
+MAX_PRECISION = 12
+
+_BASE32 = "0123456789bcdefghjkmnpqrstuvwxyz"
+# Bảng tra dựng sẵn: mã 0..31 -> ký tự (code point), ký tự (0..255) -> mã (-1 = không hợp lệ)
+_ENCODE_LUT = np.frombuffer(_BASE32.encode("ascii"), dtype=np.uint8).astype(np.uint32)
+_DECODE_LUT = np.full(256, -1, dtype=np.int64)
+_DECODE_LUT[_ENCODE_LUT] = np.arange(32)
+_DECODE_LUT[np.frombuffer(_BASE32.upper().encode("ascii"), dtype=np.uint8)] = np.arange(32)
+
+# Theo precision: (số bit lng, số bit lat, chiều cao ô (độ), chiều rộng ô (độ))
+_LNG_BITS = np.array([(5 * p + 1) // 2 for p in range(MAX_PRECISION + 1)])
+_LAT_BITS = np.array([(5 * p) // 2 for p in range(MAX_PRECISION + 1)])
+_CELL_H = 180.0 / (2.0 ** _LAT_BITS)
+_CELL_W = 360.0 / (2.0 ** _LNG_BITS)
+
+# Thứ tự hướng của neighbors(): (dx theo lng, dy theo lat)
+DIRECTIONS = ("n", "ne", "e", "se", "s", "sw", "w", "nw")
+_DIR_DXDY = ((0, 1), (1, 1), (1, 0), (1, -1), (0, -1), (-1, -1), (-1, 0), (-1, 1))
+
+# Hằng số "magic" xen bit 32 -> 64 bit
+_SPREAD = ((16, 0x0000FFFF0000FFFF), (8, 0x00FF00FF00FF00FF), (4, 0x0F0F0F0F0F0F0F0F),
+           (2, 0x3333333333333333), (1, 0x5555555555555555))
+_COMPACT = ((1, 0x3333333333333333), (2, 0x0F0F0F0F0F0F0F0F), (4, 0x00FF00FF00FF00FF),
+            (8, 0x0000FFFF0000FFFF), (16, 0x00000000FFFFFFFF))
+
+ArrayLike = Union[Sequence[float], np.ndarray]
+
+
+def _check_precision(precision: int) -> None:
+    if not 1 <= precision <= MAX_PRECISION:
+        raise ValueError(f"precision must be 1..{MAX_PRECISION}")
+
+
+def _spread(v: np.ndarray) -> np.ndarray:
+    """Chèn 1 bit 0 giữa các bit (uint64, tối đa 32 bit vào)."""
+    v = v.astype(np.uint64) & np.uint64(0xFFFFFFFF)
+    for shift, mask in _SPREAD:
+        v = (v | (v << np.uint64(shift))) & np.uint64(mask)
+    return v
+
+
+def _compact(v: np.ndarray) -> np.ndarray:
+    """Ngược của _spread: gom các bit ở vị trí chẵn."""
+    v = v.astype(np.uint64) & np.uint64(0x5555555555555555)
+    for shift, mask in _COMPACT:
+        v = (v | (v >> np.uint64(shift))) & np.uint64(mask)
+    return v
+
+
+def _interleave(x: np.ndarray, y: np.ndarray, precision: int) -> np.ndarray:
+    # bit đầu tiên (cao nhất) luôn là kinh độ
+    if (5 * precision) % 2:
+        return _spread(x) | (_spread(y) << np.uint64(1))
+    return (_spread(x) << np.uint64(1)) | _spread(y)
+
+
+def _deinterleave(code: np.ndarray, precision: int) -> Tuple[np.ndarray, np.ndarray]:
+    if (5 * precision) % 2:
+        return _compact(code), _compact(code >> np.uint64(1))
+    return _compact(code >> np.uint64(1)), _compact(code)
+
+
+def _codes_to_hashes(code: np.ndarray, precision: int) -> np.ndarray:
+    # ma trận (N, precision) code point UCS-4 => view thẳng thành mảng U<precision>, không copy chuỗi
+    chars = np.empty((len(code), precision), dtype=np.uint32)
+    for i in range(precision):
+        digit = (code >> np.uint64(5 * (precision - 1 - i))) & np.uint64(31)
+        chars[:, i] = _ENCODE_LUT[digit.astype(np.intp)]
+    return chars.view(f"U{precision}").ravel()
+
+
+def _hashes_to_codes(hashes: Union[Iterable[str], np.ndarray]) -> Tuple[np.ndarray, int]:
+    if isinstance(hashes, np.ndarray) and hashes.dtype.kind == "U":
+        precision = hashes.dtype.itemsize // 4
+        _check_precision(precision)
+        chars = np.ascontiguousarray(hashes).view(np.uint32).reshape(-1, precision)
+        # chuỗi ngắn hơn được NumPy đệm \0
+        if hashes.size and not chars[:, -1].all():
+            raise ValueError("geohashes must have the same length")
+    else:
+        hashes = list(hashes)
+        if not hashes:
+            return np.zeros(0, dtype=np.uint64), 0
+        precision = len(hashes[0])
+        _check_precision(precision)
+        joined = "".join(hashes)
+        if len(joined) != len(hashes) * precision or max(map(len, hashes)) != precision:
+            raise ValueError("geohashes must have the same length")
+        try:
+            buf = joined.encode("ascii")
+        except UnicodeEncodeError:
+            raise ValueError("invalid geohash character")
+        chars = np.frombuffer(buf, dtype=np.uint8).reshape(-1, precision)
+    if chars.size == 0:
+        return np.zeros(0, dtype=np.uint64), 0
+
+    digits = _DECODE_LUT[np.minimum(chars, 255)]
+    if (digits < 0).any():
+        raise ValueError("invalid geohash character")
+    digits = digits.astype(np.uint64)
+    code = np.zeros(len(chars), dtype=np.uint64)
+    for i in range(precision):
+        code = (code << np.uint64(5)) | digits[:, i]
+    return code, precision
+
+
+def cell_xy_many(lat: ArrayLike, lng: ArrayLike, precision: int) -> Tuple[np.ndarray, np.ndarray]:
+    """Chỉ số ô (x theo lng, y theo lat) của từng điểm."""
+    _check_precision(precision)
+    lat = np.asarray(lat, dtype=np.float64)
+    lng = np.asarray(lng, dtype=np.float64)
+    if not ((lat >= -90) & (lat <= 90) & (lng >= -180) & (lng <= 180)).all():
+        raise ValueError("lat/lng out of range")
+    nx = 1 << int(_LNG_BITS[precision])
+    ny = 1 << int(_LAT_BITS[precision])
+    # điểm đúng biên trên (lat=90 / lng=180) thuộc ô cuối
+    x = np.minimum(np.floor((lng + 180.0) / 360.0 * nx), nx - 1).astype(np.uint64)
+    y = np.minimum(np.floor((lat + 90.0) / 180.0 * ny), ny - 1).astype(np.uint64)
+    return x, y
+
+
+def xy_to_hashes(x: np.ndarray, y: np.ndarray, precision: int) -> np.ndarray:
+    """Chỉ số ô -> mảng geohash (dtype U<precision>)."""
+    _check_precision(precision)
+    x = np.asarray(x, dtype=np.uint64).ravel()
+    y = np.asarray(y, dtype=np.uint64).ravel()
+    return _codes_to_hashes(_interleave(x, y, precision), precision)
+
+
+def encode_many(lat: ArrayLike, lng: ArrayLike, precision: int = 9) -> np.ndarray:
+    """Mảng lat / lng -> mảng geohash (dtype U<precision>). Ném ValueError nếu toạ độ ngoài phạm vi."""
+    x, y = cell_xy_many(lat, lng, precision)
+    return _codes_to_hashes(_interleave(x.ravel(), y.ravel(), precision), precision)
+
+
+def decode_xy_many(hashes: Union[Iterable[str], np.ndarray]) -> Tuple[np.ndarray, np.ndarray, int]:
+    """Mảng geohash (cùng độ dài) -> (x, y, precision)."""
+    code, precision = _hashes_to_codes(hashes)
+    if not precision:
+        empty = np.zeros(0, dtype=np.uint64)
+        return empty, empty, 0
+    x, y = _deinterleave(code, precision)
+    return x, y, precision
+
+
+def bounds(hashes: Union[Iterable[str], np.ndarray]) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+    """Biên ô: (min_lat, min_lng, max_lat, max_lng), mỗi phần là 1 mảng float64."""
+    x, y, precision = decode_xy_many(hashes)
+    h, w = _CELL_H[precision], _CELL_W[precision]
+    min_lat = y.astype(np.float64) * h - 90.0
+    min_lng = x.astype(np.float64) * w - 180.0
+    return min_lat, min_lng, min_lat + h, min_lng + w
+
+
+def decode_many(hashes: Union[Iterable[str], np.ndarray]) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Tâm ô + nửa kích thước, giống pygeohash.decode_exactly theo mảng:
+    (lat, lng, lat_err, lng_err).
+    """
+    min_lat, min_lng, max_lat, max_lng = bounds(hashes)
+    lat_err = (max_lat - min_lat) / 2
+    lng_err = (max_lng - min_lng) / 2
+    return min_lat + lat_err, min_lng + lng_err, lat_err, lng_err
+
+
+def neighbors(hashes: Union[Iterable[str], np.ndarray]) -> np.ndarray:
+    """
+    Láng giềng 8 hướng (thứ tự DIRECTIONS) của từng geohash: mảng (N, 8).
+    Kinh độ vòng qua ±180; vượt cực => "".
+    """
+    x, y, precision = decode_xy_many(hashes)
+    if not precision:
+        return np.zeros((0, len(DIRECTIONS)), dtype="U1")
+    nx = 1 << int(_LNG_BITS[precision])
+    ny = 1 << int(_LAT_BITS[precision])
+    xi = x.astype(np.int64)[:, None] + np.array([d[0] for d in _DIR_DXDY])[None, :]
+    yi = y.astype(np.int64)[:, None] + np.array([d[1] for d in _DIR_DXDY])[None, :]
+    valid = (yi >= 0) & (yi < ny)
+    out = xy_to_hashes(xi % nx, np.clip(yi, 0, ny - 1), precision).reshape(xi.shape)
+    out[~valid] = ""
+    return out
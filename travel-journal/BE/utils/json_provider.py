@@ -0,0 +1,115 @@
+# utils/json_provider.py
+"""
+JSON provider cho Flask app (app.json): encode thẳng ra bytes UTF-8.
+- Encoder cắm được qua JSON_ENCODER: "auto" (orjson nếu cài, không thì json chuẩn) | "orjson" | "std".
+  orjson không encode được giá trị nào đó (int > 64 bit, ...) => rơi về json chuẩn cho lần đó.
+- Không escape ký tự ngoài ASCII (ngữ nghĩa JSON_AS_ASCII=False, Flask 3 bỏ config này),
+  Content-Type có sẵn "; charset=utf-8" => force_utf8 không phải sửa header.
+- stream(): mảng lớn encode dần theo lô STREAM_BATCH phần tử (1 lần dumps / lô), mỗi lô là 1 chunk
+  (bộ nhớ không giữ cả body đã encode). encode= thay encoder của lô (vd. Model.to_json_many).
+Giữ ngữ nghĩa DefaultJSONProvider: sort_keys, compact / indent khi debug, default()
+(date -> HTTP date, Decimal / UUID -> str, dataclass -> dict).
+"""
+import logging
+import os
+from itertools import islice
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Union
+
+from flask import stream_with_context
+from flask.json.provider import DefaultJSONProvider
+
+try:
+    import orjson
+except ImportError:  # encoder tuỳ chọn
+    orjson = None
+
+logger = logging.getLogger(__name__)
+
+JSON_ENCODER = os.getenv("JSON_ENCODER", "auto")
+CONTENT_TYPE = "application/json; charset=utf-8"
+# Số phần tử / lô khi stream mảng
+STREAM_BATCH = 200
+
+
+class FastJSONProvider(DefaultJSONProvider):
+    ensure_ascii = False
+
+    def __init__(self, app, encoder: str = JSON_ENCODER):
+        super().__init__(app)
+        if encoder not in ("auto", "orjson", "std"):
+            raise ValueError(f"unknown JSON encoder: {encoder}")
+        if encoder == "orjson" and orjson is None:
+            raise ValueError("JSON_ENCODER=orjson but orjson is not installed")
+        self.use_orjson = orjson is not None and encoder != "std"
+
+    def _pretty(self) -> bool:
+        return self.compact is False or (self.compact is None and self._app.debug)
+
+    def dumps_bytes(self, obj: Any, pretty: bool = False) -> bytes:
+        """obj -> JSON bytes UTF-8 (không qua str trung gian khi có orjson)."""
+        if self.use_orjson:
+            option = orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_PASSTHROUGH_DATACLASS
+            if self.sort_keys:
+                option |= orjson.OPT_SORT_KEYS
+            if pretty:
+                option |= orjson.OPT_INDENT_2
+            try:
+                return orjson.dumps(obj, default=self.default, option=option)
+            except TypeError:
+                # orjson.JSONEncodeError: kiểu / giá trị orjson không hỗ trợ => json chuẩn
+                pass
+        return self.dumps(obj, **({"indent": 2} if pretty else {"separators": (",", ":")})).encode("utf-8")
+
+    def response(self, *args: Any, **kwargs: Any):
+        obj = self._prepare_response_obj(args, kwargs)
+        return self._app.response_class(self.dumps_bytes(obj, self._pretty()) + b"\n", content_type=CONTENT_TYPE)
+
+    def stream(
+        self,
+        items: Iterable[Any],
+        key: Optional[str] = None,
+        extra: Union[None, Dict[str, Any], Callable[[], Dict[str, Any]]] = None,
+        status: int = 200,
+        encode: Optional[Callable[[List[Any]], bytes]] = None,
+    ):
+        """
+        Response stream mảng JSON: key=None => [item, ...]; key="items" => {"items": [...], **extra}.
+        extra là callable => gọi sau khi duyệt hết items (vd. lastKey của generator).
+        encode: lô phần tử -> bytes mảng JSON (mặc định dumps_bytes).
+        Lỗi giữa chừng (header đã gửi) => log và cắt body (client nhận JSON hỏng thay vì thiếu im lặng).
+        """
+        if key is None and extra is not None:
+            raise ValueError("extra requires key")
+        return self._app.response_class(
+            stream_with_context(self._iter_chunks(items, key, extra, encode or self.dumps_bytes)),
+            status=status,
+            content_type=CONTENT_TYPE,
+        )
+
+    def _iter_chunks(self, items, key, extra, encode) -> Iterator[bytes]:
+        buf = [b"[" if key is None else b"{" + self.dumps_bytes(key) + b":["]
+        it = iter(items)
+        first = True
+        try:
+            while True:
+                batch = list(islice(it, STREAM_BATCH))
+                if not batch:
+                    break
+                # "[a,b,...]" của lô => bỏ 2 ngoặc, nối bằng ","
+                part = encode(batch)[1:-1]
+                buf.append(part if first else b"," + part)
+                first = False
+                yield b"".join(buf)
+                buf = []
+            buf.append(b"]")
+            if key is not None:
+                tail = extra() if callable(extra) else (extra or {})
+                for k, v in tail.items():
+                    buf.append(b"," + self.dumps_bytes(k) + b":" + self.dumps_bytes(v))
+                buf.append(b"}")
+        except Exception:
+            logger.exception("Unhandled JSON stream error")
+            yield b"".join(buf)
+            return
+        buf.append(b"\n")
+        yield b"".join(buf)
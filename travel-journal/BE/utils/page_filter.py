@@ -0,0 +1,100 @@
+# utils/page_filter.py
+"""
+Lọc 1 trang Query (<= 200 item DDB) theo lô cho list_by_bbox.
+- Tách trang thành cột (lat, lng) bằng NumPy, áp bbox bằng 1 phép mask.
+- Truy vấn bán kính: haversine cả cột 1 lượt, gắn distance_m vào record.
+- De-dup + lọc q (mọi token của q có trong title / location_name, đã bỏ dấu) chỉ chạy trên item đã qua bbox.
+- Item là projection marker phẳng (lat, lng, location_name, cover_photo — utils.geo.marker_fields);
+  record trả về dựng lại location {lat, lng, [name]} và đã chuẩn hoá (Decimal -> float)
+  => không cần _from_dynamo đệ quy sau đó.
+"""
+from typing import AbstractSet, Any, Dict, List, Optional, Sequence, Set, Tuple
+
+import numpy as np
+
+from utils.geo import EARTH_RADIUS_M
+from utils.text import has_tokens
+
+_NAN = float("nan")
+
+
+def _num(v: Any) -> float:
+    try:
+        return float(v)
+    except (TypeError, ValueError):
+        return _NAN
+
+
+def page_columns(batch: Sequence[Dict[str, Any]]) -> Tuple[np.ndarray, np.ndarray]:
+    """Cột lat / lng (float64, NaN nếu thiếu / sai kiểu) của 1 trang."""
+    try:
+        # đường nhanh: cả trang hợp lệ => 2 list comprehension, không gọi hàm / try theo item
+        lat = [float(it["lat"]) for it in batch]
+        lng = [float(it["lng"]) for it in batch]
+    except (KeyError, TypeError, ValueError):
+        lat = [_num(it.get("lat")) for it in batch]
+        lng = [_num(it.get("lng")) for it in batch]
+    return np.array(lat, dtype=np.float64), np.array(lng, dtype=np.float64)
+
+
+def haversine_m_np(lat0: float, lng0: float, lat: np.ndarray, lng: np.ndarray) -> np.ndarray:
+    """Khoảng cách (m) từ 1 điểm tới cả cột toạ độ."""
+    p0 = np.radians(lat0)
+    p = np.radians(lat)
+    a = (np.sin((p - p0) / 2) ** 2
+         + np.cos(p0) * np.cos(p) * np.sin(np.radians(lng - lng0) / 2) ** 2)
+    return 2 * EARTH_RADIUS_M * np.arcsin(np.minimum(1.0, np.sqrt(a)))
+
+
+def filter_page(
+    batch: Sequence[Dict[str, Any]],
+    bbox: Tuple[float, float, float, float],
+    qtokens: AbstractSet[str] = frozenset(),
+    seen: Optional[Set[str]] = None,
+    circle: Optional[Tuple[float, float, float]] = None,
+) -> Tuple[List[int], List[Dict[str, Any]]]:
+    """
+    Lọc trang theo bbox (+ circle=(lat, lng, radius_m) nếu có) + token q (utils.text.has_tokens),
+    de-dup theo journalId (cập nhật `seen`).
+    Trả về (vị trí trong batch, record JSON-ready) của các item được giữ, theo thứ tự trang.
+    Với circle, record có thêm distance_m.
+    """
+    if not batch:
+        return [], []
+    seen = set() if seen is None else seen
+    min_lng, min_lat, max_lng, max_lat = bbox
+
+    lat, lng = page_columns(batch)
+    # NaN so sánh luôn False => item thiếu toạ độ tự bị loại
+    mask = (lat >= min_lat) & (lat <= max_lat) & (lng >= min_lng) & (lng <= max_lng)
+    dist = None
+    if circle is not None:
+        dist = haversine_m_np(circle[0], circle[1], lat, lng)
+        mask &= dist <= circle[2]
+    idx = np.flatnonzero(mask)
+
+    lat_l = lat[idx].tolist()
+    lng_l = lng[idx].tolist()
+    dist_l = dist[idx].tolist() if dist is not None else None
+    positions: List[int] = []
+    records: List[Dict[str, Any]] = []
+    for n, (i, la, ln) in enumerate(zip(idx.tolist(), lat_l, lng_l)):
+        it = batch[i]
+        jid = it.get("journalId")
+        if not jid or jid in seen:
+            continue
+        name = it.get("location_name")
+        if qtokens and not has_tokens(qtokens, it.get("title"), name):
+            continue
+
+        seen.add(jid)
+        # số chỉ có lat / lng (projection marker) => copy nông, gom lại thành location
+        rec = dict(it)
+        del rec["lat"], rec["lng"]
+        rec.pop("location_name", None)
+        rec["location"] = {"name": name, "lat": la, "lng": ln} if name else {"lat": la, "lng": ln}
+        if dist_l is not None:
+            rec["distance_m"] = round(dist_l[n], 1)
+        positions.append(i)
+        records.append(rec)
+    return positions, records
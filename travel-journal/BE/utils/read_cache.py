@@ -0,0 +1,167 @@
+# utils/read_cache.py
+"""
+Cache read-through cho item đọc nhiều / ghi ít (JournalService.get).
+- Backend cắm được: LocalBackend (LRU in-process, theo container warm) hoặc RedisBackend
+  (Redis / server nói giao thức Redis, dùng chung giữa các container; import `redis` lười).
+  LocalBackend: invalidate chỉ có hiệu lực trong container vừa ghi, container khác giữ bản cũ
+  tới hết TTL => nhiều container (Lambda) chỉ nên dùng Redis, hoặc local với TTL vài giây.
+- Chống stampede: nhiều thread cùng miss 1 key => chỉ 1 thread gọi loader, các thread khác đợi
+  kết quả đó (singleflight trong process).
+- invalidate() trong lúc loader đang chạy => kết quả đó (đọc trước khi ghi) không được lưu vào cache.
+- Giá trị None (không tồn tại) cũng được cache (item mới luôn có id mới nên không bị che).
+"""
+import json
+import logging
+import threading
+from typing import Any, Callable, Dict, Hashable, Optional
+
+from utils.cache import LRUCache
+
+logger = logging.getLogger(__name__)
+
+_MISSING = object()
+# đánh dấu "không tồn tại" khi lưu (phân biệt với cache miss)
+_NONE = {"__none__": True}
+
+
+class LocalBackend:
+    """LRU in-process (utils.cache.LRUCache)."""
+
+    def __init__(self, max_bytes: int, ttl_seconds: float):
+        self.lru = LRUCache(max_bytes=max_bytes, ttl_seconds=ttl_seconds)
+
+    def get(self, key: str) -> Any:
+        return self.lru.get(key, _MISSING)
+
+    def set(self, key: str, value: Any) -> None:
+        self.lru.set(key, value)
+
+    def delete(self, key: str) -> None:
+        self.lru.delete(key)
+
+    def stats(self) -> Dict[str, Any]:
+        return {"backend": "local", **self.lru.stats()}
+
+
+class RedisBackend:
+    """
+    Redis (GET / SET EX / DEL), giá trị là JSON. Lỗi kết nối => coi như miss / bỏ qua ghi
+    (cache không được làm hỏng đường đọc chính).
+    """
+
+    def __init__(self, url: str, ttl_seconds: float, prefix: str = "journal:", client=None):
+        if client is None:
+            import redis  # chỉ cần khi dùng backend này
+
+            client = redis.Redis.from_url(url, socket_timeout=0.2, socket_connect_timeout=0.2)
+        self.client = client
+        self.ttl = max(1, int(ttl_seconds))
+        self.prefix = prefix
+        self.hits = self.misses = self.errors = 0
+
+    def get(self, key: str) -> Any:
+        try:
+            raw = self.client.get(self.prefix + key)
+        except Exception:
+            self.errors += 1
+            logger.warning("Redis GET failed for %s", key, exc_info=True)
+            return _MISSING
+        if raw is None:
+            self.misses += 1
+            return _MISSING
+        self.hits += 1
+        return json.loads(raw)
+
+    def set(self, key: str, value: Any) -> None:
+        try:
+            self.client.set(self.prefix + key, json.dumps(value, ensure_ascii=False), ex=self.ttl)
+        except Exception:
+            self.errors += 1
+            logger.warning("Redis SET failed for %s", key, exc_info=True)
+
+    def delete(self, key: str) -> None:
+        try:
+            self.client.delete(self.prefix + key)
+        except Exception:
+            # không xoá được => entry cũ sống tối đa ttl giây
+            self.errors += 1
+            logger.warning("Redis DEL failed for %s", key, exc_info=True)
+
+    def stats(self) -> Dict[str, Any]:
+        return {"backend": "redis", "hits": self.hits, "misses": self.misses, "errors": self.errors}
+
+
+class _Flight:
+    __slots__ = ("done", "value", "error", "stale")
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.value: Any = None
+        self.error: Optional[BaseException] = None
+        self.stale = False
+
+
+class ReadThroughCache:
+    def __init__(self, backend):
+        self.backend = backend
+        self._lock = threading.Lock()
+        self._flights: Dict[Hashable, _Flight] = {}
+        self.loads = self.coalesced = 0
+
+    def get_or_load(self, key: str, loader: Callable[[str], Any]) -> Any:
+        """Giá trị của key; miss => loader(key) (1 lần cho mọi thread đang đợi cùng key)."""
+        value = self.backend.get(key)
+        if value is not _MISSING:
+            return None if value == _NONE else value
+
+        with self._lock:
+            flight = self._flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._flights[key] = _Flight()
+            else:
+                self.coalesced += 1
+        if not leader:
+            flight.done.wait()
+            if flight.error is not None:
+                raise flight.error
+            return flight.value
+
+        try:
+            self.loads += 1
+            flight.value = loader(key)
+            if not flight.stale:
+                self.backend.set(key, _NONE if flight.value is None else flight.value)
+                # invalidate chen vào giữa lúc kiểm tra và lúc ghi => xoá lại
+                if flight.stale:
+                    self.backend.delete(key)
+            return flight.value
+        except BaseException as e:
+            flight.error = e
+            raise
+        finally:
+            with self._lock:
+                self._flights.pop(key, None)
+            flight.done.set()
+
+    def invalidate(self, key: str) -> None:
+        with self._lock:
+            # bỏ cả kết quả loader đang chạy (đã đọc dữ liệu trước khi ghi)
+            flight = self._flights.get(key)
+            if flight is not None:
+                flight.stale = True
+        self.backend.delete(key)
+
+    def stats(self) -> Dict[str, Any]:
+        return {**self.backend.stats(), "loads": self.loads, "coalesced": self.coalesced}
+
+
+def make_backend(kind: str, url: str, max_bytes: int, ttl_seconds: float):
+    """kind: "local" | "redis" | "off" (None = không cache)."""
+    if kind == "off":
+        return None
+    if kind == "redis":
+        return RedisBackend(url, ttl_seconds)
+    if kind == "local":
+        return LocalBackend(max_bytes, ttl_seconds)
+    raise ValueError(f"unknown cache backend: {kind}")
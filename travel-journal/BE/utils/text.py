@@ -0,0 +1,83 @@
+# utils/text.py
+"""
+Chuẩn hoá văn bản cho tìm kiếm:
+- fold: bỏ dấu tiếng Việt (NFD + bỏ dấu kết hợp, đ -> d) + lowercase => "Đà Lạt" ~ "da lat"
+- tokenize: tách từ (chữ / số) sau khi fold, bỏ trùng, giới hạn số token / văn bản
+- index token và lọc trang dùng cùng tập token (doc_words) => 2 đường tìm kiếm cho cùng kết quả
+"""
+import re
+import unicodedata
+from functools import lru_cache
+from typing import AbstractSet, FrozenSet, List, Optional
+
+# Token ngắn hơn MIN_TOKEN_LEN không được index (partition quá nóng, ít giá trị tìm kiếm)
+MIN_TOKEN_LEN = 2
+# Số token tối đa index cho 1 journal (và tối đa / câu truy vấn q)
+MAX_TOKENS = 32
+
+_MARKS = re.compile("[\u0300-\u036f]")
+_TOKEN = re.compile(r"[a-z0-9]+")
+
+
+def _fold_table() -> str:
+    # bảng tra theo code point (str.translate): chữ Latin có dấu dựng sẵn (gồm toàn bộ chữ
+    # tiếng Việt) -> chữ gốc; code point ngoài bảng giữ nguyên
+    table = [chr(cp) for cp in range(0x1F00)]
+    for cp in list(range(0x00C0, 0x0250)) + list(range(0x1E00, 0x1F00)):
+        base = _MARKS.sub("", unicodedata.normalize("NFD", chr(cp)))
+        if base != chr(cp) and base.isascii():
+            table[cp] = base
+    table[ord("đ")] = table[ord("Đ")] = "d"
+    return "".join(table)
+
+
+_FOLD = _fold_table()
+
+
+def fold(s: Optional[str]) -> str:
+    """Bỏ dấu + lowercase."""
+    if not s:
+        return ""
+    # translate cho chữ dựng sẵn (NFC), regex cho dấu kết hợp rời (chuỗi NFD)
+    return _MARKS.sub("", s.translate(_FOLD)).lower()
+
+
+def tokenize(*parts: Optional[str]) -> List[str]:
+    """Token (đã fold) của các đoạn văn bản, theo thứ tự xuất hiện, không trùng."""
+    toks = _TOKEN.findall(fold(" ".join(p for p in parts if p)))
+    return list(dict.fromkeys(t for t in toks if len(t) >= MIN_TOKEN_LEN))[:MAX_TOKENS]
+
+
+def terms(*parts: Optional[str]) -> List[str]:
+    """Mọi token (đã fold, giữ lặp, không giới hạn số lượng) — dùng cho tần suất term (BM25)."""
+    return [t for t in _TOKEN.findall(fold(" ".join(p for p in parts if p))) if len(t) >= MIN_TOKEN_LEN]
+
+
+_NO_WORDS: FrozenSet[str] = frozenset()
+
+
+def query_tokens(q: Optional[str]) -> FrozenSet[str]:
+    """
+    Token của tham số q. q trống => tập rỗng (không lọc);
+    q có ký tự nhưng không ra token nào (vd. "a", "!") => ValueError.
+    """
+    if not q or not q.strip():
+        return _NO_WORDS
+    toks = tokenize(q)
+    if not toks:
+        raise ValueError(f"q must contain a word of at least {MIN_TOKEN_LEN} letters or digits")
+    return frozenset(toks)
+
+
+@lru_cache(maxsize=16384)
+def doc_words(title: Optional[str], name: Optional[str] = None) -> FrozenSet[str]:
+    """
+    Tập token được index của journal (= tokenize(title, name), cùng giới hạn MAX_TOKENS);
+    cache vì title / tên địa điểm lặp lại giữa các trang / request.
+    """
+    return frozenset(tokenize(title, name))
+
+
+def has_tokens(qtokens: AbstractSet[str], title: Optional[str], name: Optional[str] = None) -> bool:
+    """Mọi token của qtokens nằm trong doc_words(title, name) (khớp đúng index token)."""
+    return qtokens <= doc_words(title, name)